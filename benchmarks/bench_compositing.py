@@ -0,0 +1,110 @@
+"""
+Micro-benchmark dos recortes de src/utils/images.py: tempo por chamada e
+alocações, comparando a implementação anterior (máscara desenhada com
+ImageDraw a cada chamada, cópias e colagens intermediárias) com a atual
+(máscaras anti-aliased cacheadas e uma única colagem sobre o fundo branco).
+
+    python -m benchmarks.bench_compositing [--repeat 200] [--size 2000x1500]
+
+Alocações: `pil_images` conta imagens criadas pelo Pillow (Image.core.get_stats)
+e `py_peak_kb` é o pico de memória rastreado pelo tracemalloc (inclui NumPy).
+"""
+from PIL import Image, ImageDraw
+from typing import Callable, Dict, Tuple
+from src.utils.images import (
+    crop_round_portrait_composed,
+    crop_to_round_centered_on_face,
+    crop_to_square_centered_on_face,
+    square_crop_box,
+    portrait_crop_box,
+)
+import argparse
+import numpy as np
+import time
+import tracemalloc
+
+
+# Implementação anterior, mantida aqui apenas como referência de comparação
+def legacy_square(pil_image, face_coords, vertical_bias=0.35, radius_scale=1.5, output_size=(512, 512)):
+    cropped_image = pil_image.crop(square_crop_box(face_coords, vertical_bias=vertical_bias, radius_scale=radius_scale))
+    if cropped_image.size != output_size:
+        cropped_image = cropped_image.resize(output_size, Image.Resampling.LANCZOS)
+    if cropped_image.mode != "RGB":
+        if cropped_image.mode == "RGBA":
+            rgb_image = Image.new("RGB", cropped_image.size, (255, 255, 255))
+            rgb_image.paste(cropped_image, mask=cropped_image.split()[3])
+            return rgb_image
+        return cropped_image.convert("RGB")
+    return cropped_image
+
+
+def legacy_round(pil_image, face_coords, radius_scale=1.5, vertical_bias=0.35, output_size=(512, 512)):
+    cropped_square = legacy_square(pil_image, face_coords, vertical_bias=vertical_bias, radius_scale=radius_scale, output_size=output_size)
+    mask = Image.new("L", output_size, 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, output_size[0], output_size[1]), fill=255)
+    final_image = Image.new("RGB", output_size, (255, 255, 255))
+    final_image.paste(cropped_square, (0, 0), mask)
+    return final_image
+
+
+def legacy_portrait(pil_image, face_coords, radius_scale=1.8, vertical_bias=0.25, extra_margin_ratio=0.30):
+    cropped = pil_image.crop(portrait_crop_box(face_coords, pil_image.size, radius_scale, vertical_bias, extra_margin_ratio))
+    mask = Image.new("L", cropped.size, 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, cropped.size[0], cropped.size[1]), fill=255)
+    result = cropped.copy()
+    result.putalpha(mask)
+    return result
+
+
+def _sample_images(size: Tuple[int, int]) -> Dict[str, Image.Image]:
+    rng = np.random.default_rng(0)
+    rgb = Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8), "RGB")
+    # Recorte sem fundo: alfa suave, como o de remove_bg
+    alpha = Image.radial_gradient("L").resize(size).point(lambda v: 255 - v)
+    rgba = rgb.copy()
+    rgba.putalpha(alpha)
+    return {"rgb": rgb, "rgba": rgba}
+
+
+def measure(fn: Callable, *args, repeat: int) -> Dict[str, float]:
+    fn(*args)  # aquece caches (máscaras, imports)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    per_call_ms = (time.perf_counter() - started) / repeat * 1000
+
+    before = Image.core.get_stats()["new_count"]
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ms": per_call_ms, "pil_images": Image.core.get_stats()["new_count"] - before, "py_peak_kb": peak / 1024}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--size", default="2000x1500", help="tamanho da imagem de entrada (LxA)")
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    images = _sample_images(size)
+    face = (size[0] // 2 - 150, size[1] // 3, 300, 360)
+
+    cases = [
+        ("square", legacy_square, crop_to_square_centered_on_face),
+        ("round", legacy_round, crop_to_round_centered_on_face),
+        ("portrait", legacy_portrait, crop_round_portrait_composed),
+    ]
+    print(f"{'caso':<16}{'antes ms':>10}{'depois ms':>11}{'PIL antes':>11}{'PIL depois':>12}{'py KB antes':>13}{'py KB depois':>14}")
+    for mode, image in images.items():
+        for name, before_fn, after_fn in cases:
+            before = measure(before_fn, image, face, repeat=args.repeat)
+            after = measure(after_fn, image, face, repeat=args.repeat)
+            print(
+                f"{name + '/' + mode:<16}{before['ms']:>10.3f}{after['ms']:>11.3f}"
+                f"{before['pil_images']:>11}{after['pil_images']:>12}{before['py_peak_kb']:>13.1f}{after['py_peak_kb']:>14.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
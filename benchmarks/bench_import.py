@@ -0,0 +1,127 @@
+"""
+Custo de inicialização da aplicação: tempo de importação por pacote (via
+`python -X importtime`) e tempo até a primeira resposta de /health/live e de
+/health/ready, cada execução em um processo Python novo.
+
+    python -m benchmarks.bench_import [--module src.main] [--repeat 5] [--top 15]
+        [--output inicio.json] [--compare base.json] [--fail-on-regression]
+
+O tempo de cada pacote é a soma do tempo próprio (`self`) dos seus módulos, então
+um pacote importado por outro aparece separado dele. A inicialização sobe a
+aplicação com o `TestClient` do Starlette, que executa o lifespan como o uvicorn.
+"""
+from typing import Dict, List, Tuple
+from benchmarks.results import compare_results, print_comparison, run_metadata, save_results, summarize
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+from {module} import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    assert client.get("/health/live").status_code == 200
+    live = time.perf_counter()
+    ready = None
+    while ready is None and time.perf_counter() - started < 300:
+        if client.get("/health/ready").status_code == 200:
+            ready = time.perf_counter()
+print(json.dumps({{
+    "import": (imported - started) * 1000,
+    "first_live": (live - started) * 1000,
+    "first_ready": (ready - started) * 1000 if ready else None,
+}}))
+"""
+
+
+def _run_python(args: List[str]) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+def parse_importtime(stderr: str, module: str) -> Tuple[float, Dict[str, float]]:
+    """Tempo cumulativo de `module` e tempo próprio por pacote de topo, em ms."""
+    total = 0.0
+    packages: Dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|", 2))
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1000
+        if name == module:
+            total = int(cumulative_us) / 1000
+    return total, packages
+
+
+def bench_import(module: str, repeat: int) -> Tuple[List[float], Dict[str, List[float]]]:
+    totals: List[float] = []
+    packages: Dict[str, List[float]] = {}
+    for _ in range(repeat):
+        result = _run_python(["-X", "importtime", "-c", f"import {module}"])
+        total, by_package = parse_importtime(result.stderr, module)
+        totals.append(total)
+        for package, ms in by_package.items():
+            packages.setdefault(package, []).append(ms)
+    return totals, packages
+
+
+def bench_startup(module: str, repeat: int) -> Dict[str, List[float]]:
+    samples: Dict[str, List[float]] = {"import": [], "first_live": [], "first_ready": []}
+    for _ in range(repeat):
+        result = _run_python(["-c", _STARTUP_SCRIPT.format(module=module)])
+        for name, ms in json.loads(result.stdout.strip().splitlines()[-1]).items():
+            if ms is not None:
+                samples[name].append(ms)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="src.main", help="módulo com a aplicação FastAPI (`app`)")
+    parser.add_argument("--repeat", type=int, default=5, help="processos por medição")
+    parser.add_argument("--top", type=int, default=15, help="pacotes mais lentos exibidos")
+    parser.add_argument("--output", default=None, help="grava os resultados (JSON) neste arquivo")
+    parser.add_argument("--compare", default=None, help="resultados anteriores (JSON) para comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="piora relativa do p50 considerada regressão")
+    parser.add_argument("--fail-on-regression", action="store_true", help="sai com código 1 se houver regressão")
+    args = parser.parse_args()
+
+    totals, packages = bench_import(args.module, args.repeat)
+    package_stats = {package: summarize(samples) for package, samples in packages.items()}
+    ranked = sorted(package_stats.items(), key=lambda item: item[1]["p50_ms"], reverse=True)
+    print(f"{'pacote':<32}{'p50 (ms)':>12}")
+    for package, stats in ranked[:args.top]:
+        print(f"{package:<32}{stats['p50_ms']:>12.1f}")
+    print(f"{'import ' + args.module:<32}{summarize(totals)['p50_ms']:>12.1f}")
+
+    startup = {name: summarize(samples) for name, samples in bench_startup(args.module, args.repeat).items() if samples}
+    for name, stats in startup.items():
+        print(f"{name:<32}{stats['p50_ms']:>12.1f} (p95 {stats['p95_ms']:.1f})")
+
+    report = {
+        "meta": run_metadata(benchmark="import", module=args.module, repeat=args.repeat),
+        "results": {
+            "startup": {"import_total": summarize(totals), **startup},
+            "packages": dict(ranked[:args.top]),
+        },
+    }
+    if args.output:
+        save_results(args.output, report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            rows = compare_results(json.load(f), report, threshold=args.threshold)
+        print_comparison(rows)
+        if args.fail_on_regression and any(row["regression"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Gerador de carga para os endpoints de upload: N clientes concorrentes enviando
+a mesma imagem, com vazão (req/s) e latência p50/p95/p99 por endpoint.
+
+    python -m benchmarks.bench_load [--endpoint /api/v1/crop-round/ ...] [--concurrency 8]
+        [--requests 200 | --duration 30] [--image foto.jpg] [--url http://localhost:8000]
+        [--real-models] [--cache] [--output carga.json] [--compare base.json]
+
+Sem `--url`, a aplicação roda no próprio processo (transporte ASGI do httpx, sem
+rede) com o modelo mínimo de `benchmarks/stand_in.py` no lugar dos modelos do
+rembg (`--real-models` usa os reais) e com os caches de resultado e de máscara
+desligados (`--cache` os mantém), para que toda requisição faça o trabalho completo.
+"""
+from typing import Any, Dict, List, Optional
+from benchmarks.bench_stages import sample_jpeg
+from benchmarks.results import compare_results, print_comparison, run_metadata, save_results, summarize
+import argparse
+import asyncio
+import httpx
+import json
+import sys
+import time
+
+
+async def run_scenario(client: httpx.AsyncClient, endpoint: str, image: bytes, concurrency: int, requests: Optional[int], duration: Optional[float]) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    sent = 0
+    started = time.perf_counter()
+    deadline = started + duration if duration else None
+
+    def next_request() -> bool:
+        nonlocal sent
+        if deadline is not None:
+            return time.perf_counter() < deadline
+        if sent >= requests:
+            return False
+        sent += 1
+        return True
+
+    async def worker() -> None:
+        while next_request():
+            request_started = time.perf_counter()
+            try:
+                response = await client.post(endpoint, files={"file": ("bench.jpg", image, "image/jpeg")})
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - request_started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ok = statuses.get("200", 0)
+    return {
+        **summarize(latencies),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+        "ok": ok,
+        "errors": len(latencies) - ok,
+        "status_counts": statuses,
+    }
+
+
+def _local_client(real_models: bool, keep_cache: bool) -> httpx.AsyncClient:
+    from src.main import app
+    if not real_models:
+        from benchmarks.stand_in import use_stand_in_model
+        use_stand_in_model()
+    if not keep_cache:
+        from src.services.background import mask_cache
+        from src.services.cache import result_cache
+        result_cache.enabled = False
+        mask_cache.enabled = False
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120)
+
+
+async def run(args: argparse.Namespace, image: bytes) -> Dict[str, Dict[str, Any]]:
+    if args.url:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=120)
+    else:
+        client = _local_client(args.real_models, args.cache)
+    results = {}
+    async with client:
+        for endpoint in args.endpoint:
+            # Uma requisição de aquecimento carrega modelos e detectores antes da medição
+            await client.post(endpoint, files={"file": ("bench.jpg", image, "image/jpeg")})
+            result = await run_scenario(client, endpoint, image, args.concurrency, args.requests, args.duration)
+            results[endpoint] = result
+            print(
+                f"{endpoint:<40}{result['requests_per_second']:>8.2f} req/s  p50 {result['p50_ms']:.1f} ms  "
+                f"p95 {result['p95_ms']:.1f} ms  p99 {result['p99_ms']:.1f} ms  erros {result['errors']} {result['status_counts']}",
+                flush=True,
+            )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", action="append", default=None, help="endpoint de upload (pode repetir)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="requisições por endpoint")
+    parser.add_argument("--duration", type=float, default=None, help="segundos por endpoint (substitui --requests)")
+    parser.add_argument("--image", default=None, help="imagem enviada (padrão: JPEG sintético 1280x960)")
+    parser.add_argument("--url", default=None, help="servidor já em execução (padrão: aplicação no próprio processo)")
+    parser.add_argument("--real-models", action="store_true", help="usa os modelos reais do rembg na aplicação local")
+    parser.add_argument("--cache", action="store_true", help="mantém os caches de resultado e de máscara ligados")
+    parser.add_argument("--output", default=None, help="grava os resultados (JSON) neste arquivo")
+    parser.add_argument("--compare", default=None, help="resultados anteriores (JSON) para comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="piora relativa do p50 considerada regressão")
+    parser.add_argument("--fail-on-regression", action="store_true", help="sai com código 1 se houver regressão")
+    args = parser.parse_args()
+    args.endpoint = args.endpoint or ["/api/v1/crop-round/"]
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image = f.read()
+    else:
+        image = sample_jpeg((1280, 960))
+    results = asyncio.run(run(args, image))
+    report = {
+        "meta": run_metadata(
+            benchmark="load",
+            target=args.url or "in-process",
+            models="real" if args.real_models or args.url else "stand-in",
+            concurrency=args.concurrency,
+            requests=args.requests,
+            duration=args.duration,
+            image=args.image,
+        ),
+        "results": {"load": results},
+    }
+    if args.output:
+        save_results(args.output, report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            rows = compare_results(json.load(f), report, threshold=args.threshold)
+        print_comparison(rows)
+        if args.fail_on_regression and any(row["regression"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Custo de um `logger.info` para quem emite o log: handlers síncronos no root
+logger (configuração anterior) contra a fila de `src/core/logging.py`, em texto,
+JSON e com amostragem, com várias threads emitindo ao mesmo tempo.
+
+    python -m benchmarks.bench_logging [--records 20000] [--threads 4]
+        [--output logs.json] [--compare base.json]
+
+Os arquivos vão para um diretório temporário; o console é descartado.
+"""
+from typing import Dict, List
+from benchmarks.results import compare_results, print_comparison, run_metadata, save_results, summarize
+import argparse
+import io
+import json
+import logging
+import logging.handlers
+import sys
+import tempfile
+import threading
+import time
+
+
+def _sync_setup(log_dir: str) -> None:
+    """Configuração anterior: console e arquivos com rotação direto no root logger."""
+    from src.core.logging import build_handlers, stop_logging
+    from pathlib import Path
+    stop_logging()
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.setLevel(logging.INFO)
+    for handler in build_handlers(logging.INFO, Path(log_dir)):
+        root.addHandler(handler)
+
+
+def _queue_setup(log_dir: str, log_format: str = "text", sample_rate: float = 1.0) -> None:
+    from src.core.config import settings
+    from src.core.logging import setup_logging
+    settings.LOG_FORMAT = log_format
+    settings.LOG_INFO_SAMPLE_RATE = sample_rate
+    setup_logging(log_dir)
+
+
+def _emit(records: int, samples: List[float]) -> None:
+    from src.core.logging import bind_request
+    logger = logging.getLogger("benchmarks.logging")
+    for index in range(records):
+        if index % 10 == 0:
+            bind_request()  # ~10 linhas por requisição
+        started = time.perf_counter()
+        logger.info("Processamento de /crop-round para %s concluído com sucesso.", f"foto_{index}.jpg")
+        samples.append((time.perf_counter() - started) * 1_000_000)
+
+
+def run_case(setup, records: int, threads: int) -> Dict[str, float]:
+    samples: List[float] = []
+    with tempfile.TemporaryDirectory() as log_dir:
+        stderr, sys.stderr = sys.stderr, io.StringIO()  # console descartado (handlers criados aqui)
+        try:
+            setup(log_dir)
+            workers = [threading.Thread(target=_emit, args=(records // threads, samples)) for _ in range(threads)]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            emitted = time.perf_counter() - started
+            from src.core.logging import stop_logging
+            stop_logging()  # inclui esvaziar a fila
+            drained = time.perf_counter() - started
+            for handler in logging.getLogger().handlers:
+                handler.close()
+            logging.getLogger().handlers.clear()
+        finally:
+            sys.stderr = stderr
+    # Amostras em microssegundos; summarize usa o sufixo _ms por convenção dos resultados
+    stats = summarize(samples)
+    stats.update(emit_seconds=round(emitted, 3), total_seconds=round(drained, 3))
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--output", default=None, help="grava os resultados (JSON) neste arquivo")
+    parser.add_argument("--compare", default=None, help="resultados anteriores (JSON) para comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="piora relativa do p50 considerada regressão")
+    parser.add_argument("--fail-on-regression", action="store_true", help="sai com código 1 se houver regressão")
+    args = parser.parse_args()
+
+    cases = {
+        "sync": _sync_setup,
+        "queue_text": lambda log_dir: _queue_setup(log_dir),
+        "queue_json": lambda log_dir: _queue_setup(log_dir, "json"),
+        "queue_sampled_10pct": lambda log_dir: _queue_setup(log_dir, sample_rate=0.1),
+    }
+    results = {}
+    print(f"{'caso':<24}{'p50 (us)':>10}{'p99 (us)':>10}{'emissão (s)':>13}{'total (s)':>11}")
+    for name, setup in cases.items():
+        results[name] = run_case(setup, args.records, args.threads)
+        stats = results[name]
+        print(f"{name:<24}{stats['p50_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['emit_seconds']:>13.3f}{stats['total_seconds']:>11.3f}")
+
+    report = {
+        "meta": run_metadata(benchmark="logging", unit="us", records=args.records, threads=args.threads),
+        "results": {"logging": results},
+    }
+    if args.output:
+        save_results(args.output, report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            rows = compare_results(json.load(f), report, threshold=args.threshold)
+        print_comparison(rows)
+        if args.fail_on_regression and any(row["regression"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Qualidade e tempo do refinamento de máscara de `/remove-bg/{model}`
+(`src/services/matting.py`) contra a máscara crua do modelo.
+
+A imagem é sintética, com alfa conhecido: um sujeito de borda suave e fios finos
+semitransparentes sobre um fundo texturizado. A "máscara do modelo" é esse alfa
+reduzido à resolução de entrada do u2net (320 px), ampliado de volta e com
+pontos soltos, como a saída real. Para cada caso são medidos o tempo e o erro
+do alfa resultante:
+
+- `sad`: soma das diferenças absolutas (alfa em 0-1), em milhares;
+- `mse`: erro quadrático médio x 1000.
+
+    python -m benchmarks.bench_matting [--sizes 1024,2048,4096] [--repeat 5]
+        [--pymatting] [--output matting.json] [--compare base.json]
+
+`--pymatting` inclui o `alpha_matting_cutout` do rembg (closed-form matting),
+usado antes pelo parâmetro `alpha_matting`, só nos tamanhos até 1024 px.
+"""
+from PIL import Image
+from typing import Callable, Dict, List, Tuple
+from benchmarks.results import compare_results, print_comparison, run_metadata, save_results, summarize
+from src.services.matting import MattingOptions, refine_mask
+from src.utils.frame import ImageFrame
+import argparse
+import json
+import numpy as np
+import sys
+import time
+
+MODEL_SIDE = 320
+PYMATTING_MAX_SIDE = 1024
+
+
+def synthetic_scene(size: int, seed: int = 0) -> Tuple[Image.Image, np.ndarray, np.ndarray]:
+    """Imagem composta, alfa verdadeiro (uint8) e máscara grosseira simulando o modelo."""
+    import cv2
+    rng = np.random.default_rng(seed)
+    height, width = size, size * 3 // 4
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+
+    # Sujeito: elipse com borda suave (~0,4% do lado) e fios finos saindo do topo
+    radius = np.hypot((xx - width / 2) / (width * 0.28), (yy - height * 0.55) / (height * 0.32))
+    edge = max(1.0, size * 0.004)
+    alpha = np.clip((1 - radius) * min(width * 0.28, height * 0.32) / edge + 0.5, 0, 1)
+    strands = np.zeros((height, width), np.float32)
+    for _ in range(40):
+        x0 = rng.uniform(width * 0.3, width * 0.7)
+        angle = rng.uniform(-0.6, 0.6)
+        length = rng.uniform(0.1, 0.2) * height
+        x1, y1 = x0 + np.sin(angle) * length, height * 0.25 - np.cos(angle) * length
+        cv2.line(strands, (int(x0), int(height * 0.25)), (int(x1), int(y1)), rng.uniform(0.4, 0.9), max(1, size // 800), cv2.LINE_AA)
+    alpha = np.maximum(alpha, strands)
+
+    # Primeiro plano claro e fundo escuro texturizado: a luminância separa os dois
+    foreground = 170 + 40 * np.sin(xx / 23)[..., None] + rng.normal(0, 6, (height, width, 1))
+    background = 60 + 30 * np.sin(yy / 37 + xx / 53)[..., None] + rng.normal(0, 6, (height, width, 1))
+    foreground = foreground * np.array([1.0, 0.9, 0.8])
+    background = background * np.array([0.6, 0.8, 1.0])
+    composite = alpha[..., None] * foreground + (1 - alpha[..., None]) * background
+    image = Image.fromarray(np.clip(composite, 0, 255).astype(np.uint8), "RGB")
+    truth = np.clip(alpha * 255 + 0.5, 0, 255).astype(np.uint8)
+
+    # Máscara do modelo: baixa resolução (perde os fios e a borda) e pontos soltos
+    model_size = (MODEL_SIDE * 3 // 4, MODEL_SIDE)
+    coarse = cv2.resize(cv2.resize(truth, model_size, interpolation=cv2.INTER_AREA), (width, height), interpolation=cv2.INTER_LINEAR)
+    for _ in range(25):
+        x, y = int(rng.uniform(0, width)), int(rng.uniform(0, height * 0.2))
+        cv2.circle(coarse, (x, y), max(2, size // 400), 200, -1)
+    return image, truth, coarse
+
+
+def alpha_error(alpha: np.ndarray, truth: np.ndarray) -> Dict[str, float]:
+    diff = (alpha.astype(np.float32) - truth.astype(np.float32)) / 255
+    return {"sad": round(float(np.abs(diff).sum()) / 1000, 3), "mse": round(float((diff ** 2).mean()) * 1000, 4)}
+
+
+def _pymatting(frame: ImageFrame, mask: Image.Image, options: MattingOptions) -> Image.Image:
+    from rembg.bg import alpha_matting_cutout
+    cutout = alpha_matting_cutout(
+        frame.rgb_image, mask, options.foreground_threshold, options.background_threshold, options.erode_size
+    )
+    return cutout.getchannel("A")
+
+
+def run_case(refine: Callable[[ImageFrame, Image.Image], Image.Image], frame: ImageFrame, mask: Image.Image, truth: np.ndarray, repeat: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = refine(frame, mask)
+        samples.append((time.perf_counter() - started) * 1000)
+    stats = summarize(samples)
+    stats.update(alpha_error(np.asarray(result), truth))
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1024,2048,4096", help="maior lado das imagens sintéticas")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pymatting", action="store_true", help="inclui o alpha matting do rembg (lento)")
+    parser.add_argument("--output", default=None, help="grava os resultados (JSON) neste arquivo")
+    parser.add_argument("--compare", default=None, help="resultados anteriores (JSON) para comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="piora relativa do p50 considerada regressão")
+    parser.add_argument("--fail-on-regression", action="store_true", help="sai com código 1 se houver regressão")
+    args = parser.parse_args()
+
+    options = MattingOptions.from_settings()
+    cases = {
+        "raw": lambda frame, mask: mask,
+        "post_process": lambda frame, mask: refine_mask(frame, mask, post_process_mask=True, options=options),
+        "alpha_matting": lambda frame, mask: refine_mask(frame, mask, alpha_matting=True, options=options),
+        "post_and_matting": lambda frame, mask: refine_mask(frame, mask, True, True, options=options),
+    }
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    print(f"{'tamanho':<10}{'caso':<20}{'p50 (ms)':>10}{'sad (mil)':>11}{'mse x1000':>11}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        image, truth, coarse = synthetic_scene(size)
+        frame, mask = ImageFrame(image), Image.fromarray(coarse, "L")
+        group = results[f"{image.width}x{image.height}"] = {}
+        size_cases = dict(cases)
+        if args.pymatting and size <= PYMATTING_MAX_SIDE:
+            size_cases["pymatting"] = lambda frame, mask: _pymatting(frame, mask, options)
+        for name, refine in size_cases.items():
+            repeat = 1 if name == "pymatting" else args.repeat
+            stats = group[name] = run_case(refine, frame, mask, truth, repeat)
+            print(f"{image.width}x{image.height:<5}{name:<20}{stats['p50_ms']:>10.1f}{stats['sad']:>11.2f}{stats['mse']:>11.3f}")
+
+    report = {
+        "meta": run_metadata(benchmark="matting", options=options.__dict__, repeat=args.repeat),
+        "results": results,
+    }
+    if args.output:
+        save_results(args.output, report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            rows = compare_results(json.load(f), report, threshold=args.threshold)
+        print_comparison(rows)
+        if args.fail_on_regression and any(row["regression"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
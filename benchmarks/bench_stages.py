@@ -0,0 +1,121 @@
+"""
+Tempo por etapa do pipeline em vários tamanhos de imagem: decodificação,
+detecção de face (`detect_face_from_bytes`), remoção de fundo (`remove_bg`),
+recortes de `src/utils/images.py` e codificação (`bytes_to_png_rgba` e os demais
+formatos disponíveis).
+
+    python -m benchmarks.bench_stages [--sizes 640x480,1920x1080,4000x3000] [--repeat 5]
+        [--image foto.jpg] [--model u2netp] [--output resultados.json]
+        [--compare base.json] [--threshold 0.1] [--fail-on-regression]
+
+Sem `--model`, a remoção de fundo usa o modelo ONNX mínimo de
+`benchmarks/stand_in.py` (roda sem os pesos reais); com `--model`, o modelo do
+rembg indicado. Sem `--image`, a entrada é uma imagem sintética; a detecção de
+face então mede o custo da passada sem encontrar faces.
+"""
+from PIL import Image
+from typing import Callable, Dict, List, Tuple
+from benchmarks.results import compare_results, print_comparison, run_metadata, save_results, summarize
+import argparse
+import io
+import json
+import sys
+import time
+
+Size = Tuple[int, int]
+
+
+def sample_jpeg(size: Size, image_path: str = None) -> bytes:
+    if image_path:
+        image = Image.open(image_path).convert("RGB").resize(size, Image.Resampling.BICUBIC)
+    else:
+        import numpy as np
+        rng = np.random.default_rng(0)
+        # Gradiente com ruído: comprime e decodifica como uma foto, não como uma cor sólida
+        x = np.linspace(0, 255, size[0], dtype=np.float32)[np.newaxis, :, np.newaxis]
+        y = np.linspace(0, 255, size[1], dtype=np.float32)[:, np.newaxis, np.newaxis]
+        pixels = (x * 0.6 + y * 0.4 + rng.normal(0, 12, (size[1], size[0], 3))).clip(0, 255).astype(np.uint8)
+        image = Image.fromarray(pixels, "RGB")
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=90)
+    return output.getvalue()
+
+
+def _time(fn: Callable, repeat: int) -> List[float]:
+    fn()  # aquecimento (sessões, caches de máscaras circulares, imports)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def bench_size(size: Size, model_key: str, repeat: int, image_path: str = None) -> Dict[str, Dict[str, float]]:
+    from src.services.background import remove_bg
+    from src.services.face import detect_face_from_bytes
+    from src.utils.frame import ImageFrame
+    from src.utils.images import center_face_coords, crop_round_portrait_composed, crop_to_round_centered_on_face, crop_to_square_centered_on_face
+    from src.utils.io import available_output_formats, bytes_to_png_rgba, encode_image
+
+    data = sample_jpeg(size, image_path)
+    # Frames sem digest: o cache de máscaras não encurta as medições
+    frame = ImageFrame.from_image(ImageFrame.from_bytes(data).image)
+    face = detect_face_from_bytes(data) or center_face_coords(size)
+    cutout = remove_bg(frame, model_key)
+
+    stages = {
+        "decode": lambda: ImageFrame.from_bytes(data),
+        "detect_face_from_bytes": lambda: detect_face_from_bytes(data),
+        "remove_bg": lambda: remove_bg(ImageFrame.from_image(frame.image), model_key),
+        "crop_round": lambda: crop_to_round_centered_on_face(cutout, face),
+        "crop_square": lambda: crop_to_square_centered_on_face(cutout, face),
+        "crop_portrait": lambda: crop_round_portrait_composed(cutout, face),
+        "bytes_to_png_rgba": lambda: bytes_to_png_rgba(cutout),
+    }
+    for fmt in available_output_formats():
+        if fmt != "png":
+            stages[f"encode_{fmt}"] = lambda fmt=fmt: encode_image(cutout, fmt)
+    results = {}
+    for name, fn in stages.items():
+        results[name] = summarize(_time(fn, repeat))
+        print(f"{size[0]}x{size[1]:<8}{name:<26}{results[name]['p50_ms']:>10.2f} ms (p95 {results[name]['p95_ms']:.2f})", flush=True)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="640x480,1920x1080,4000x3000", help="tamanhos (LxA) separados por vírgula")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--image", default=None, help="foto usada como entrada (redimensionada para cada tamanho)")
+    parser.add_argument("--model", default=None, help="modelo real do rembg (padrão: modelo mínimo de stand_in.py)")
+    parser.add_argument("--output", default=None, help="grava os resultados (JSON) neste arquivo")
+    parser.add_argument("--compare", default=None, help="resultados anteriores (JSON) para comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="piora relativa do p50 considerada regressão")
+    parser.add_argument("--fail-on-regression", action="store_true", help="sai com código 1 se houver regressão")
+    args = parser.parse_args()
+
+    if args.model:
+        model_key = args.model
+    else:
+        from benchmarks.stand_in import use_stand_in_model
+        model_key = use_stand_in_model()
+    sizes = [tuple(int(v) for v in size.lower().split("x")) for size in args.sizes.split(",")]
+
+    results = {f"{w}x{h}": bench_size((w, h), model_key, args.repeat, args.image) for w, h in sizes}
+    report = {
+        "meta": run_metadata(benchmark="stages", model=args.model or "stand-in", repeat=args.repeat, image=args.image),
+        "results": results,
+    }
+    if args.output:
+        save_results(args.output, report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            rows = compare_results(json.load(f), report, threshold=args.threshold)
+        print_comparison(rows)
+        if args.fail_on_regression and any(row["regression"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Estatísticas e arquivos de resultado (JSON) compartilhados pelos benchmarks,
+para comparar execuções entre commits:
+
+    python -m benchmarks.bench_stages --output antes.json
+    python -m benchmarks.bench_stages --compare antes.json
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+import json
+import os
+import platform
+import subprocess
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Percentil `q` (0-100) com interpolação linear."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    return {
+        "n": len(samples_ms),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 3) if samples_ms else 0.0,
+        "min_ms": round(min(samples_ms), 3) if samples_ms else 0.0,
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+    }
+
+
+def run_metadata(**extra: Any) -> Dict[str, Any]:
+    """Commit, máquina e parâmetros da execução, gravados junto com os resultados."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "commit": commit or None,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        **extra,
+    }
+
+
+def save_results(path: str, results: Dict[str, Any]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], metric: str = "p50_ms", threshold: float = 0.10) -> List[Dict[str, Any]]:
+    """
+    Compara `metric` de cada caso presente nos dois resultados (`results` aninhado
+    em grupos, ex.: tamanho -> etapa). `regression` indica piora acima de `threshold`.
+    """
+    rows = []
+    for group, cases in current.get("results", {}).items():
+        for case, stats in cases.items():
+            before: Optional[Dict[str, Any]] = baseline.get("results", {}).get(group, {}).get(case)
+            if not before or not before.get(metric):
+                continue
+            change = stats[metric] / before[metric] - 1
+            rows.append({
+                "group": group,
+                "case": case,
+                "before": before[metric],
+                "after": stats[metric],
+                "change": round(change, 4),
+                "regression": change > threshold,
+            })
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]], metric: str = "p50_ms") -> None:
+    print(f"\n{'grupo':<14}{'caso':<28}{metric + ' antes':>16}{metric + ' depois':>17}{'variação':>11}")
+    for row in rows:
+        flag = "  <- regressão" if row["regression"] else ""
+        print(f"{row['group']:<14}{row['case']:<28}{row['before']:>16.3f}{row['after']:>17.3f}{row['change']:>+10.1%}{flag}")
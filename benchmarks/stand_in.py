@@ -0,0 +1,54 @@
+"""
+Modelo ONNX mínimo que substitui os modelos do rembg nos benchmarks quando os
+pesos reais não estão disponíveis (ex.: máquinas sem acesso à internet).
+
+Tem a mesma interface do U2Net (entrada 1x3x320x320, máscara 1x1x320x320) e é
+carregado pela sessão `u2net_custom` do rembg, então o pré e pós-processamento
+(normalização, redimensionamento da máscara) são os mesmos dos modelos reais;
+só o custo da rede em si fica de fora.
+"""
+from pathlib import Path
+from typing import Optional
+
+STAND_IN_MODEL = "u2netp"
+
+
+def build_stand_in_model(path: Path) -> Path:
+    """Grava o modelo em `path`: uma convolução 3x3 seguida de sigmoide."""
+    import numpy as np
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    weights = np.random.default_rng(0).normal(0, 0.1, (1, 3, 3, 3)).astype(np.float32)
+    graph = helper.make_graph(
+        [
+            helper.make_node("Conv", ["input", "weights"], ["logits"], pads=[1, 1, 1, 1]),
+            helper.make_node("Sigmoid", ["logits"], ["mask"]),
+        ],
+        "stand_in",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 3, 320, 320])],
+        [helper.make_tensor_value_info("mask", TensorProto.FLOAT, [1, 1, 320, 320])],
+        initializer=[numpy_helper.from_array(weights, "weights")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    onnx.save(model, str(path))
+    return path
+
+
+def use_stand_in_model(directory: Optional[Path] = None) -> str:
+    """
+    Faz o `session_manager` carregar o modelo mínimo para qualquer chave de
+    modelo e retorna a chave a usar nos benchmarks.
+    """
+    from rembg import new_session
+    from rembg.sessions.u2net_custom import U2netCustomSession
+    from src.services.background import session_manager
+
+    # O rembg só carrega modelos próprios de dentro do seu diretório de modelos
+    directory = directory or Path(U2netCustomSession.rembg_home()) / "stand-in"
+    path = build_stand_in_model(Path(directory) / "stand_in.onnx")
+    session_manager.factory = lambda model_key: new_session("u2net_custom", model_path=str(path))
+    return STAND_IN_MODEL
@@ -0,0 +1,140 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from src.core.config import settings
+from src.models.schemas import AdmissionUsageResponse
+from src.services.admission import AdmissionError, admission_controller
+from src.services.face import FACE_MODEL_KEY
+from src.services.intake import request_body_limit
+from typing import Optional, Tuple
+import logging
+import re
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Rotas cujo modelo está no caminho: /remove-bg/{model}, /remove-bg-crop/{model}, /batch/remove-bg/{model}
+_MODEL_IN_PATH = re.compile(r"/(?P<route>batch/remove-bg|remove-bg|remove-bg-crop)/(?P<model>[^/]+)$")
+
+
+class UploadLimitMiddleware:
+    """
+    Recusa com 413 uploads acima de `request_body_limit`: pelo `Content-Length`,
+    antes de o corpo ser lido, e contando os bytes à medida que chegam (uploads
+    chunked não têm `Content-Length`), sem ler nem gravar o restante no arquivo
+    temporário do multipart.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.UPLOAD_MAX_BYTES or scope["method"] not in ("POST", "PUT"):
+            await self.app(scope, receive, send)
+            return
+        limit = request_body_limit(scope["path"])
+        detail = f"Requisição excede o limite de {limit} bytes"
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > limit:
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Para a leitura: para a aplicação, o cliente desconectou
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            nonlocal response_started
+            if exceeded and not response_started:
+                return  # a resposta da aplicação ao corpo interrompido é descartada
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+
+
+def client_id(request: Request) -> str:
+    """Identidade do cliente para as cotas: o cabeçalho `ADMISSION_CLIENT_HEADER` ou o IP."""
+    header = request.headers.get(settings.ADMISSION_CLIENT_HEADER, "")[:64]
+    if header:
+        return header
+    return request.client.host if request.client else "anonymous"
+
+
+async def _requested_work(request: Request) -> Optional[Tuple[str, int, int]]:
+    """(modelo, imagens, imagens processadas em paralelo) da requisição, ou None se não há inferência."""
+    if request.method != "POST":
+        return None
+    path = request.url.path
+    match = _MODEL_IN_PATH.search(path)
+    if match and match.group("route") == "batch/remove-bg":
+        # O multipart já foi lido pelo FastAPI; `form()` devolve o mesmo objeto
+        form = await request.form()
+        units = len(form.getlist("files")) + len(form.getlist("urls"))
+        return match.group("model"), units, settings.BATCH_REQUEST_CONCURRENCY
+    if match:
+        return match.group("model"), 1, 1
+    if path.endswith("/process-url/"):
+        try:
+            data = await request.json()
+        except ValueError:
+            return None  # corpo inválido: o endpoint responde 422
+        if not isinstance(data, dict):
+            return None
+        if data.get("processing_type") == "crop":
+            return FACE_MODEL_KEY, 1, 1
+        return str(data.get("model") or settings.DEFAULT_MODEL), 1, 1
+    if path.endswith("/remove-bg-and-crop-round/"):
+        return request.query_params.get("model", settings.DEFAULT_MODEL), 1, 1
+    if path.endswith("/crop-faces/"):
+        return request.query_params.get("model") or FACE_MODEL_KEY, 1, 1
+    if path.endswith(("/crop-round/", "/detect-faces/")):
+        # Só detecção de face; um `model` na query é ignorado pelo endpoint e não muda o custo
+        return FACE_MODEL_KEY, 1, 1
+    return None
+
+
+async def admission(request: Request):
+    """
+    Dependência dos routers de processamento: cobra o custo do modelo da cota do
+    cliente e reserva o orçamento global durante a requisição (429/503 se recusada).
+    """
+    work = await _requested_work(request) if settings.ADMISSION_ENABLED else None
+    if work is None:
+        yield
+        return
+    model, units, parallel = work
+    client = client_id(request)
+    try:
+        ticket = await admission_controller.acquire(client, model, units, parallel)
+    except AdmissionError as e:
+        logger.warning("Admissão recusada (%s) para o cliente %s com %s: %s", e.status_code, client, model, e)
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    try:
+        yield
+    finally:
+        admission_controller.release(ticket)
+
+
+@router.get("/admission/usage", response_model=AdmissionUsageResponse, summary="Uso do orçamento de admissão e saldo do cliente")
+def admission_usage(request: Request):
+    return AdmissionUsageResponse(**admission_controller.usage(client_id(request)))
@@ -0,0 +1,62 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import Response
+from src.core import metrics
+from src.core.config import settings
+from src.core.logging import bind_request
+import time
+
+router = APIRouter()
+
+
+def _endpoint_label(request: Request) -> str:
+    # Caminho da rota (ex.: /api/v1/remove-bg/u2net), nunca a URL crua, para limitar a cardinalidade
+    route = request.scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    # Rotas de routers incluídos expõem o caminho sem o prefixo
+    prefix = settings.API_V1_PREFIX
+    if request.url.path.startswith(prefix + "/") and not template.startswith(prefix + "/"):
+        return prefix + template
+    return template
+
+
+async def metrics_middleware(request: Request, call_next):
+    """
+    Conta requisições e erros por endpoint, mede a duração e adiciona os
+    cabeçalhos `Server-Timing` (duração de cada etapa) e `X-Processing-Time` (segundos).
+    """
+    stages = metrics.start_request()
+    started = time.perf_counter()
+    status_code = 500
+    metrics.http_in_progress.inc()
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.http_in_progress.dec()
+        endpoint = _endpoint_label(request)
+        metrics.http_requests.inc(method=request.method, endpoint=endpoint, status=str(status_code))
+        metrics.http_duration.observe(elapsed, endpoint=endpoint)
+        if status_code >= 400:
+            metrics.http_errors.inc(endpoint=endpoint, status=str(status_code))
+    response.headers["Server-Timing"] = metrics.server_timing(stages, elapsed)
+    response.headers["X-Processing-Time"] = f"{elapsed:.4f}"
+    return response
+
+
+async def request_context_middleware(request: Request, call_next):
+    """
+    Associa os logs da requisição a um id (o `X-Request-ID` recebido ou um novo),
+    devolvido no mesmo cabeçalho, e decide a amostragem dos logs INFO.
+    """
+    request_id = bind_request(request.headers.get("x-request-id", "")[:64] or None)
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
+@router.get("/metrics", summary="Métricas no formato Prometheus", include_in_schema=False)
+def prometheus_metrics():
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,100 @@
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import Response
+from src.api.v1.endpoints.image import MODELS, run_inference, run_cpu, read_upload, output_format
+from src.core import metrics
+from src.core.config import settings
+from src.services.background import remove_bg
+from src.services.cache import result_cache, content_digest, make_key
+from src.services.download import downloader
+from src.services.intake import IntakeError, inspect_bytes
+from src.services.matting import refinement_key
+from src.services.output import encode_output
+from src.services.pipeline import decode_frame
+from src.utils.io import FILE_EXTENSIONS, build_zip
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+async def _remove_bg_output(image_bytes: bytes, model: str, fmt: str) -> Tuple[bytes, bool]:
+    """Remove o fundo de uma imagem do lote, compartilhando o cache com /remove-bg/{model}."""
+    digest = await run_cpu(content_digest, image_bytes)
+    # Mesmos padrões de /remove-bg/{model}: sem alpha matting, com pós-processamento da máscara
+    cache_key = make_key("remove-bg", digest, model_key=model, refinement=refinement_key(False, True), fmt=fmt)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached, True
+    frame = await run_cpu(decode_frame, image_bytes, digest)
+    cutout = await run_inference(model, remove_bg, frame, model_key=model, post_process_mask=True)
+    output_bytes = await run_cpu(encode_output, cutout, fmt)
+    result_cache.set(cache_key, output_bytes)
+    return output_bytes, False
+
+
+@router.post("/batch/remove-bg/{model}", summary="Remove fundo de várias imagens (arquivos e/ou URLs) em uma chamada")
+async def batch_remove_bg(
+    model: str,
+    files: List[UploadFile] = File(default=[]),
+    urls: List[str] = Form(default=[]),
+    output_format_name: Optional[str] = Form(default=None, alias="format"),
+):
+    """
+    Processa várias imagens com o mesmo modelo e devolve um arquivo ZIP com uma
+    imagem por item (PNG por padrão, ou o `format` informado) e um
+    `manifest.json` com o status de cada item.
+    Requisições concorrentes do mesmo modelo são agrupadas pelo micro-batcher
+    quando `MICRO_BATCH_ENABLED=true`.
+    """
+    logger.info("Iniciando /batch/remove-bg/%s com %s arquivo(s) e %s URL(s)", model, len(files), len(urls))
+    if model not in MODELS:
+        logger.error("Modelo não suportado '%s' para /batch/remove-bg/.", model)
+        raise HTTPException(status_code=400, detail=f"Modelo '{model}' não suportado. Modelos disponíveis: {MODELS}")
+    total = len(files) + len(urls)
+    if total == 0:
+        raise HTTPException(status_code=400, detail="Envie ao menos um arquivo ou URL.")
+    if total > settings.BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Máximo de {settings.BATCH_MAX_FILES} imagens por chamada.")
+
+    fmt = output_format(output_format_name, None, has_alpha=True)
+    semaphore = asyncio.Semaphore(settings.BATCH_REQUEST_CONCURRENCY)
+
+    async def process(index: int, name: str, upload: Optional[UploadFile], url: Optional[str]) -> Dict[str, Any]:
+        stem = os.path.splitext(os.path.basename(name))[0] or "image"
+        item: Dict[str, Any] = {"index": index, "source": name, "output": f"{index:04d}_{stem}.{FILE_EXTENSIONS[fmt]}", "content": None}
+        async with semaphore:
+            try:
+                if upload is not None:
+                    image_bytes = await read_upload(upload)
+                else:
+                    with metrics.stage("download"):
+                        image_bytes = await downloader.fetch(url)
+                    # Mesma checagem de cabeçalho e de pixels dos uploads, antes de decodificar
+                    inspect_bytes(image_bytes)
+                item["content"], item["cached"] = await _remove_bg_output(image_bytes, model, fmt)
+                item["status"] = "ok"
+            except HTTPException as e:
+                item.update(status="error", error=str(e.detail), output=None)
+            except IntakeError as e:
+                logger.warning("Item %s (%s) de /batch/remove-bg/%s recusado: %s", index, name, model, e)
+                item.update(status="error", error=str(e), output=None)
+            except Exception as e:
+                logger.error("Erro no item %s (%s) de /batch/remove-bg/%s: %s", index, name, model, e)
+                item.update(status="error", error=str(e), output=None)
+        return item
+
+    jobs = [process(i, upload.filename or f"file_{i}", upload, None) for i, upload in enumerate(files)]
+    jobs += [process(len(files) + i, url, None, url) for i, url in enumerate(urls)]
+    results = await asyncio.gather(*jobs)
+
+    archive = await run_cpu(build_zip, results)
+    failed = sum(1 for item in results if item["status"] != "ok")
+    logger.info("Processamento de /batch/remove-bg/%s concluído: %s ok, %s com erro.", model, total - failed, failed)
+    return Response(
+        content=archive,
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="remove-bg-{model}.zip"'},
+    )
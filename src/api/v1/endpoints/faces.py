@@ -0,0 +1,126 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.responses import Response
+from src.api.v1.endpoints.image import MODELS, run_inference, run_cpu, read_upload, output_format, _busy_exception
+from src.core.config import settings
+from src.models.schemas import FaceBox, FacesResponse
+from src.services.cache import result_cache, content_digest, make_key
+from src.services.executor import QueueFullError
+from src.services.face import detect_faces_from_bytes, original_size, FACE_MODEL_KEY
+from src.services.pipeline import detect_faces_for_crop, remove_bg_for_crops, face_crops_output, use_roi
+from src.utils.images import square_crop_box
+from src.utils.io import FILE_EXTENSIONS, build_zip
+from typing import Literal, Optional
+import logging
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+def _zip_response(archive: bytes, cache_status: str) -> Response:
+    return Response(
+        content=archive,
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="faces.zip"', "X-Cache": cache_status},
+    )
+
+
+@router.post("/detect-faces/", response_model=FacesResponse, summary="Detecta todas as faces da imagem")
+async def detect_all_faces(file: UploadFile = File(...), max_faces: Optional[int] = Query(default=None, ge=1)):
+    """
+    Retorna as faces detectadas (coordenadas na resolução original e confiança),
+    da mais para a menos confiável.
+    """
+    logger.info("Iniciando /detect-faces para o arquivo: %s", file.filename)
+    image_bytes = await read_upload(file)
+    try:
+        width, height = await run_cpu(original_size, image_bytes)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Imagem inválida em /detect-faces: %s", e)
+        raise HTTPException(status_code=400, detail="Não foi possível decodificar a imagem.")
+    faces = await run_inference(FACE_MODEL_KEY, detect_faces_from_bytes, image_bytes, max_faces)
+    logger.info("%s face(s) detectada(s) em %s.", len(faces), file.filename)
+    return FacesResponse(
+        width=width,
+        height=height,
+        faces=[FaceBox(x=x, y=y, width=w, height=h, confidence=round(score, 4)) for (x, y, w, h), score in faces],
+    )
+
+
+@router.post("/crop-faces/", summary="Recorta cada face da imagem (ZIP com um recorte por face)")
+async def crop_faces(
+    file: UploadFile = File(...),
+    model: Optional[str] = None,
+    shape: Literal["round", "square"] = "round",
+    max_faces: Optional[int] = Query(default=None, ge=1),
+    roi: Optional[bool] = None,
+    requested_format: Optional[str] = Query(default=None, alias="format"),
+):
+    """
+    Detecta todas as faces e devolve um ZIP com um recorte 512x512 por face
+    (`round` ou `square`, fundo branco) e um `manifest.json` com as coordenadas
+    na imagem original e a confiança de cada uma.
+
+    A imagem é decodificada uma vez e, com `model`, o fundo é removido em uma
+    única inferência para todas as faces (com `roi`, apenas na região que cobre
+    todos os recortes). Até `FACES_MAX_PER_IMAGE` faces por imagem.
+    """
+    logger.info("Iniciando /crop-faces para o arquivo: %s | Modelo: %s | Forma: %s", file.filename, model, shape)
+    if model is not None and model not in MODELS:
+        logger.error("Modelo não suportado '%s' para /crop-faces/.", model)
+        raise HTTPException(status_code=400, detail=f"Modelo '{model}' não suportado. Modelos disponíveis: {MODELS}")
+    max_faces = min(max_faces or settings.FACES_MAX_PER_IMAGE, settings.FACES_MAX_PER_IMAGE)
+    fmt = output_format(requested_format, None, has_alpha=False)
+    image_bytes = await read_upload(file)
+    try:
+        digest = await run_cpu(content_digest, image_bytes)
+        region_only = use_roi(roi) and model is not None
+        cache_key = make_key("crop-faces", digest, model_key=model, shape=shape, max_faces=max_faces, roi=region_only, fmt=fmt)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Resultado servido a partir do cache.")
+            return _zip_response(cached, "HIT")
+
+        frame, faces = await detect_faces_for_crop(image_bytes, digest, max_faces)
+        if not faces:
+            logger.error("Nenhuma face encontrada em /crop-faces para %s.", file.filename)
+            raise HTTPException(status_code=404, detail="Nenhuma face encontrada na imagem.")
+        logger.info("%s face(s) detectada(s) em %s.", len(faces), file.filename)
+
+        faces_coords = [coords for coords, _ in faces]
+        source = frame
+        if model is not None:
+            logger.debug("Removendo fundo com o modelo %s para %s recorte(s)...", model, len(faces))
+            boxes = [square_crop_box(coords) for coords in faces_coords]
+            source, faces_coords = await remove_bg_for_crops(frame, model, faces_coords, boxes, region_only)
+        outputs = await run_cpu(face_crops_output, source, faces_coords, shape, fmt)
+
+        # Coordenadas do manifesto na resolução original (o frame pode ter sido decodificado reduzido)
+        full_size = await run_cpu(original_size, image_bytes)
+        sx, sy = full_size[0] / frame.width, full_size[1] / frame.height
+        results = [
+            {
+                "index": i,
+                "output": f"face_{i:02d}.{FILE_EXTENSIONS[fmt]}",
+                "x": int(x * sx),
+                "y": int(y * sy),
+                "width": int(w * sx),
+                "height": int(h * sy),
+                "confidence": round(score, 4),
+                "content": content,
+            }
+            for i, (((x, y, w, h), score), content) in enumerate(zip(faces, outputs))
+        ]
+        archive = await run_cpu(build_zip, results)
+        result_cache.set(cache_key, archive)
+        logger.info("Processamento de /crop-faces para %s concluído com sucesso.", file.filename)
+    except HTTPException as http_exc:
+        logger.error("HTTPException em /crop-faces: %s", http_exc.detail)
+        raise
+    except QueueFullError as e:
+        raise _busy_exception(e)
+    except Exception as e:
+        logger.error("Erro em /crop-faces para %s: %s", file.filename, e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erro ao recortar faces: {str(e)}")
+    return _zip_response(archive, "MISS")
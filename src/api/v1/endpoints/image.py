@@ -1,101 +1,178 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, status, Request
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Query, Header
 from fastapi.responses import Response
-from src.services.face import detect_face_from_bytes
-from src.services.background import remove_bg
-from src.utils.images import crop_to_round_centered_on_face, crop_round_portrait_composed, draw_face_on_image, crop_to_square_centered_on_face
-from src.utils.io import bytes_to_png_rgba
-from PIL import Image
+from src.services.face import detect_face, FACE_MODEL_KEY
+from src.services.background import remove_bg, mask_cache, session_manager
+from src.services.pipeline import ProcessingType, RecomposeShape, decode_frame, detect_for_crop, use_roi, remove_bg_for_crop, roi_region, store_result
+from src.services.pipeline import crop_round_output, portrait_output, fetch_image, process_image_asset, recompose_output, build_asset
+from src.services.assets import asset_id, asset_store
+from src.services.executor import inference_executor, QueueFullError
+from src.services.onnx_options import quantized_variants
+from src.services.cache import result_cache, content_digest, make_key
+from src.services.download import DownloadError
+from src.services.intake import IntakeError, inspect_image
+from src.services.matting import refinement_key
+from src.services.storage import background_writer, debug_storage, result_storage
+from src.utils.images import draw_face_on_image, center_face_coords, square_crop_box, portrait_crop_box
+from PIL import ImageColor
+from src.core import metrics
+from src.core.config import settings
+from src.utils.io import OUTPUT_FORMATS
+from src.services.output import negotiate_format, encode_output, OutputFormatError
+from src.utils.frame import ImageFrame
+from src.models.schemas import CacheStatsResponse, LoadedModelsResponse
 import io
 import logging
-import requests
+import random
 import uuid
-import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from pydantic import BaseModel, HttpUrl
-from typing import Optional, Literal
+from typing import Any, Callable, Optional
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Tipos de processamento para o endpoint de URL
-ProcessingType = Literal["crop", "remove_bg", "crop_remove_bg"]
-
 # Modelos Pydantic
 class ImageUrlRequest(BaseModel):
     image_url: HttpUrl
-    model: str = "birefnet-general"  # Usado para remoção de fundo
+    model: str = settings.DEFAULT_MODEL  # Usado para remoção de fundo
     processing_type: ProcessingType = "remove_bg"
+    format: Optional[str] = None  # png, webp, avif ou jpeg (padrão: OUTPUT_DEFAULT_FORMAT)
+    roi: Optional[bool] = None  # Segmenta apenas a região recortada (padrão: ROI_SEGMENTATION_ENABLED)
 
 class ProcessedImageResponse(BaseModel):
     processed_image_url: str
     original_image_url: str
     model_used: str
     processed_at: str
+    asset_id: Optional[str] = None  # para /assets/{asset_id}/recompose
+
+
+def _busy_exception(exc: QueueFullError) -> HTTPException:
+    logger.warning("Fila de processamento cheia; respondendo 503.")
+    return HTTPException(
+        status_code=503,
+        detail="Servidor ocupado, tente novamente em instantes.",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+async def run_inference(model_key: str, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+    """Executa uma inferência fora do event loop, respeitando o limite do modelo."""
+    try:
+        return await inference_executor.run_inference(model_key, fn, *args, **kwargs)
+    except QueueFullError as e:
+        raise _busy_exception(e)
 
-# Diretório para armazenar temporariamente as imagens processadas
-TEMP_DIR = "temp_images"
-os.makedirs(TEMP_DIR, exist_ok=True)
+async def run_cpu(fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+    """Executa trabalho de CPU (PIL/OpenCV) fora do event loop."""
+    try:
+        return await inference_executor.run_cpu(fn, *args, **kwargs)
+    except QueueFullError as e:
+        raise _busy_exception(e)
+
+async def read_upload(file: UploadFile) -> bytes:
+    """
+    Valida o upload no arquivo temporário (tamanho, magic bytes e dimensões lidas
+    do cabeçalho) e só então o carrega; 413/415/400 se recusado.
+    """
+    with metrics.stage("upload_read"):
+        try:
+            inspect_image(file.file, file.size)
+        except IntakeError as e:
+            logger.warning("Upload recusado (%s): %s", file.filename, e)
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        return await file.read()
+
+def output_format(requested: Optional[str], accept: Optional[str], has_alpha: bool) -> str:
+    """Formato de saída negociado (parâmetro `format` ou cabeçalho Accept); 400 se desconhecido."""
+    try:
+        return negotiate_format(requested, accept, has_alpha)
+    except OutputFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _image_response(content: bytes, fmt: str, cache_status: str, asset: Optional[str] = None) -> Response:
+    # Vary: Accept, pois o formato pode depender do cabeçalho
+    headers = {"X-Cache": cache_status, "Vary": "Accept"}
+    if asset is not None:
+        headers["X-Asset-ID"] = asset
+    return Response(content=content, media_type=OUTPUT_FORMATS[fmt], headers=headers)
+
+def _cached_response(cache_key: str, fmt: str, asset: Optional[str] = None) -> Optional[Response]:
+    """Resposta pronta a partir do cache de resultados, se houver (e se o asset esperado ainda existir)."""
+    cached = result_cache.get(cache_key)
+    if cached is None or (asset is not None and asset_store.get(asset) is None):
+        return None
+    logger.debug("Resultado servido a partir do cache.")
+    return _image_response(cached, fmt, "HIT", asset)
+
+def _should_capture_debug() -> bool:
+    rate = settings.DEBUG_IMAGE_SAMPLE_RATE
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+def _save_debug_image(frame: ImageFrame, face_coords, filename: str) -> None:
+    """Desenha a face detectada sobre uma cópia reduzida da imagem e grava em debug_images."""
+    with metrics.stage("debug_image"):
+        proxy = frame.proxy(settings.DEBUG_IMAGE_MAX_SIDE)
+        scale = proxy.width / frame.width
+        coords = tuple(int(value * scale) for value in face_coords)
+        buffer = io.BytesIO()
+        draw_face_on_image(proxy.rgb_image, coords).save(buffer, "JPEG", quality=80)
+    file_path = debug_storage.write(filename, buffer.getvalue())
+    logger.info("Imagem de debug com a face detectada salva em: %s", file_path)
 
-# Diretório para imagens de depuração
-DEBUG_DIR = "debug_images"
-os.makedirs(DEBUG_DIR, exist_ok=True)
 
 
 @router.post("/crop-round/", summary="Recorta imagem em círculo centralizado na face")
-async def crop_round(file: UploadFile = File(...), use_fallback: bool = True):
+async def crop_round(
+    file: UploadFile = File(...),
+    use_fallback: bool = True,
+    requested_format: Optional[str] = Query(default=None, alias="format"),
+    accept: Optional[str] = Header(default=None),
+):
     """
     Recorta uma imagem em formato circular, centralizando na face detectada.
     Se nenhuma face for encontrada e use_fallback=True, usa o centro da imagem.
     """
-    logger.info(f"Iniciando /crop-round para o arquivo: {file.filename}")
-    if not file.content_type.startswith("image/"):
-        logger.warning(f"Tipo de conteúdo inválido para /crop-round: {file.content_type}")
-        raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem.")
+    logger.info("Iniciando /crop-round para o arquivo: %s", file.filename)
     
     try:
-        image_bytes = await file.read()
-        pil_image = Image.open(io.BytesIO(image_bytes)).convert("RGBA")
-        
-        # Tentar detectar face
+        image_bytes = await read_upload(file)
+        digest = await run_cpu(content_digest, image_bytes)
+        fmt = output_format(requested_format, accept, has_alpha=False)
+        cache_key = make_key("crop-round", digest, use_fallback=use_fallback, fmt=fmt)
+        cached = _cached_response(cache_key, fmt)
+        if cached is not None:
+            return cached
+        # Tentar detectar face (JPEGs são decodificados só na escala que o recorte precisa)
         logger.debug("Tentando detectar face...")
-        face_coords = detect_face_from_bytes(image_bytes)
+        frame, face_coords = await detect_for_crop(image_bytes, digest)
         
         if face_coords:
-            logger.info(f"Face detectada para '{file.filename}' nas coordenadas: {face_coords}")
-            # Salvar imagem de debug com o retângulo da face
-            try:
-                debug_image = draw_face_on_image(pil_image, face_coords)
+            logger.info("Face detectada para '%s' nas coordenadas: %s", file.filename, face_coords)
+            # Imagem de debug com o retângulo da face: amostrada e gravada fora da requisição
+            if _should_capture_debug():
                 debug_filename = f"debug_{uuid.uuid4()}.jpg"
-                debug_filepath = os.path.join(DEBUG_DIR, debug_filename)
-                debug_image.convert("RGB").save(debug_filepath, "JPEG")
-                logger.info(f"Imagem de debug com a face detectada salva em: {debug_filepath}")
-            except Exception as e:
-                logger.error(f"Falha ao salvar imagem de debug: {str(e)}")
+                if background_writer.submit(_save_debug_image, frame, face_coords, debug_filename) is None:
+                    logger.debug("Fila de gravação cheia; imagem de debug descartada.")
         else:
-            logger.warning(f"Nenhuma face encontrada na imagem: {file.filename}")
+            logger.warning("Nenhuma face encontrada na imagem: %s", file.filename)
             if not use_fallback:
                 logger.error("Nenhuma face encontrada e fallback está desativado.")
                 raise HTTPException(status_code=404, detail="Nenhuma face encontrada na imagem.")
             
             logger.info("Usando fallback para o centro da imagem.")
             # Se não encontrar face, usar o centro da imagem como fallback
-            w, h = pil_image.size
-            # Criar coordenadas de face fictícia centrada na imagem
-            face_size = min(w, h) // 3  # Usar 1/3 da menor dimensão
-            face_x = (w - face_size) // 2
-            face_y = (h - face_size) // 2
-            face_coords = (face_x, face_y, face_size, face_size)
+            face_coords = center_face_coords(frame.size)
             
-        result = crop_to_round_centered_on_face(pil_image, face_coords)
-        output_bytes = bytes_to_png_rgba(result)
-        logger.info(f"Processamento de /crop-round para {file.filename} concluído com sucesso.")
-        return Response(content=output_bytes, media_type="image/png")
+        output_bytes = await run_cpu(crop_round_output, frame, face_coords, fmt)
+        result_cache.set(cache_key, output_bytes)
+        logger.info("Processamento de /crop-round para %s concluído com sucesso.", file.filename)
+        return _image_response(output_bytes, fmt, "MISS")
         
     except HTTPException as http_exc:
-        logger.error(f"HTTPException em /crop-round: {http_exc.detail}")
+        logger.error("HTTPException em /crop-round: %s", http_exc.detail)
         raise
     except Exception as e:
-        logger.error(f"Erro inesperado em /crop-round para {file.filename}: {str(e)}", exc_info=True)
+        logger.error("Erro inesperado em /crop-round para %s: %s", file.filename, e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}")
 
 # Endpoints de remoção de fundo
@@ -114,52 +191,80 @@ MODELS = [
     "silueta",
     "bria-rmbg",
     "sam"
-]
+] + quantized_variants()
 
 def create_remove_bg_endpoint(model: str):
-    async def endpoint(file: UploadFile = File(...), alpha_matting: bool = False, post_process_mask: bool = True):
-        logger.info(f"Iniciando /remove-bg/{model} para o arquivo: {file.filename}")
-        if not file.content_type.startswith("image/"):
-            logger.warning(f"Tipo de conteúdo inválido para /remove-bg/{model}: {file.content_type}")
-            raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem.")
-        image_bytes = await file.read()
+    async def endpoint(
+        file: UploadFile = File(...),
+        alpha_matting: bool = False,
+        post_process_mask: bool = True,
+        requested_format: Optional[str] = Query(default=None, alias="format"),
+        accept: Optional[str] = Header(default=None),
+    ):
+        logger.info("Iniciando /remove-bg/%s para o arquivo: %s", model, file.filename)
+        image_bytes = await read_upload(file)
         try:
-            logger.debug(f"Removendo fundo com o modelo {model}...")
-            output_bytes = remove_bg(image_bytes, model_key=model)
-            logger.info(f"Processamento de /remove-bg/{model} para {file.filename} concluído com sucesso.")
+            digest = await run_cpu(content_digest, image_bytes)
+            fmt = output_format(requested_format, accept, has_alpha=True)
+            cache_key = make_key(
+                "remove-bg", digest, model_key=model, refinement=refinement_key(alpha_matting, post_process_mask), fmt=fmt
+            )
+            cached = _cached_response(cache_key, fmt)
+            if cached is not None:
+                return cached
+            frame = await run_cpu(decode_frame, image_bytes, digest)
+            logger.debug("Removendo fundo com o modelo %s...", model)
+            cutout = await run_inference(
+                model, remove_bg, frame, model_key=model, alpha_matting=alpha_matting, post_process_mask=post_process_mask
+            )
+            output_bytes = await run_cpu(encode_output, cutout, fmt)
+            result_cache.set(cache_key, output_bytes)
+            logger.info("Processamento de /remove-bg/%s para %s concluído com sucesso.", model, file.filename)
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"Erro em /remove-bg/{model} para {file.filename}: {str(e)}", exc_info=True)
+            logger.error("Erro em /remove-bg/%s para %s: %s", model, file.filename, e, exc_info=True)
             raise HTTPException(status_code=500, detail=f"Erro ao remover fundo: {str(e)}")
-        return Response(content=output_bytes, media_type="image/png")
+        return _image_response(output_bytes, fmt, "MISS")
     return endpoint
 
 def create_remove_bg_crop_endpoint(model: str):
-    async def endpoint(file: UploadFile = File(...)):
-        logger.info(f"Iniciando /remove-bg-crop/{model} para o arquivo: {file.filename}")
-        if not file.content_type.startswith("image/"):
-            logger.warning(f"Tipo de conteúdo inválido para /remove-bg-crop/{model}: {file.content_type}")
-            raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem.")
-        image_bytes = await file.read()
+    async def endpoint(
+        file: UploadFile = File(...),
+        roi: Optional[bool] = None,
+        requested_format: Optional[str] = Query(default=None, alias="format"),
+        accept: Optional[str] = Header(default=None),
+    ):
+        logger.info("Iniciando /remove-bg-crop/%s para o arquivo: %s", model, file.filename)
+        image_bytes = await read_upload(file)
         try:
-            logger.debug(f"Removendo fundo com o modelo {model}...")
-            bg_removed = remove_bg(image_bytes, model_key=model)
-            pil_image = Image.open(io.BytesIO(bg_removed)).convert("RGBA")
+            digest = await run_cpu(content_digest, image_bytes)
+            region_only = use_roi(roi)
+            fmt = output_format(requested_format, accept, has_alpha=False)
+            cache_key = make_key("remove-bg-crop", digest, model_key=model, roi=region_only, fmt=fmt)
+            cached = _cached_response(cache_key, fmt)
+            if cached is not None:
+                return cached
             logger.debug("Tentando detectar face para recorte...")
-            face_coords = detect_face_from_bytes(image_bytes)
+            frame, face_coords = await detect_for_crop(image_bytes, digest)
             if not face_coords:
-                logger.error(f"Face não encontrada em /remove-bg-crop/{model} para {file.filename}.")
+                logger.error("Face não encontrada em /remove-bg-crop/%s para %s.", model, file.filename)
                 raise HTTPException(status_code=404, detail="Face não encontrada.")
+            logger.debug("Removendo fundo com o modelo %s...", model)
+            cutout, face_coords = await remove_bg_for_crop(frame, model, face_coords, square_crop_box(face_coords), region_only)
             logger.debug("Recortando imagem...")
-            result = crop_to_round_centered_on_face(pil_image, face_coords)
-            output_bytes = bytes_to_png_rgba(result)
-            logger.info(f"Processamento de /remove-bg-crop/{model} para {file.filename} concluído com sucesso.")
+            output_bytes = await run_cpu(crop_round_output, cutout, face_coords, fmt)
+            result_cache.set(cache_key, output_bytes)
+            logger.info("Processamento de /remove-bg-crop/%s para %s concluído com sucesso.", model, file.filename)
         except HTTPException as http_exc:
-            logger.error(f"HTTPException em /remove-bg-crop/{model}: {http_exc.detail}")
+            logger.error("HTTPException em /remove-bg-crop/%s: %s", model, http_exc.detail)
             raise
+        except QueueFullError as e:
+            raise _busy_exception(e)
         except Exception as e:
-            logger.error(f"Erro em /remove-bg-crop/{model} para {file.filename}: {str(e)}", exc_info=True)
+            logger.error("Erro em /remove-bg-crop/%s para %s: %s", model, file.filename, e, exc_info=True)
             raise HTTPException(status_code=500, detail=f"Erro ao remover fundo e recortar: {str(e)}")
-        return Response(content=output_bytes, media_type="image/png")
+        return _image_response(output_bytes, fmt, "MISS")
     return endpoint
 
 # Register endpoints for each model
@@ -188,141 +293,157 @@ async def process_image_from_url(data: ImageUrlRequest, request: Request):
     salva temporariamente e retorna um link para a imagem processada.
     params: processing_type [remove_bg, crop, crop_remove_bg]
     """
-    logger.info(f"Iniciando processamento via URL: {data.image_url} | Tipo: {data.processing_type} | Modelo: {data.model}")
+    logger.info("Iniciando processamento via URL: %s | Tipo: %s | Modelo: %s", data.image_url, data.processing_type, data.model)
     
     # Validar modelo
     if data.processing_type in ["remove_bg", "crop_remove_bg"] and data.model not in MODELS:
-        logger.error(f"Modelo não suportado: {data.model}")
+        logger.error("Modelo não suportado: %s", data.model)
         raise HTTPException(status_code=400, detail=f"Modelo '{data.model}' não suportado. Modelos disponíveis: {MODELS}")
     
+    fmt = output_format(data.format, None, has_alpha=False)
     try:
-        # Baixar imagem da URL
-        logger.debug(f"Baixando imagem da URL: {data.image_url}")
-        response = requests.get(str(data.image_url), timeout=30)
-        response.raise_for_status()
-        
-        # Verificar se é uma imagem
-        content_type = response.headers.get('content-type', '')
-        if not content_type.startswith('image/'):
-            logger.error(f"URL não aponta para uma imagem válida. Content-Type: {content_type}")
-            raise HTTPException(status_code=400, detail="URL deve apontar para uma imagem válida")
-        
-        image_bytes = response.content
-        logger.debug(f"Imagem baixada com sucesso. Tamanho: {len(image_bytes)} bytes")
-        
-        # Lógica de processamento baseada no tipo
-        if data.processing_type == "remove_bg":
-            logger.debug(f"Removendo fundo com modelo: {data.model}")
-            bg_removed_bytes = remove_bg(image_bytes, model_key=data.model)
-            
-            logger.debug("Centralizando e redimensionando imagem sem fundo...")
-            pil_image_no_bg = Image.open(io.BytesIO(bg_removed_bytes)).convert("RGBA")
-            face_coords = detect_face_from_bytes(image_bytes) # Detectar na original
-            if not face_coords:
-                logger.warning("Nenhuma face encontrada, usando fallback para o centro da imagem.")
-                w, h = pil_image_no_bg.size
-                face_size = min(w, h) // 3
-                face_x = (w - face_size) // 2
-                face_y = (h - face_size) // 2
-                face_coords = (face_x, face_y, face_size, face_size)
-            result_image = crop_to_square_centered_on_face(pil_image_no_bg, face_coords)
-            processed_bytes = bytes_to_png_rgba(result_image)
-
-        elif data.processing_type == "crop":
-            logger.debug("Iniciando recorte circular...")
-            pil_image = Image.open(io.BytesIO(image_bytes)).convert("RGBA")
-            face_coords = detect_face_from_bytes(image_bytes)
-            if not face_coords:
-                logger.warning("Nenhuma face encontrada, usando fallback para o centro da imagem.")
-                w, h = pil_image.size
-                face_size = min(w, h) // 3
-                face_x = (w - face_size) // 2
-                face_y = (h - face_size) // 2
-                face_coords = (face_x, face_y, face_size, face_size)
-            result_image = crop_to_round_centered_on_face(pil_image, face_coords)
-            processed_bytes = bytes_to_png_rgba(result_image)
-
-        elif data.processing_type == "crop_remove_bg":
-            logger.debug(f"Removendo fundo com modelo: {data.model}")
-            bg_removed_bytes = remove_bg(image_bytes, model_key=data.model)
-            
-            logger.debug("Iniciando recorte circular na imagem sem fundo...")
-            pil_image_no_bg = Image.open(io.BytesIO(bg_removed_bytes)).convert("RGBA")
-            face_coords = detect_face_from_bytes(image_bytes) # Detectar na original
-            if not face_coords:
-                logger.warning("Nenhuma face encontrada, usando fallback para o centro da imagem.")
-                w, h = pil_image_no_bg.size
-                face_size = min(w, h) // 3
-                face_x = (w - face_size) // 2
-                face_y = (h - face_size) // 2
-                face_coords = (face_x, face_y, face_size, face_size)
-            result_image = crop_to_round_centered_on_face(pil_image_no_bg, face_coords)
-            processed_bytes = bytes_to_png_rgba(result_image)
-
-        
-        # Gerar nome único para o arquivo
-        unique_id = str(uuid.uuid4())
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"processed_{timestamp}_{unique_id}.png"
-        file_path = os.path.join(TEMP_DIR, filename)
-        
-        # Salvar imagem processada
-        with open(file_path, 'wb') as f:
-            f.write(processed_bytes)
+        # Baixar e processar (pipeline compartilhado com os workers de /jobs)
+        logger.debug("Baixando imagem da URL: %s", data.image_url)
+        image_bytes = await fetch_image(str(data.image_url))
+        processed_bytes, asset = await process_image_asset(image_bytes, data.processing_type, data.model, data.roi, fmt)
+        key = await store_result(processed_bytes, fmt)
         
-        logger.info(f"Imagem processada salva em: {file_path}")
-        
-        # Construir URL do arquivo processado (assumindo que será servido estaticamente)
-        processed_url = request.url_for('temp_images', path=filename)
+        # URL do resultado no storage configurado (local ou pré-assinada no S3)
+        processed_url = result_storage.url(key, request)
         
         # Criar resposta
         response_data = ProcessedImageResponse(
             processed_image_url=str(processed_url),
             original_image_url=str(data.image_url),
             model_used=data.model,
-            processed_at=datetime.now().isoformat()
+            processed_at=datetime.now().isoformat(),
+            asset_id=asset,
         )
         
-        logger.info(f"Processamento via URL concluído com sucesso para: {data.image_url}")
+        logger.info("Processamento via URL concluído com sucesso para: %s", data.image_url)
         return response_data
         
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Erro ao baixar imagem da URL {data.image_url}: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Erro ao baixar imagem: {str(e)}")
+    except DownloadError as e:
+        logger.error("Erro ao baixar imagem da URL %s: %s", data.image_url, e)
+        raise HTTPException(status_code=e.status_code, detail=f"Erro ao baixar imagem: {str(e)}")
+    except IntakeError as e:
+        logger.warning("Imagem da URL %s recusada: %s", data.image_url, e)
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except HTTPException:
         raise
+    except QueueFullError as e:
+        raise _busy_exception(e)
     except Exception as e:
-        logger.error(f"Erro inesperado no processamento via URL {data.image_url}: {str(e)}", exc_info=True)
+        logger.error("Erro inesperado no processamento via URL %s: %s", data.image_url, e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erro interno no servidor: {str(e)}")
 
 # Endpoint legado
 @router.post("/remove-bg-and-crop-round/", summary="Remove fundo e recorta retrato composto (LEGADO)")
-async def remove_bg_and_crop_round(file: UploadFile = File(...), model: str = "birefnet-general", radius_scale: float = 1.8, vertical_bias: float = 0.25):
-    logger.info(f"Iniciando endpoint legado /remove-bg-and-crop-round/ para o arquivo: {file.filename} com modelo {model}")
-    if not file.content_type.startswith("image/"):
-        logger.warning(f"Tipo de conteúdo inválido para /remove-bg-and-crop-round/: {file.content_type}")
-        raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem.")
-    image_bytes = await file.read()
+async def remove_bg_and_crop_round(
+    file: UploadFile = File(...),
+    model: str = settings.DEFAULT_MODEL,
+    radius_scale: float = 1.8,
+    vertical_bias: float = 0.25,
+    roi: Optional[bool] = None,
+    requested_format: Optional[str] = Query(default=None, alias="format"),
+    accept: Optional[str] = Header(default=None),
+):
+    logger.info("Iniciando endpoint legado /remove-bg-and-crop-round/ para o arquivo: %s com modelo %s", file.filename, model)
+    image_bytes = await read_upload(file)
     if model not in MODELS:
-        logger.error(f"Modelo não suportado '{model}' para /remove-bg-and-crop-round/.")
+        logger.error("Modelo não suportado '%s' para /remove-bg-and-crop-round/.", model)
         raise HTTPException(status_code=400, detail="Modelo não suportado.")
     try:
-        logger.debug(f"Removendo fundo com o modelo {model}...")
-        bg_removed = remove_bg(image_bytes, model_key=model)
-        pil_image = Image.open(io.BytesIO(bg_removed)).convert("RGBA")
+        digest = await run_cpu(content_digest, image_bytes)
+        region_only = use_roi(roi)
+        fmt = output_format(requested_format, accept, has_alpha=True)
+        cache_key = make_key(
+            "remove-bg-and-crop-round", digest, model_key=model, radius_scale=radius_scale, vertical_bias=vertical_bias, roi=region_only, fmt=fmt
+        )
+        # A máscara depende do recorte quando a segmentação é só da região
+        asset = asset_id("remove-bg-and-crop-round", digest, model_key=model, roi=region_only,
+                         radius_scale=radius_scale if region_only else None, vertical_bias=vertical_bias if region_only else None)
+        asset = asset if asset_store.enabled else None
+        cached = _cached_response(cache_key, fmt, asset)
+        if cached is not None:
+            return cached
+        frame = await run_cpu(decode_frame, image_bytes, digest)
         logger.debug("Tentando detectar face para recorte...")
-        face_coords = detect_face_from_bytes(image_bytes)
+        face_coords = await run_inference(FACE_MODEL_KEY, detect_face, frame)
         if not face_coords:
-            logger.error(f"Face não encontrada em /remove-bg-and-crop-round/ para {file.filename}.")
+            logger.error("Face não encontrada em /remove-bg-and-crop-round/ para %s.", file.filename)
             raise HTTPException(status_code=404, detail="Face não encontrada.")
+        logger.debug("Removendo fundo com o modelo %s...", model)
+        crop_box = portrait_crop_box(face_coords, frame.size, radius_scale, vertical_bias)
+        cutout, face_coords = await remove_bg_for_crop(frame, model, face_coords, crop_box, region_only)
+        if asset is not None:
+            region = roi_region(frame.size, [crop_box], region_only)
+            asset_store.save(asset, await run_cpu(build_asset, image_bytes, frame, cutout, face_coords, region, model))
         logger.debug("Recortando imagem (retrato composto)...")
-        result = crop_round_portrait_composed(pil_image, face_coords, radius_scale=radius_scale, vertical_bias=vertical_bias)
-        output_bytes = bytes_to_png_rgba(result)
-        logger.info(f"Processamento de /remove-bg-and-crop-round/ para {file.filename} concluído com sucesso.")
+        output_bytes = await run_cpu(portrait_output, cutout, face_coords, radius_scale, vertical_bias, fmt)
+        result_cache.set(cache_key, output_bytes)
+        logger.info("Processamento de /remove-bg-and-crop-round/ para %s concluído com sucesso.", file.filename)
     except HTTPException as http_exc:
-        logger.error(f"HTTPException em /remove-bg-and-crop-round/: {http_exc.detail}")
+        logger.error("HTTPException em /remove-bg-and-crop-round/: %s", http_exc.detail)
         raise
+    except QueueFullError as e:
+        raise _busy_exception(e)
     except Exception as e:
-        logger.error(f"Erro em /remove-bg-and-crop-round/ para {file.filename}: {str(e)}", exc_info=True)
+        logger.error("Erro em /remove-bg-and-crop-round/ para %s: %s", file.filename, e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erro ao remover fundo e recortar: {str(e)}")
-    return Response(content=output_bytes, media_type="image/png")
+    return _image_response(output_bytes, fmt, "MISS", asset)
+
+@router.get("/assets/{asset_id}/recompose", summary="Novo recorte de um resultado anterior, sem detecção nem inferência")
+async def recompose_asset(
+    asset_id: str,
+    shape: RecomposeShape = "round",
+    radius_scale: Optional[float] = Query(default=None, gt=0, le=10),
+    vertical_bias: Optional[float] = Query(default=None, ge=-1, le=2),
+    size: Optional[int] = Query(default=None, ge=16, le=4096),
+    background: Optional[str] = None,
+    requested_format: Optional[str] = Query(default=None, alias="format"),
+    accept: Optional[str] = Header(default=None),
+):
+    """
+    Reaplica recorte, forma (`round`, `square`, `portrait`), tamanho e cor de fundo
+    (`background`, ex.: `#ff0000`; só onde o fundo foi removido) sobre a imagem, a
+    máscara e a face guardadas pela chamada que devolveu o `asset_id`
+    (`X-Asset-ID` em `/remove-bg-and-crop-round/`, `asset_id` em `/process-url/`).
+    """
+    asset = asset_store.get(asset_id)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Asset não encontrado ou expirado; repita a chamada original.")
+    try:
+        color = ImageColor.getrgb(background)[:3] if background else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Cor de fundo inválida: '{background}'")
+    fmt = output_format(requested_format, accept, has_alpha=shape == "portrait")
+    cache_key = make_key(
+        "recompose", asset_id, shape=shape, radius_scale=radius_scale, vertical_bias=vertical_bias, size=size, background=color, fmt=fmt
+    )
+    cached = _cached_response(cache_key, fmt)
+    if cached is not None:
+        return cached
+    try:
+        output_bytes = await run_cpu(recompose_output, asset, shape, fmt, radius_scale, vertical_bias, size, color)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Erro em /assets/%s/recompose: %s", asset_id, e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erro ao recompor imagem: {str(e)}")
+    result_cache.set(cache_key, output_bytes)
+    return _image_response(output_bytes, fmt, "MISS")
+
+@router.get("/cache/stats", response_model=CacheStatsResponse, summary="Estatísticas do cache de resultados")
+def cache_stats():
+    return CacheStatsResponse(results=result_cache.stats(), masks=mask_cache.stats(), assets=asset_store.cache.stats())
+
+@router.get("/models/loaded", response_model=LoadedModelsResponse, summary="Modelos carregados em memória")
+def loaded_models():
+    return LoadedModelsResponse(
+        ready=session_manager.ready,
+        total_bytes=session_manager.total_bytes,
+        budget_bytes=session_manager.memory_budget_bytes,
+        models=session_manager.loaded(),
+        errors=dict(session_manager.errors),
+    )
@@ -0,0 +1,74 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import HttpUrl
+from src.api.v1.endpoints.image import MODELS, ImageUrlRequest, output_format
+from src.models.schemas import JobResponse
+from src.services.jobs import Job, job_store, job_worker, is_local_webhook
+from datetime import datetime
+from typing import Optional
+import asyncio
+import logging
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+class JobRequest(ImageUrlRequest):
+    # Chamado com POST (JSON com id, status, result_url e error) ao terminar; apenas hosts locais
+    webhook_url: Optional[HttpUrl] = None
+
+
+def _job_response(job: Job, request: Request) -> JobResponse:
+    return JobResponse(
+        id=job.id,
+        status=job.status,
+        processing_type=job.request["processing_type"],
+        model=job.request["model"],
+        attempts=job.attempts,
+        created_at=datetime.fromtimestamp(job.created_at).isoformat(),
+        updated_at=datetime.fromtimestamp(job.updated_at).isoformat(),
+        result_url=job.result_url(request),
+        error=job.error,
+    )
+
+
+@router.post("/jobs", response_model=JobResponse, status_code=202, summary="Enfileira o processamento de uma imagem via URL")
+async def create_job(data: JobRequest, request: Request):
+    """
+    Mesmo processamento de `/process-url/` (`processing_type`: crop, remove_bg,
+    crop_remove_bg), executado por um worker da fila. Consulte o andamento em
+    `GET /jobs/{id}`; `result_url` aparece quando o status for `succeeded`.
+    """
+    logger.info("Novo job: %s | Tipo: %s | Modelo: %s", data.image_url, data.processing_type, data.model)
+    if data.processing_type in ["remove_bg", "crop_remove_bg"] and data.model not in MODELS:
+        logger.error("Modelo não suportado: %s", data.model)
+        raise HTTPException(status_code=400, detail=f"Modelo '{data.model}' não suportado. Modelos disponíveis: {MODELS}")
+    fmt = output_format(data.format, None, has_alpha=False)
+    webhook_url = str(data.webhook_url) if data.webhook_url else None
+    if webhook_url and not is_local_webhook(webhook_url):
+        raise HTTPException(status_code=400, detail="webhook_url deve apontar para um host local.")
+
+    payload = {
+        "image_url": str(data.image_url),
+        "processing_type": data.processing_type,
+        "model": data.model,
+        "roi": data.roi,
+        "format": fmt,
+    }
+    job = await asyncio.to_thread(job_store.enqueue, payload, webhook_url)
+    job_worker.notify()
+    logger.info("Job %s enfileirado.", job.id)
+    response = _job_response(job, request)
+    return JSONResponse(
+        status_code=202,
+        content=response.model_dump(),
+        headers={"Location": str(request.url_for("get_job", job_id=job.id))},
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse, summary="Status e resultado de um job")
+async def get_job(job_id: str, request: Request):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    return _job_response(job, request)
@@ -0,0 +1,243 @@
+"""
+Processamento em lote offline, importando os serviços diretamente (sem a API HTTP):
+
+    python -m src.bulk fotos/ --output saida/ --type crop_remove_bg --model u2net
+    python -m src.bulk "acervo/**/*.jpg" --output saida/ --workers 8
+    python -m src.bulk pedidos.jsonl --output saida/ --report resumo.json
+
+A entrada pode ser um diretório (percorrido recursivamente), um glob ou um
+manifesto JSONL com uma imagem por linha: `path` ou `image_url` e, opcionalmente,
+`processing_type`, `model`, `format`, `roi` e `output` (caminho relativo da
+saída). O que não vier na linha usa os valores da linha de comando.
+
+As imagens passam pelo mesmo pipeline de `/process-url/` em um pool de
+processos (`--workers`, padrão: número de núcleos), lidas sob demanda. Cada
+resultado é anexado a um checkpoint JSONL; ao rodar de novo, itens com o mesmo
+hash de entrada e os mesmos parâmetros, cuja saída ainda existe, são pulados.
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from src.api.v1.endpoints.image import MODELS
+from src.core.logging import setup_logging
+from src.services.cache import content_digest, make_key
+from src.services.download import downloader
+from src.services.output import OutputFormatError, negotiate_format
+from src.services.pipeline import process_image_bytes
+from src.utils.io import FILE_EXTENSIONS
+from typing import Any, Dict, Iterator, Optional, Set
+from urllib.parse import urlparse
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff", ".gif", ".avif"}
+
+# Event loop de cada processo do pool, reaproveitado entre os itens (cliente de download, executores)
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _init_worker() -> None:
+    global _loop
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s | %(levelname)-8s | %(processName)s | %(name)s | %(message)s")
+    _loop = asyncio.new_event_loop()
+
+
+def _output_name(source: str, base: Optional[str], fmt: str) -> str:
+    """Caminho relativo da saída: o da entrada sob `base` (ou só o nome do arquivo), com a extensão do formato."""
+    if base is not None:
+        relative = os.path.relpath(source, base)
+    else:
+        relative = os.path.basename(urlparse(source).path) or content_digest(source.encode())[:16]
+    return f"{os.path.splitext(relative)[0]}.{FILE_EXTENSIONS[fmt]}"
+
+
+def _glob_base(pattern: str) -> str:
+    """Parte inicial do glob sem curingas, usada para manter a estrutura de pastas na saída."""
+    parts = []
+    for part in pattern.split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or "."
+
+
+def iter_items(source: str, defaults: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Itens a processar, lidos sob demanda a partir de um diretório, glob ou manifesto JSONL."""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                    yield dict(defaults, source=os.path.join(root, name), base=source)
+    elif source.endswith(".jsonl"):
+        with open(source, encoding="utf-8") as manifest:
+            for number, line in enumerate(manifest, start=1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                item = dict(defaults, base=None)
+                item.update({key: entry[key] for key in ("processing_type", "model", "format", "roi", "output") if key in entry})
+                item["source"] = entry.get("path") or entry.get("image_url") or entry.get("url")
+                if not item["source"]:
+                    raise ValueError(f"Linha {number} do manifesto sem `path` nem `image_url`.")
+                yield item
+    else:
+        base = _glob_base(source)
+        for path in sorted(glob.iglob(source, recursive=True)):
+            if os.path.isfile(path):
+                yield dict(defaults, source=path, base=base)
+
+
+def process_item(item: Dict[str, Any], output_dir: str, previous_key: Optional[str]) -> Dict[str, Any]:
+    """Processa um item no processo do pool; nunca levanta exceção, o erro vai no resultado."""
+    started = time.perf_counter()
+    result = {"source": item["source"], "output": None, "status": "ok"}
+    try:
+        fmt = negotiate_format(item.get("format"), None, has_alpha=False)
+        result["output"] = item.get("output") or _output_name(item["source"], item.get("base"), fmt)
+        if item["source"].startswith(("http://", "https://")):
+            image_bytes = _loop.run_until_complete(downloader.fetch(item["source"]))
+        else:
+            with open(item["source"], "rb") as f:
+                image_bytes = f.read()
+        digest = content_digest(image_bytes)
+        key = make_key("bulk", digest, processing_type=item["processing_type"], model_key=item["model"], roi=item["roi"], fmt=fmt)
+        result["key"] = key
+        output_path = os.path.join(output_dir, result["output"])
+        if key == previous_key and os.path.exists(output_path):
+            result["status"] = "skipped"
+        else:
+            data = _loop.run_until_complete(
+                process_image_bytes(image_bytes, item["processing_type"], item["model"], item["roi"], fmt, digest)
+            )
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+            tmp_path = f"{output_path}.tmp-{os.getpid()}"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, output_path)
+            result["bytes"] = len(data)
+    except OutputFormatError as e:
+        result.update(status="error", error=str(e))
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def load_checkpoint(path: str) -> Dict[str, str]:
+    """Chave (hash da entrada + parâmetros) do último resultado bem-sucedido de cada origem."""
+    done: Dict[str, str] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as checkpoint:
+        for line in checkpoint:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # última linha incompleta de uma execução interrompida
+            if entry.get("status") in ("ok", "skipped") and entry.get("key"):
+                done[entry["source"]] = entry["key"]
+            else:
+                done.pop(entry.get("source"), None)
+    return done
+
+
+def run(items: Iterator[Dict[str, Any]], output_dir: str, workers: int, checkpoint_path: str, report_every: float) -> Dict[str, Any]:
+    done = load_checkpoint(checkpoint_path)
+    if done:
+        logger.info("Checkpoint com %s item(ns) concluído(s): %s", len(done), checkpoint_path)
+    stats = {"processed": 0, "ok": 0, "skipped": 0, "error": 0}
+    started = last_report = time.perf_counter()
+
+    def report(final: bool = False) -> None:
+        elapsed = time.perf_counter() - started
+        rate = stats["processed"] / elapsed if elapsed > 0 else 0.0
+        logger.info(
+            "%s: %s item(ns) (%s ok, %s pulados, %s com erro) em %.1fs | %.2f img/s",
+            "Concluído" if final else "Progresso", stats["processed"], stats["ok"], stats["skipped"], stats["error"], elapsed, rate,
+        )
+
+    # Processos novos (spawn): MediaPipe e ONNX Runtime não são seguros para fork
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool, \
+            open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        pending: Set[Future] = set()
+
+        def collect(futures: Set[Future]) -> None:
+            nonlocal last_report
+            for future in futures:
+                result = future.result()
+                checkpoint.write(json.dumps(result, ensure_ascii=False) + "\n")
+                stats["processed"] += 1
+                stats[result["status"]] += 1
+                if result["status"] == "error":
+                    logger.warning("Falha em %s: %s", result['source'], result['error'])
+            checkpoint.flush()
+            if time.perf_counter() - last_report >= report_every:
+                last_report = time.perf_counter()
+                report()
+
+        for item in items:
+            # Poucos itens em voo por processo: a entrada é lida sob demanda
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            pending.add(pool.submit(process_item, item, output_dir, done.get(item["source"])))
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+
+    report(final=True)
+    elapsed = time.perf_counter() - started
+    stats.update(seconds=round(elapsed, 3), images_per_second=round(stats["processed"] / elapsed, 3) if elapsed > 0 else 0.0)
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="diretório, glob ou manifesto .jsonl")
+    parser.add_argument("--output", required=True, help="diretório de saída")
+    parser.add_argument("--type", dest="processing_type", choices=["crop", "remove_bg", "crop_remove_bg"], default="remove_bg")
+    parser.add_argument("--model", default="birefnet-general")
+    parser.add_argument("--format", dest="output_format", default=None, help="png, webp, avif ou jpeg (padrão: OUTPUT_DEFAULT_FORMAT)")
+    parser.add_argument("--roi", action=argparse.BooleanOptionalAction, default=None, help="segmenta apenas a região recortada")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processos em paralelo")
+    parser.add_argument("--checkpoint", default=None, help="arquivo de checkpoint (padrão: <output>/.bulk-checkpoint.jsonl)")
+    parser.add_argument("--report-every", type=float, default=10.0, help="intervalo, em segundos, do relatório de progresso")
+    parser.add_argument("--report", default=None, help="grava o resumo final (JSON) neste arquivo")
+    args = parser.parse_args()
+    if args.processing_type != "crop" and args.model not in MODELS:
+        parser.error(f"modelo '{args.model}' não suportado. Modelos disponíveis: {MODELS}")
+    try:
+        negotiate_format(args.output_format, None, has_alpha=False)
+    except OutputFormatError as e:
+        parser.error(str(e))
+    setup_logging()
+
+    workers = max(1, args.workers)
+    # Cada processo usa sua fatia dos núcleos; o cache em memória não ajuda em um lote de passagem única
+    os.environ.setdefault("ONNX_INTRA_OP_THREADS", str(max(1, (os.cpu_count() or 1) // workers)))
+    os.environ.setdefault("CPU_WORKERS", "1")
+    os.environ.setdefault("RESULT_CACHE_ENABLED", "false")
+    os.environ.setdefault("DOWNLOAD_CACHE_ENABLED", "false")
+
+    os.makedirs(args.output, exist_ok=True)
+    checkpoint_path = args.checkpoint or os.path.join(args.output, ".bulk-checkpoint.jsonl")
+    defaults = {"processing_type": args.processing_type, "model": args.model, "format": args.output_format, "roi": args.roi}
+    logger.info("Processando %s -> %s | Tipo: %s | Modelo: %s | Processos: %s", args.source, args.output, args.processing_type, args.model, workers)
+    stats = run(iter_items(args.source, defaults), args.output, workers, checkpoint_path, args.report_every)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+    sys.exit(1 if stats["error"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 import os
-from typing import List, Dict
+from typing import Any, List, Dict, Optional
 
 class Settings(BaseSettings):
     API_V1_PREFIX: str = "/api/v1"
@@ -12,9 +12,201 @@ class Settings(BaseSettings):
     LOG_TO_FILE: bool = os.getenv("LOG_TO_FILE", "true").lower() == "true"
     LOG_FILE_MAX_SIZE: int = int(os.getenv("LOG_FILE_MAX_SIZE", "10485760"))  # 10MB
     LOG_FILE_BACKUP_COUNT: int = int(os.getenv("LOG_FILE_BACKUP_COUNT", "5"))
+    # "text" (padrão) ou "json": uma linha JSON por registro, com id da requisição e etapas medidas
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")
+    # Registros aguardando a thread de escrita; com a fila cheia são descartados (0 = sem limite)
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # Fração das requisições cujos logs INFO/DEBUG são mantidos (avisos e erros sempre passam)
+    LOG_INFO_SAMPLE_RATE: float = float(os.getenv("LOG_INFO_SAMPLE_RATE", "1.0"))
     
+    # Modelo de remoção de fundo quando a requisição não informa um (/process-url/ e endpoint legado)
+    DEFAULT_MODEL: str = os.getenv("DEFAULT_MODEL", "birefnet-general")
+
     # Configurações de ONNX Runtime
     ONNX_PROVIDERS: List[str] = ["CPUExecutionProvider"]
+    # Threads por sessão (0 = padrão do ONNX Runtime, um por núcleo físico)
+    ONNX_INTRA_OP_THREADS: int = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+    ONNX_INTER_OP_THREADS: int = int(os.getenv("ONNX_INTER_OP_THREADS", "0"))
+    # "sequential" ou "parallel"
+    ONNX_EXECUTION_MODE: str = os.getenv("ONNX_EXECUTION_MODE", "sequential")
+    # "disabled", "basic", "extended" ou "all"
+    ONNX_GRAPH_OPTIMIZATION: str = os.getenv("ONNX_GRAPH_OPTIMIZATION", "all")
+    ONNX_ENABLE_MEM_ARENA: bool = os.getenv("ONNX_ENABLE_MEM_ARENA", "true").lower() == "true"
+    ONNX_ENABLE_MEM_PATTERN: bool = os.getenv("ONNX_ENABLE_MEM_PATTERN", "true").lower() == "true"
+    # Desligar evita espera ativa quando várias sessões dividem os mesmos núcleos
+    ONNX_ALLOW_SPINNING: bool = os.getenv("ONNX_ALLOW_SPINNING", "true").lower() == "true"
+    # Salva o grafo otimizado em disco e o reutiliza nos próximos carregamentos
+    ONNX_CACHE_OPTIMIZED_MODEL: bool = os.getenv("ONNX_CACHE_OPTIMIZED_MODEL", "false").lower() == "true"
+    # Diretório dos modelos otimizados e das variantes quantizadas
+    ONNX_MODEL_CACHE_DIR: str = os.getenv("ONNX_MODEL_CACHE_DIR", os.path.expanduser("~/.rembg/optimized"))
+    # Sobrescritas por modelo, ex.: {"birefnet-general": {"intra_op_threads": 8, "graph_optimization": "extended"}}
+    ONNX_MODEL_OPTIONS: Dict[str, Dict[str, Any]] = {}
+    # Variantes quantizadas selecionáveis como modelo, ex.: ["u2net-int8", "isnet-general-use-fp16"]
+    ONNX_QUANTIZED_VARIANTS: List[str] = []
+
+    # Configurações do executor de inferência
+    # Número de workers para trabalho de CPU (decodificação, recorte, encode)
+    CPU_WORKERS: int = int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+    # "thread" ou "process" (processos exigem funções e argumentos serializáveis)
+    CPU_EXECUTOR: str = os.getenv("CPU_EXECUTOR", "thread")
+    # Máximo de tarefas (em execução + aguardando) antes de responder 503
+    INFERENCE_QUEUE_SIZE: int = int(os.getenv("INFERENCE_QUEUE_SIZE", "32"))
+    # Inferências simultâneas por modelo (sobrescrevível por modelo)
+    MODEL_CONCURRENCY: int = int(os.getenv("MODEL_CONCURRENCY", "1"))
+    # Detecção de face: cada worker tem seu próprio detector MediaPipe
+    MODEL_CONCURRENCY_OVERRIDES: Dict[str, int] = {"mediapipe-face": min(4, os.cpu_count() or 1)}
+    # Valor do cabeçalho Retry-After (segundos) quando a fila está cheia
+    RETRY_AFTER_SECONDS: int = int(os.getenv("RETRY_AFTER_SECONDS", "5"))
+
+    # Configurações do cache de resultados (chave = hash da imagem + modelo + parâmetros)
+    RESULT_CACHE_ENABLED: bool = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    RESULT_CACHE_MAX_ITEMS: int = int(os.getenv("RESULT_CACHE_MAX_ITEMS", "256"))
+    RESULT_CACHE_MAX_BYTES: int = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+    # Diretório da camada em disco (desativada quando vazio)
+    RESULT_CACHE_DIR: Optional[str] = os.getenv("RESULT_CACHE_DIR") or None
+    RESULT_CACHE_DISK_MAX_BYTES: int = int(os.getenv("RESULT_CACHE_DISK_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+    # Assets (imagem original + máscara + face) para /assets/{id}/recompose; disco em RESULT_CACHE_DIR
+    ASSET_CACHE_ENABLED: bool = os.getenv("ASSET_CACHE_ENABLED", "true").lower() == "true"
+    ASSET_CACHE_MAX_ITEMS: int = int(os.getenv("ASSET_CACHE_MAX_ITEMS", "128"))
+    ASSET_CACHE_MAX_BYTES: int = int(os.getenv("ASSET_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+    # Micro-batching: agrupa requisições concorrentes do mesmo modelo em um único run do ONNX
+    MICRO_BATCH_ENABLED: bool = os.getenv("MICRO_BATCH_ENABLED", "false").lower() == "true"
+    MICRO_BATCH_MAX_SIZE: int = int(os.getenv("MICRO_BATCH_MAX_SIZE", "8"))
+    MICRO_BATCH_MAX_WAIT_MS: float = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "10"))
+    # Endpoint de lote: máximo de imagens por chamada e quantas processar em paralelo
+    BATCH_MAX_FILES: int = int(os.getenv("BATCH_MAX_FILES", "50"))
+    BATCH_REQUEST_CONCURRENCY: int = int(os.getenv("BATCH_REQUEST_CONCURRENCY", "8"))
+
+    # Entrada de imagens (uploads e URLs): bytes por arquivo e pixels (largura x altura),
+    # checados pelo cabeçalho antes de decodificar (0 = sem limite)
+    UPLOAD_MAX_BYTES: int = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+    UPLOAD_MAX_PIXELS: int = int(os.getenv("UPLOAD_MAX_PIXELS", str(64_000_000)))
+
+    # Controle de admissão: cada requisição custa o peso do modelo (u2netp = 1, sam = 20)
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "false").lower() == "true"
+    # Balde de tokens por cliente (cabeçalho ADMISSION_CLIENT_HEADER ou IP): unidades/s e saldo máximo
+    ADMISSION_CLIENT_RATE: float = float(os.getenv("ADMISSION_CLIENT_RATE", "20"))
+    ADMISSION_CLIENT_BURST: float = float(os.getenv("ADMISSION_CLIENT_BURST", "60"))
+    ADMISSION_CLIENT_HEADER: str = os.getenv("ADMISSION_CLIENT_HEADER", "X-Client-ID")
+    # Custo máximo em execução no nó; acima dele a requisição espera até ADMISSION_QUEUE_TIMEOUT (s)
+    ADMISSION_GLOBAL_BUDGET: float = float(os.getenv("ADMISSION_GLOBAL_BUDGET", "40"))
+    ADMISSION_QUEUE_TIMEOUT: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+    ADMISSION_MAX_WAITING: int = int(os.getenv("ADMISSION_MAX_WAITING", "64"))
+    # Sobrescritas do custo por modelo, ex.: {"birefnet-massive": 30}; modelos sem custo conhecido usam o padrão
+    ADMISSION_MODEL_COSTS: Dict[str, float] = {}
+    ADMISSION_DEFAULT_COST: float = float(os.getenv("ADMISSION_DEFAULT_COST", "4"))
+
+    # Download de imagens por URL
+    DOWNLOAD_TIMEOUT: float = float(os.getenv("DOWNLOAD_TIMEOUT", "30"))
+    DOWNLOAD_MAX_BYTES: int = int(os.getenv("DOWNLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+    DOWNLOAD_MAX_CONNECTIONS: int = int(os.getenv("DOWNLOAD_MAX_CONNECTIONS", "100"))
+    DOWNLOAD_PER_HOST_LIMIT: int = int(os.getenv("DOWNLOAD_PER_HOST_LIMIT", "4"))
+    # Cache por URL + ETag (usa os limites e o diretório do cache de resultados)
+    DOWNLOAD_CACHE_ENABLED: bool = os.getenv("DOWNLOAD_CACHE_ENABLED", "true").lower() == "true"
+
+    # Detecção de face sobre uma versão reduzida da imagem (maior lado, 0 = resolução original)
+    FACE_DETECTION_MAX_SIDE: int = int(os.getenv("FACE_DETECTION_MAX_SIDE", "640"))
+    # Decodificação reduzida de JPEG (draft) quando a detecção parte dos bytes
+    FACE_DETECTION_JPEG_DRAFT: bool = os.getenv("FACE_DETECTION_JPEG_DRAFT", "true").lower() == "true"
+    # Recortes de tamanho fixo a partir de JPEGs: detecta a face em uma decodificação
+    # reduzida e decodifica a imagem na menor escala (1/2, 1/4, 1/8) que ainda cobre a saída
+    CROP_JPEG_DRAFT: bool = os.getenv("CROP_JPEG_DRAFT", "true").lower() == "true"
+    # Máximo de faces recortadas por imagem em /crop-faces/
+    FACES_MAX_PER_IMAGE: int = int(os.getenv("FACES_MAX_PER_IMAGE", "20"))
+
+    # Refinamento de bordas (`alpha_matting=true` em /remove-bg/{model}): trimap a partir da máscara
+    # (limiares 0-255, erosão do primeiro plano e avanço sobre o fundo em px) e guided filter
+    # colorido com raio (px) e eps aplicados na imagem reduzida a ALPHA_MATTING_MAX_SIDE
+    ALPHA_MATTING_FOREGROUND_THRESHOLD: int = int(os.getenv("ALPHA_MATTING_FOREGROUND_THRESHOLD", "240"))
+    ALPHA_MATTING_BACKGROUND_THRESHOLD: int = int(os.getenv("ALPHA_MATTING_BACKGROUND_THRESHOLD", "10"))
+    ALPHA_MATTING_ERODE_SIZE: int = int(os.getenv("ALPHA_MATTING_ERODE_SIZE", "10"))
+    ALPHA_MATTING_DILATE_SIZE: int = int(os.getenv("ALPHA_MATTING_DILATE_SIZE", "10"))
+    ALPHA_MATTING_RADIUS: int = int(os.getenv("ALPHA_MATTING_RADIUS", "8"))
+    ALPHA_MATTING_EPS: float = float(os.getenv("ALPHA_MATTING_EPS", "0.00001"))
+    ALPHA_MATTING_MAX_SIDE: int = int(os.getenv("ALPHA_MATTING_MAX_SIDE", "256"))
+
+    # Segmentação apenas da região recortada (face + margem) nos endpoints que recortam;
+    # pode ser sobrescrita por requisição com ?roi=true|false
+    ROI_SEGMENTATION_ENABLED: bool = os.getenv("ROI_SEGMENTATION_ENABLED", "false").lower() == "true"
+    # Margem de contexto ao redor do recorte, relativa ao maior lado dele
+    ROI_MARGIN_RATIO: float = float(os.getenv("ROI_MARGIN_RATIO", "0.15"))
+
+    # Métricas Prometheus em /metrics e cabeçalhos Server-Timing/X-Processing-Time
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+    # Formato de saída quando o cliente não pede um (parâmetro `format` ou cabeçalho Accept):
+    # "png", "webp", "avif", "jpeg" ou "auto" (JPEG para recortes opacos, PNG com transparência);
+    # formato sem encoder no Pillow instalado cai para PNG, com aviso no log
+    OUTPUT_DEFAULT_FORMAT: str = os.getenv("OUTPUT_DEFAULT_FORMAT", "png")
+    # 0-9: níveis baixos codificam bem mais rápido, com arquivos um pouco maiores
+    PNG_COMPRESS_LEVEL: int = int(os.getenv("PNG_COMPRESS_LEVEL", "6"))
+    WEBP_QUALITY: int = int(os.getenv("WEBP_QUALITY", "90"))
+    WEBP_LOSSLESS: bool = os.getenv("WEBP_LOSSLESS", "false").lower() == "true"
+    # 0 (rápido) a 6 (menor arquivo)
+    WEBP_METHOD: int = int(os.getenv("WEBP_METHOD", "4"))
+    AVIF_QUALITY: int = int(os.getenv("AVIF_QUALITY", "70"))
+    # 0 (lento, menor arquivo) a 10 (rápido)
+    AVIF_SPEED: int = int(os.getenv("AVIF_SPEED", "8"))
+    JPEG_QUALITY: int = int(os.getenv("JPEG_QUALITY", "90"))
+
+    # Arquivos gerados: resultados de /process-url/ e dos jobs (temp_images) e imagens de
+    # depuração (debug_images). TTL em segundos e cota em bytes por diretório (0 = sem limite)
+    TEMP_IMAGES_TTL_SECONDS: float = float(os.getenv("TEMP_IMAGES_TTL_SECONDS", str(24 * 3600)))
+    TEMP_IMAGES_MAX_BYTES: int = int(os.getenv("TEMP_IMAGES_MAX_BYTES", str(1024 * 1024 * 1024)))
+    DEBUG_IMAGES_TTL_SECONDS: float = float(os.getenv("DEBUG_IMAGES_TTL_SECONDS", str(24 * 3600)))
+    DEBUG_IMAGES_MAX_BYTES: int = int(os.getenv("DEBUG_IMAGES_MAX_BYTES", str(100 * 1024 * 1024)))
+    # Intervalo da limpeza em segundo plano (0 desativa)
+    STORAGE_SWEEP_INTERVAL: float = float(os.getenv("STORAGE_SWEEP_INTERVAL", "300"))
+    # Gravações descartáveis (imagens de depuração) aguardando a thread de escrita
+    STORAGE_WRITE_QUEUE: int = int(os.getenv("STORAGE_WRITE_QUEUE", "64"))
+    # Fração das faces detectadas em /crop-round/ salvas como imagem de depuração (0 desativa, 1 = todas)
+    DEBUG_IMAGE_SAMPLE_RATE: float = float(os.getenv("DEBUG_IMAGE_SAMPLE_RATE", "0"))
+    # Maior lado da imagem de depuração (0 = resolução original)
+    DEBUG_IMAGE_MAX_SIDE: int = int(os.getenv("DEBUG_IMAGE_MAX_SIDE", "1024"))
+
+    # Destino dos resultados devolvidos por URL (/process-url/ e jobs): "local" (temp_images)
+    # ou "s3" (bucket compartilhado entre réplicas; exige boto3)
+    RESULT_STORAGE_BACKEND: str = os.getenv("RESULT_STORAGE_BACKEND", "local")
+    # URL pública de temp_images (ex.: nginx/CDN); vazio = /static/temp_images da própria API
+    RESULT_BASE_URL: Optional[str] = os.getenv("RESULT_BASE_URL") or None
+    S3_BUCKET: str = os.getenv("S3_BUCKET", "")
+    S3_PREFIX: str = os.getenv("S3_PREFIX", "results/")
+    # Endpoint de serviços compatíveis (ex.: MinIO em http://localhost:9000)
+    S3_ENDPOINT_URL: Optional[str] = os.getenv("S3_ENDPOINT_URL") or None
+    S3_REGION: Optional[str] = os.getenv("S3_REGION") or None
+    # Sem credenciais explícitas, vale a cadeia padrão do boto3 (variáveis AWS_*, perfil, IAM)
+    S3_ACCESS_KEY_ID: Optional[str] = os.getenv("S3_ACCESS_KEY_ID") or None
+    S3_SECRET_ACCESS_KEY: Optional[str] = os.getenv("S3_SECRET_ACCESS_KEY") or None
+    S3_PRESIGNED_URL_EXPIRES: int = int(os.getenv("S3_PRESIGNED_URL_EXPIRES", "3600"))
+    # URL pública do bucket/CDN; quando definida, substitui as URLs pré-assinadas
+    S3_PUBLIC_BASE_URL: Optional[str] = os.getenv("S3_PUBLIC_BASE_URL") or None
+    S3_MULTIPART_THRESHOLD_MB: int = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8"))
+    S3_MULTIPART_CHUNK_MB: int = int(os.getenv("S3_MULTIPART_CHUNK_MB", "8"))
+
+    # Fila de jobs assíncronos (/api/v1/jobs), persistida em SQLite
+    JOBS_DB_PATH: str = os.getenv("JOBS_DB_PATH", "jobs/jobs.db")
+    # "inline": workers no processo da API; "external": apenas `python -m src.worker` consome a fila
+    JOB_WORKER_MODE: str = os.getenv("JOB_WORKER_MODE", "inline")
+    # Jobs processados em paralelo por processo
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "1"))
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    # Jobs em "running" sem atualização há mais que isso voltam para a fila
+    JOB_STALE_SECONDS: float = float(os.getenv("JOB_STALE_SECONDS", "900"))
+    # Hosts aceitos em webhook_url (além de endereços de loopback)
+    JOB_WEBHOOK_ALLOWED_HOSTS: List[str] = ["localhost"]
+    JOB_WEBHOOK_TIMEOUT: float = float(os.getenv("JOB_WEBHOOK_TIMEOUT", "5"))
+
+    # Sessões de modelos
+    # Modelos carregados (e aquecidos) no startup; /health responde 503 até terminar.
+    # Via ambiente: PRELOAD_MODELS='["u2net", "isnet-general-use"]'
+    PRELOAD_MODELS: List[str] = []
+    MODEL_WARMUP: bool = os.getenv("MODEL_WARMUP", "true").lower() == "true"
+    # Orçamento de memória das sessões carregadas; as menos usadas são descartadas além dele
+    SESSION_MEMORY_BUDGET_MB: int = int(os.getenv("SESSION_MEMORY_BUDGET_MB", "4096"))
+    # /health/ready espera também o pré-carregamento de PRELOAD_MODELS (por padrão, só o startup)
+    READINESS_REQUIRES_MODELS: bool = os.getenv("READINESS_REQUIRES_MODELS", "false").lower() == "true"
 
     class Config:
         env_file = ".env"
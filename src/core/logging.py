@@ -1,71 +1,158 @@
-import logging
-import logging.handlers
-import os
+"""
+Logging fora do caminho das requisições: o root logger tem apenas um
+`QueueHandler`, que interpola a mensagem e a coloca em uma fila; uma thread
+(`QueueListener`) formata e grava nos handlers de console e arquivo, incluindo
+rotação. Quem emite o log paga microssegundos, nunca a escrita em disco.
+
+O handler da fila também anota cada registro com o id da requisição corrente
+(e, no formato JSON, as etapas já medidas) e aplica a amostragem de
+`LOG_INFO_SAMPLE_RATE`, decidida uma vez por requisição em `bind_request`.
+"""
+from contextvars import ContextVar
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import List, Optional, Tuple
+from src.core import metrics
 from src.core.config import settings
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import uuid
+
+# Requisição corrente: (id, logs INFO/DEBUG mantidos pela amostragem)
+_request: ContextVar[Optional[Tuple[str, bool]]] = ContextVar("log_request", default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+dropped_records = metrics.registry.counter(
+    "log_records_dropped_total", "Registros de log descartados (reason=sampled|queue_full).", ("reason",)
+)
+
+
+def bind_request(request_id: Optional[str] = None) -> str:
+    """Associa os próximos logs desta requisição a um id e sorteia se os INFO serão mantidos."""
+    request_id = request_id or uuid.uuid4().hex[:16]
+    rate = settings.LOG_INFO_SAMPLE_RATE
+    _request.set((request_id, rate >= 1 or random.random() < rate))
+    return request_id
+
+
+def current_request_id() -> Optional[str]:
+    context = _request.get()
+    return context[0] if context else None
+
+
+class RequestContextFilter(logging.Filter):
+    """Roda na thread que emite o log: anota a requisição e descarta INFO/DEBUG não amostrados."""
+
+    def __init__(self, include_stages: bool = False):
+        super().__init__()
+        self.include_stages = include_stages
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _request.get()
+        if context is None:
+            # Fora de requisições (startup, workers, limpeza): sempre registrado
+            record.request_id = None
+            return True
+        record.request_id, sampled = context
+        if not sampled and record.levelno <= logging.INFO:
+            dropped_records.inc(reason="sampled")
+            return False
+        if self.include_stages:
+            stages = metrics.current_stages()
+            if stages:
+                record.stages = {name: round(seconds * 1000, 1) for name, seconds in metrics.stage_totals(stages).items()}
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enfileira sem bloquear; com a fila cheia o registro é descartado e contado."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Só a interpolação acontece aqui (os argumentos podem mudar depois); traceback
+        # e formatação ficam para a thread do listener, que roda no mesmo processo
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_records.inc(reason="queue_full")
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com id da requisição e duração das etapas (ms) quando houver."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "function": f"{record.funcName}:{record.lineno}",
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        stages = getattr(record, "stages", None)
+        if stages:
+            entry["stages_ms"] = stages
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def build_handlers(level: int, log_dir: Path, json_format: bool = False) -> List[logging.Handler]:
+    """Handlers de console e arquivos (com rotação), usados pela thread do listener."""
+    if json_format:
+        file_formatter = console_formatter = JsonFormatter()
+    else:
+        # Formato detalhado para arquivos
+        file_formatter = logging.Formatter(
+            fmt="%(asctime)s | %(name)s | %(levelname)-8s | %(funcName)s:%(lineno)d | %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
+        # Formato simplificado para console
+        console_formatter = logging.Formatter(
+            fmt="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
+            datefmt="%H:%M:%S"
+        )
 
-def setup_logging():
-    """
-    Configura sistema de logging com:
-    - Rotação automática de arquivos
-    - Separação por níveis (info, error, debug)
-    - Formatação rica
-    - Logs no console para desenvolvimento
-    """
-    # Criar diretório de logs se não existir
-    log_dir = Path("logs")
-    log_dir.mkdir(exist_ok=True)
-    
-    # Configurar nível de log baseado no ambiente
-    level = logging.DEBUG if settings.DEBUG else logging.INFO
-    
-    # Formato detalhado para arquivos
-    file_formatter = logging.Formatter(
-        fmt="%(asctime)s | %(name)s | %(levelname)-8s | %(funcName)s:%(lineno)d | %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
-    
-    # Formato simplificado para console
-    console_formatter = logging.Formatter(
-        fmt="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
-        datefmt="%H:%M:%S"
-    )
-    
-    # Configurar root logger
-    root_logger = logging.getLogger()
-    root_logger.setLevel(level)
-    
-    # Limpar handlers existentes
-    root_logger.handlers.clear()
-    
     # 1. Handler para console (desenvolvimento)
     console_handler = logging.StreamHandler()
     console_handler.setLevel(level)
     console_handler.setFormatter(console_formatter)
-    root_logger.addHandler(console_handler)
-    
+    handlers: List[logging.Handler] = [console_handler]
+    if not settings.LOG_TO_FILE:
+        return handlers
+
     # 2. Handler para arquivo geral (INFO e acima) com rotação
     general_handler = logging.handlers.RotatingFileHandler(
         filename=log_dir / "app.log",
-        maxBytes=10 * 1024 * 1024,  # 10MB
-        backupCount=5,
+        maxBytes=settings.LOG_FILE_MAX_SIZE,
+        backupCount=settings.LOG_FILE_BACKUP_COUNT,
         encoding="utf-8"
     )
-    general_handler.setLevel(logging.INFO)
+    general_handler.setLevel(max(level, logging.INFO))
     general_handler.setFormatter(file_formatter)
-    root_logger.addHandler(general_handler)
-    
+    handlers.append(general_handler)
+
     # 3. Handler para erros (ERROR e CRITICAL) com rotação
     error_handler = logging.handlers.RotatingFileHandler(
         filename=log_dir / "errors.log",
         maxBytes=5 * 1024 * 1024,   # 5MB
-        backupCount=5,
+        backupCount=settings.LOG_FILE_BACKUP_COUNT,
         encoding="utf-8"
     )
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(file_formatter)
-    root_logger.addHandler(error_handler)
-    
+    handlers.append(error_handler)
+
     # 4. Handler para debug (apenas quando DEBUG=True) com rotação
     if settings.DEBUG:
         debug_handler = logging.handlers.RotatingFileHandler(
@@ -76,10 +163,70 @@ def setup_logging():
         )
         debug_handler.setLevel(logging.DEBUG)
         debug_handler.setFormatter(file_formatter)
-        root_logger.addHandler(debug_handler)
-    
+        handlers.append(debug_handler)
+    return handlers
+
+
+def _stop_listener(listener: logging.handlers.QueueListener) -> None:
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+def stop_logging() -> None:
+    """Grava o que ainda está na fila e encerra a thread do listener."""
+    global _listener
+    if _listener is not None:
+        _stop_listener(_listener)
+        _listener = None
+
+
+def setup_logging(log_dir: str = "logs"):
+    """
+    Configura sistema de logging com:
+    - Fila entre quem emite e os handlers (thread própria para escrita e rotação)
+    - Rotação automática de arquivos
+    - Separação por níveis (info, error, debug)
+    - Formatação rica (texto) ou JSON (`LOG_FORMAT=json`)
+    - Logs no console para desenvolvimento
+    """
+    # Criar diretório de logs se não existir
+    log_path = Path(log_dir)
+    if settings.LOG_TO_FILE:
+        log_path.mkdir(parents=True, exist_ok=True)
+
+    # Configurar nível de log baseado no ambiente
+    level = logging.DEBUG if settings.DEBUG else logging.getLevelName(settings.LOG_LEVEL.upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+    json_format = settings.LOG_FORMAT.lower() == "json"
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max(0, settings.LOG_QUEUE_SIZE))
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter(include_stages=json_format))
+
+    # Configurar root logger: apenas o handler da fila
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    root_logger.handlers.clear()
+    root_logger.addHandler(queue_handler)
+
+    # Uma nova configuração substitui a anterior, cujo listener esvazia a própria fila antes de parar
+    global _listener
+    previous, _listener = _listener, logging.handlers.QueueListener(
+        log_queue, *build_handlers(level, log_path, json_format), respect_handler_level=True
+    )
+    _listener.start()
+    if previous is not None:
+        _stop_listener(previous)
+
     # Log de inicialização
-    logging.info(f"Sistema de logging configurado - Nível: {logging.getLevelName(level)}")
-    logging.info(f"Logs sendo salvos em: {log_dir.absolute()}")
+    logging.info("Sistema de logging configurado - Nível: %s", logging.getLevelName(level))
+    if settings.LOG_TO_FILE:
+        logging.info("Logs sendo salvos em: %s", log_path.absolute())
     if settings.DEBUG:
         logging.debug("Modo DEBUG ativo - logs detalhados habilitados")
+
+
+# Esvazia a fila ao encerrar o processo
+atexit.register(stop_logging)
@@ -0,0 +1,227 @@
+"""
+Métricas no formato de texto do Prometheus (0.0.4), sem dependências externas.
+
+- `Counter`, `Gauge` e `Histogram` com rótulos, seguros entre threads;
+- `stage()` mede uma etapa do processamento, alimenta o histograma por etapa e
+  acumula a duração na requisição corrente (cabeçalho Server-Timing). O
+  acumulador vive em um ContextVar, que o executor propaga para as threads (no
+  pool de processos, as etapas do worker voltam com o resultado).
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import math
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+# Função que retorna [(rótulos, valor)] no momento da coleta
+Callback = Callable[[], Iterable[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callback] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Quando definido, os valores são lidos da função no momento da coleta
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Métrica '{self.name}' espera os rótulos {self.labelnames}, recebeu {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence[str], float]]:
+        if self.callback is not None:
+            return [(self.name, self.labelnames, self._key(labels), value) for labels, value in self.callback()]
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, self.labelnames, key, value) for key, value in items]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for name, labelnames, labelvalues, value in self.samples():
+            lines.append(f"{name}{_format_labels(labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por combinação de rótulos: contagem por bucket (+Inf no fim) e soma
+        self._buckets: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._buckets.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            entry = self._buckets.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._buckets.items())
+        names = self.labelnames + ("le",)
+        samples = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", names, key + (_format_value(bound),), cumulative))
+            samples.append((f"{self.name}_sum", self.labelnames, key, total))
+            samples.append((f"{self.name}_count", self.labelnames, key, cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica '{metric.name}' já registrada")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callback] = None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, callback))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callback] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+
+http_requests = registry.counter("http_requests_total", "Requisições HTTP atendidas.", ("method", "endpoint", "status"))
+http_errors = registry.counter("http_request_errors_total", "Requisições HTTP com status >= 400.", ("endpoint", "status"))
+http_in_progress = registry.gauge("http_requests_in_progress", "Requisições HTTP em andamento.")
+http_duration = registry.histogram("http_request_duration_seconds", "Duração das requisições HTTP.", ("endpoint",))
+stage_duration = registry.histogram("image_stage_duration_seconds", "Duração de cada etapa do processamento.", ("stage",))
+model_inferences = registry.counter("model_inferences_total", "Inferências por modelo (cache=hit dispensa o modelo).", ("model", "cache"))
+model_inference_duration = registry.histogram("model_inference_duration_seconds", "Tempo de execução do modelo.", ("model",))
+queue_wait = registry.histogram("executor_queue_wait_seconds", "Espera na fila até um worker do pool assumir a tarefa.", ("pool",))
+
+
+# Etapas medidas na requisição corrente: [(etapa, segundos)]
+_request_stages: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_stages", default=None)
+
+
+def start_request() -> List[Tuple[str, float]]:
+    """Inicia a coleta de etapas da requisição corrente e retorna o acumulador."""
+    stages: List[Tuple[str, float]] = []
+    _request_stages.set(stages)
+    return stages
+
+
+def record_stage(name: str, seconds: float) -> None:
+    stage_duration.observe(seconds, stage=name)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Mede o bloco como a etapa `name` (histograma + Server-Timing da requisição)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def stage_totals(stages: List[Tuple[str, float]]) -> Dict[str, float]:
+    """Segundos por etapa, somando as repetidas."""
+    totals: Dict[str, float] = {}
+    for name, seconds in list(stages):
+        totals[name] = totals.get(name, 0.0) + seconds
+    return totals
+
+
+def current_stages() -> Optional[List[Tuple[str, float]]]:
+    """Etapas já medidas na requisição corrente (None fora de uma requisição)."""
+    return _request_stages.get()
+
+
+def server_timing(stages: List[Tuple[str, float]], total: float) -> str:
+    """Valor do cabeçalho Server-Timing, somando etapas repetidas (durações em ms)."""
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stage_totals(stages).items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
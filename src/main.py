@@ -1,27 +1,71 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
 from fastapi.staticfiles import StaticFiles
 from src.core.config import settings
 from src.core.logging import setup_logging
 from src.api.v1.endpoints.image import router as image_router
+from src.api.v1.endpoints.batch import router as batch_router
+from src.api.v1.endpoints.jobs import router as jobs_router
+from src.api.v1.endpoints.faces import router as faces_router
+from src.api.metrics import router as metrics_router, metrics_middleware, request_context_middleware
+from src.api.limits import router as limits_router, admission, UploadLimitMiddleware
+from src.services.executor import inference_executor
+from src.services.download import downloader
+from src.services.background import session_manager
+from src.services.jobs import job_worker
+from src.services.storage import storage_sweeper, temp_storage
 from src.models.schemas import HealthResponse, RootResponse
 from fastapi.responses import JSONResponse
-import os
 
 setup_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nada pesado na importação: diretórios, modelos e workers sobem aqui
+    temp_storage.ensure()
+    # Em segundo plano: /health responde 503 até o warm-up terminar
+    session_manager.start_preload(warmup=settings.MODEL_WARMUP)
+    # Remove resultados e imagens de debug vencidos ou acima da cota
+    storage_sweeper.start()
+    # Com JOB_WORKER_MODE=external a fila é consumida apenas por `python -m src.worker`
+    if settings.JOB_WORKER_MODE == "inline" and settings.JOB_WORKERS > 0:
+        job_worker.start()
+    app.state.started = True
+    yield
+    app.state.started = False
+    await job_worker.stop()
+    storage_sweeper.stop()
+    await downloader.aclose()
+    inference_executor.shutdown()
+
 app = FastAPI(
     title=settings.APP_NAME,
     description="API para processamento de imagens (remoção de fundo, recorte, etc)",
     version="1.0.0",
+    lifespan=lifespan,
 )
+app.state.started = False
 
-# Configurar arquivos estáticos para servir imagens temporárias
-TEMP_DIR = "temp_images"
-os.makedirs(TEMP_DIR, exist_ok=True)
-app.mount(
-    "/static/temp_images", StaticFiles(directory=TEMP_DIR), name="temp_images"
-)
+# Arquivos estáticos para servir os resultados locais (com S3 a API não serve arquivos).
+# O diretório é criado no lifespan, por isso check_dir=False
+TEMP_DIR = temp_storage.path
+if settings.RESULT_STORAGE_BACKEND == "local":
+    app.mount("/static/temp_images", StaticFiles(directory=TEMP_DIR, check_dir=False), name="temp_images")
 
-app.include_router(image_router, prefix=settings.API_V1_PREFIX, tags=["Image"])
+# Processamento síncrono passa pelo controle de admissão (custo por modelo, ADMISSION_ENABLED)
+app.include_router(image_router, prefix=settings.API_V1_PREFIX, tags=["Image"], dependencies=[Depends(admission)])
+app.include_router(batch_router, prefix=settings.API_V1_PREFIX, tags=["Batch"], dependencies=[Depends(admission)])
+app.include_router(jobs_router, prefix=settings.API_V1_PREFIX, tags=["Jobs"])
+app.include_router(faces_router, prefix=settings.API_V1_PREFIX, tags=["Faces"], dependencies=[Depends(admission)])
+app.include_router(limits_router, prefix=settings.API_V1_PREFIX, tags=["Admission"])
+
+if settings.METRICS_ENABLED:
+    app.middleware("http")(metrics_middleware)
+    app.include_router(metrics_router, tags=["Metrics"])
+# Uploads acima do limite são recusados antes ou durante a leitura do corpo
+app.add_middleware(UploadLimitMiddleware)
+# Registrado por último: envolve os demais, então todo log da requisição leva o id
+app.middleware("http")(request_context_middleware)
 
 @app.get("/", response_model=RootResponse, summary="Informações da API")
 def root():
@@ -33,7 +77,15 @@ def root():
             "/api/v1/remove-bg-crop/{model}",
             "/api/v1/process-url/",
             "/api/v1/remove-bg-and-crop-round/",
+            "/api/v1/models/loaded",
+            "/api/v1/jobs",
+            "/api/v1/detect-faces/",
+            "/api/v1/crop-faces/",
+            "/api/v1/assets/{asset_id}/recompose",
+            "/api/v1/admission/usage",
             "/health",
+            "/health/live",
+            "/health/ready",
         ],
         models=[
             "u2net",
@@ -55,4 +107,22 @@ def root():
 
 @app.get("/health", response_model=HealthResponse, summary="Healthcheck")
 def health():
+    if not session_manager.ready:
+        return JSONResponse(status_code=503, content=HealthResponse(status="warming_up").model_dump())
+    return HealthResponse(status="ok")
+
+
+@app.get("/health/live", response_model=HealthResponse, summary="Liveness")
+def health_live():
+    # Só indica que o processo responde; não depende de modelos nem do startup
+    return HealthResponse(status="ok")
+
+@app.get("/health/ready", response_model=HealthResponse, summary="Readiness")
+def health_ready():
+    # Pronto assim que o lifespan sobe: recortes e rotas baratas não esperam os modelos,
+    # que carregam sob demanda (ou antes, com READINESS_REQUIRES_MODELS)
+    if not app.state.started:
+        return JSONResponse(status_code=503, content=HealthResponse(status="starting").model_dump())
+    if settings.READINESS_REQUIRES_MODELS and not session_manager.ready:
+        return JSONResponse(status_code=503, content=HealthResponse(status="warming_up").model_dump())
     return HealthResponse(status="ok")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Any, Dict, List, Optional
 
 class HealthResponse(BaseModel):
     status: str
@@ -8,3 +8,46 @@ class RootResponse(BaseModel):
     message: str
     endpoints: List[str]
     models: List[str]
+
+class CacheStatsResponse(BaseModel):
+    results: Dict[str, Any]
+    masks: Dict[str, Any]
+    assets: Dict[str, Any]
+
+class LoadedModelsResponse(BaseModel):
+    ready: bool
+    total_bytes: int
+    budget_bytes: int
+    models: List[Dict[str, Any]]
+    errors: Dict[str, str]
+
+class AdmissionUsageResponse(BaseModel):
+    enabled: bool
+    global_budget: float
+    in_flight: float
+    waiting: int
+    clients: int
+    client: Dict[str, Any]
+
+class FaceBox(BaseModel):
+    x: int
+    y: int
+    width: int
+    height: int
+    confidence: float
+
+class FacesResponse(BaseModel):
+    width: int
+    height: int
+    faces: List[FaceBox]
+
+class JobResponse(BaseModel):
+    id: str
+    status: str
+    processing_type: str
+    model: str
+    attempts: int
+    created_at: str
+    updated_at: str
+    result_url: Optional[str] = None
+    error: Optional[str] = None
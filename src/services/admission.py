@@ -0,0 +1,277 @@
+"""
+Controle de admissão pelo custo de cada modelo.
+
+Os modelos custam muito diferente (`u2netp` contra `birefnet-massive` ou `sam`),
+então cada requisição é cobrada em "unidades de custo" (`MODEL_COSTS`, com
+sobrescritas em `ADMISSION_MODEL_COSTS`) em dois níveis:
+
+- balde de tokens por cliente (`ADMISSION_CLIENT_RATE` unidades/s, até
+  `ADMISSION_CLIENT_BURST`): sem saldo, 429 com `Retry-After`. Um lote caro
+  pode deixar o saldo negativo, e o cliente espera mais pela próxima chamada;
+- orçamento global de custo em execução (`ADMISSION_GLOBAL_BUDGET`): acima dele
+  a requisição espera em uma fila FIFO por até `ADMISSION_QUEUE_TIMEOUT`
+  segundos e, depois disso (ou com `ADMISSION_MAX_WAITING` já esperando), 503.
+"""
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional
+from src.core import metrics
+from src.core.config import settings
+from src.services.onnx_options import base_model_key
+import asyncio
+import math
+import threading
+import time
+
+# Custo relativo de uma inferência por modelo (u2netp = 1)
+MODEL_COSTS: Dict[str, float] = {
+    "mediapipe-face": 1,
+    "u2netp": 1,
+    "silueta": 1,
+    "u2net": 4,
+    "u2net_human_seg": 4,
+    "u2net_cloth_seg": 5,
+    "isnet-general-use": 5,
+    "isnet-anime": 5,
+    "birefnet-general-lite": 6,
+    "bria-rmbg": 10,
+    "birefnet-general": 12,
+    "birefnet-portrait": 12,
+    "birefnet-dis": 12,
+    "birefnet-massive": 20,
+    "sam": 20,
+}
+
+
+def model_cost(model_key: str) -> float:
+    """Custo de uma inferência de `model_key`; variantes quantizadas usam o do modelo base."""
+    overrides = settings.ADMISSION_MODEL_COSTS
+    for key in (model_key, base_model_key(model_key)):
+        if key in overrides:
+            return float(overrides[key])
+        if key in MODEL_COSTS:
+            return float(MODEL_COSTS[key])
+    return float(settings.ADMISSION_DEFAULT_COST)
+
+
+class AdmissionError(Exception):
+    """Requisição recusada pela admissão; 429 (cota do cliente) ou 503 (orçamento global)."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Bucket:
+    tokens: float
+    updated: float
+
+
+@dataclass
+class _Waiter:
+    in_flight: float
+    future: "asyncio.Future[None]"
+    granted: bool = False
+
+
+@dataclass
+class Ticket:
+    """Custo reservado no orçamento global; devolvido em `release`."""
+    client: str
+    cost: float
+    in_flight: float
+
+
+class AdmissionController:
+    """
+    Baldes de tokens por cliente e orçamento global de custo em execução.
+
+    O estado é protegido por um lock comum (as requisições podem vir de event
+    loops diferentes); quem espera pelo orçamento aguarda um future do próprio
+    loop, resolvido com `call_soon_threadsafe` quando há espaço.
+    """
+
+    # Acima deste número de clientes, os baldes já cheios (inativos) são descartados
+    MAX_IDLE_CLIENTS = 1024
+
+    def __init__(
+        self,
+        client_rate: float = 20.0,
+        client_burst: float = 60.0,
+        global_budget: float = 40.0,
+        queue_timeout: float = 10.0,
+        max_waiting: int = 64,
+        retry_after: int = 5,
+    ):
+        self.client_rate = max(client_rate, 0.001)
+        self.client_burst = max(client_burst, 1.0)
+        self.global_budget = max(global_budget, 1.0)
+        self.queue_timeout = queue_timeout
+        self.max_waiting = max(0, max_waiting)
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, _Bucket] = {}
+        self._in_flight = 0.0
+        self._waiters: Deque[_Waiter] = deque()
+
+    @classmethod
+    def from_settings(cls) -> "AdmissionController":
+        return cls(
+            client_rate=settings.ADMISSION_CLIENT_RATE,
+            client_burst=settings.ADMISSION_CLIENT_BURST,
+            global_budget=settings.ADMISSION_GLOBAL_BUDGET,
+            queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+            max_waiting=settings.ADMISSION_MAX_WAITING,
+            retry_after=settings.RETRY_AFTER_SECONDS,
+        )
+
+    @property
+    def in_flight(self) -> float:
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _refill(self, client: str, now: float) -> _Bucket:
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_IDLE_CLIENTS:
+                self._prune(now)
+            bucket = self._buckets[client] = _Bucket(self.client_burst, now)
+        else:
+            bucket.tokens = min(self.client_burst, bucket.tokens + (now - bucket.updated) * self.client_rate)
+            bucket.updated = now
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        for client, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * self.client_rate >= self.client_burst:
+                del self._buckets[client]
+
+    def _charge(self, client: str, cost: float) -> None:
+        with self._lock:
+            bucket = self._refill(client, time.monotonic())
+            # Basta ter saldo para o custo (limitado ao burst); o restante vira débito
+            needed = min(cost, self.client_burst)
+            if bucket.tokens < needed:
+                retry_after = math.ceil((needed - bucket.tokens) / self.client_rate)
+                rejected.inc(reason="client_quota")
+                raise AdmissionError(
+                    f"Cota do cliente excedida (custo {cost:g}, saldo {max(bucket.tokens, 0):.1f}).",
+                    status_code=429,
+                    retry_after=max(1, retry_after),
+                )
+            bucket.tokens -= cost
+
+    def _refund(self, client: str, cost: float) -> None:
+        with self._lock:
+            bucket = self._refill(client, time.monotonic())
+            bucket.tokens = min(self.client_burst, bucket.tokens + cost)
+
+    def _grant_waiters(self) -> None:
+        # Chamado com o lock: atende em ordem (FIFO) enquanto couber no orçamento
+        while self._waiters:
+            waiter = self._waiters[0]
+            if self._in_flight + waiter.in_flight > self.global_budget:
+                break
+            self._waiters.popleft()
+            self._in_flight += waiter.in_flight
+            waiter.granted = True
+            waiter.future.get_loop().call_soon_threadsafe(_resolve, waiter.future)
+
+    async def acquire(self, client: str, model_key: str, units: int = 1, parallel: int = 1) -> Ticket:
+        """
+        Cobra `units` inferências de `model_key` do cliente e reserva no orçamento
+        global o custo de até `parallel` delas em execução simultânea.
+        """
+        unit_cost = model_cost(model_key)
+        cost = unit_cost * max(1, units)
+        # Uma requisição maior que o orçamento inteiro roda sozinha
+        in_flight = min(unit_cost * max(1, min(units, parallel)), self.global_budget)
+        self._charge(client, cost)
+        ticket = Ticket(client=client, cost=cost, in_flight=in_flight)
+        with self._lock:
+            if not self._waiters and self._in_flight + in_flight <= self.global_budget:
+                self._in_flight += in_flight
+                return ticket
+            if len(self._waiters) >= self.max_waiting or self.queue_timeout <= 0:
+                waiter = None
+            else:
+                waiter = _Waiter(in_flight, asyncio.get_running_loop().create_future())
+                self._waiters.append(waiter)
+        if waiter is not None:
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+                metrics.record_stage("admission_wait", time.perf_counter() - started)
+                return ticket
+            except asyncio.TimeoutError:
+                if self._abandon(waiter):
+                    return ticket  # concedido no limite do tempo
+            except BaseException:
+                # Cliente desistiu: devolve a reserva se ela já tinha sido concedida
+                if self._abandon(waiter):
+                    self.release(ticket)
+                self._refund(client, cost)
+                raise
+        self._refund(client, cost)
+        rejected.inc(reason="global_budget")
+        raise AdmissionError("Servidor ocupado, tente novamente em instantes.", status_code=503, retry_after=self.retry_after)
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Sai da fila de espera; True se a reserva já tinha sido concedida."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def release(self, ticket: Ticket) -> None:
+        with self._lock:
+            self._in_flight = max(0.0, self._in_flight - ticket.in_flight)
+            self._grant_waiters()
+
+    def usage(self, client: Optional[str] = None) -> Dict[str, Any]:
+        """Uso atual do orçamento global e, se informado, o saldo do cliente."""
+        with self._lock:
+            report: Dict[str, Any] = {
+                "enabled": settings.ADMISSION_ENABLED,
+                "global_budget": self.global_budget,
+                "in_flight": round(self._in_flight, 3),
+                "waiting": len(self._waiters),
+                "clients": len(self._buckets),
+            }
+            if client is not None:
+                bucket = self._refill(client, time.monotonic())
+                report["client"] = {
+                    "id": client,
+                    "tokens": round(bucket.tokens, 3),
+                    "burst": self.client_burst,
+                    "rate_per_second": self.client_rate,
+                }
+        return report
+
+
+def _resolve(future: "asyncio.Future[None]") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+admission_controller = AdmissionController.from_settings()
+
+rejected = metrics.registry.counter(
+    "admission_rejected_total", "Requisições recusadas pela admissão (reason=client_quota|global_budget).", ("reason",)
+)
+metrics.registry.gauge(
+    "admission_in_flight_cost",
+    "Custo das requisições em execução (limite: ADMISSION_GLOBAL_BUDGET).",
+    callback=lambda: [({}, admission_controller.in_flight)],
+)
+metrics.registry.gauge(
+    "admission_waiting_requests",
+    "Requisições aguardando espaço no orçamento global.",
+    callback=lambda: [({}, admission_controller.waiting)],
+)
@@ -0,0 +1,97 @@
+"""
+Intermediários reaproveitáveis de um processamento ("assets"): a imagem
+original, a máscara alfa (PNG 8 bits) e a face detectada, guardados sob um id
+devolvido pela primeira chamada. `/assets/{id}/recompose` aplica outro
+recorte, forma, tamanho ou fundo sobre eles sem detecção nem inferência.
+
+O id deriva do hash da imagem e dos parâmetros que influenciam a máscara, então
+repetir a mesma chamada devolve o mesmo asset. O armazenamento é um
+`ResultCache` próprio (memória + disco em `RESULT_CACHE_DIR`), com limites em
+`ASSET_CACHE_MAX_ITEMS`/`ASSET_CACHE_MAX_BYTES`; assets descartados voltam a
+ser criados na próxima chamada ao endpoint de origem.
+"""
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+from src.core.config import settings
+from src.services.cache import ResultCache, cache_from_settings, make_key
+import json
+import struct
+
+Box = Tuple[int, int, int, int]
+
+# Tamanho do cabeçalho JSON (uint32 big-endian) no início do asset serializado
+_HEADER = struct.Struct(">I")
+
+
+@dataclass(frozen=True)
+class Asset:
+    """
+    `face_coords` e `mask` estão no sistema de coordenadas da imagem decodificada
+    com redução `reduce` (JPEG `draft`) e recortada em `region`, quando houver.
+    """
+    image_bytes: bytes
+    face_coords: Box
+    reduce: int = 1
+    region: Optional[Box] = None
+    mask: Optional[bytes] = None
+    model: Optional[str] = None
+
+    def pack(self) -> bytes:
+        mask = self.mask or b""
+        header = json.dumps({
+            "face_coords": list(self.face_coords),
+            "reduce": self.reduce,
+            "region": list(self.region) if self.region else None,
+            "model": self.model,
+            "image_bytes": len(self.image_bytes),
+            "mask_bytes": len(mask),
+        }).encode("utf-8")
+        return _HEADER.pack(len(header)) + header + self.image_bytes + mask
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "Asset":
+        (header_size,) = _HEADER.unpack_from(data)
+        start = _HEADER.size + header_size
+        header = json.loads(data[_HEADER.size:start])
+        image_end = start + header["image_bytes"]
+        return cls(
+            image_bytes=data[start:image_end],
+            face_coords=tuple(header["face_coords"]),
+            reduce=header["reduce"],
+            region=tuple(header["region"]) if header["region"] else None,
+            mask=data[image_end:image_end + header["mask_bytes"]] or None,
+            model=header["model"],
+        )
+
+
+def asset_id(origin: str, digest: str, **params: Any) -> str:
+    """Id estável do asset: hash da imagem, endpoint de origem e parâmetros da máscara."""
+    return make_key("asset", digest, origin=origin, **params)[:32]
+
+
+class AssetStore:
+    def __init__(self, cache: ResultCache):
+        self.cache = cache
+
+    @classmethod
+    def from_settings(cls) -> "AssetStore":
+        return cls(cache_from_settings(
+            "assets",
+            max_items=settings.ASSET_CACHE_MAX_ITEMS,
+            max_bytes=settings.ASSET_CACHE_MAX_BYTES,
+            enabled=settings.ASSET_CACHE_ENABLED,
+        ))
+
+    @property
+    def enabled(self) -> bool:
+        return self.cache.enabled
+
+    def save(self, key: str, asset: Asset) -> None:
+        self.cache.set(key, asset.pack())
+
+    def get(self, key: str) -> Optional[Asset]:
+        data = self.cache.get(key)
+        return Asset.unpack(data) if data is not None else None
+
+
+asset_store = AssetStore.from_settings()
@@ -1,25 +1,129 @@
-from rembg import new_session, remove
-from functools import lru_cache
-from typing import Any
+from typing import Any, Dict, List
+from PIL import Image
+from src.core import metrics
 from src.core.config import settings
+from src.services.batching import MicroBatcher
+from src.services.cache import cache_from_settings, make_key
+from src.services.matting import refine_mask
+from src.services.onnx_options import create_session
+from src.services.sessions import SessionManager
+from src.utils.frame import ImageFrame
+import io
 import logging
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
-@lru_cache(maxsize=8)
+# Máscaras por (hash da imagem, modelo): acertos dispensam a inferência
+mask_cache = cache_from_settings("masks")
+
+_batchers: Dict[str, MicroBatcher] = {}
+_batchers_lock = threading.Lock()
+
+session_manager = SessionManager(
+    create_session,
+    memory_budget_bytes=settings.SESSION_MEMORY_BUDGET_MB * 1024 * 1024,
+    preload_models=settings.PRELOAD_MODELS,
+)
+
+metrics.registry.gauge(
+    "model_session_bytes",
+    "Memória estimada de cada sessão de modelo carregada.",
+    ("model",),
+    callback=lambda: [({"model": item["name"]}, item["size_bytes"]) for item in session_manager.loaded()],
+)
+
 def get_session(model_key: str) -> Any:
+    """Retorna a sessão do modelo, carregada sob o orçamento de memória do `session_manager`."""
+    return session_manager.get(model_key)
+
+def get_batcher(model_key: str) -> MicroBatcher:
+    """Retorna (criando se necessário) o micro-batcher do modelo."""
+    with _batchers_lock:
+        batcher = _batchers.get(model_key)
+        if batcher is None:
+            batcher = MicroBatcher(
+                model_key,
+                get_session,
+                max_batch_size=settings.MICRO_BATCH_MAX_SIZE,
+                max_wait_ms=settings.MICRO_BATCH_MAX_WAIT_MS,
+            )
+            _batchers[model_key] = batcher
+        return batcher
+
+def predict_masks(frame: ImageFrame, model_key: str) -> List[Image.Image]:
+    """
+    Executa o modelo e retorna as máscaras (modo "L") no tamanho da imagem.
+    A maioria dos modelos retorna uma única máscara; u2net_cloth_seg retorna uma por classe.
     """
-    Cria e cacheia uma sessão do rembg, deixando a biblioteca
-    gerenciar o download e o cache dos modelos.
+    key = make_key("mask", frame.digest, model_key=model_key) if frame.digest else None
+    if key is not None:
+        cached = mask_cache.get(key)
+        if cached is not None:
+            metrics.model_inferences.inc(model=model_key, cache="hit")
+            return unstack_masks(cached, frame.size)
+
+    started = time.perf_counter()
+    with metrics.stage("inference"):
+        if settings.MICRO_BATCH_ENABLED:
+            masks = get_batcher(model_key).predict(frame)
+        else:
+            masks = get_session(model_key).predict(frame.rgb_image)
+    metrics.model_inferences.inc(model=model_key, cache="miss")
+    metrics.model_inference_duration.observe(time.perf_counter() - started, model=model_key)
+    if key is not None:
+        mask_cache.set(key, stack_masks(masks))
+    return masks
+
+def stack_masks(masks: List[Image.Image]) -> bytes:
+    """Serializa as máscaras empilhadas verticalmente em um único PNG 8 bits."""
+    width, height = masks[0].size
+    stacked = Image.new("L", (width, height * len(masks)))
+    for i, mask in enumerate(masks):
+        stacked.paste(mask, (0, i * height))
+    output = io.BytesIO()
+    stacked.save(output, format="PNG", compress_level=1)
+    return output.getvalue()
+
+def unstack_masks(data: bytes, size) -> List[Image.Image]:
+    stacked = Image.open(io.BytesIO(data))
+    stacked.load()
+    width, height = size
+    count = max(1, stacked.height // height)
+    return [stacked.crop((0, i * height, width, (i + 1) * height)) for i in range(count)]
+
+def apply_mask(frame: ImageFrame, mask: Image.Image) -> Image.Image:
+    """Recorta o primeiro plano: pixels fora da máscara ficam transparentes."""
+    empty = Image.new("RGBA", frame.size, 0)
+    return Image.composite(frame.rgba_image, empty, mask)
+
+def compose_cutout(frame: ImageFrame, masks: List[Image.Image]) -> Image.Image:
+    """Recortes de cada máscara; com várias, empilhados verticalmente (como no rembg)."""
+    with metrics.stage("composite"):
+        cutouts = [apply_mask(frame, mask) for mask in masks]
+        if len(cutouts) == 1:
+            return cutouts[0]
+        stacked = Image.new("RGBA", (frame.width, frame.height * len(cutouts)))
+        for i, cutout in enumerate(cutouts):
+            stacked.paste(cutout, (0, i * frame.height))
+        return stacked
+
+def remove_bg(frame: ImageFrame, model_key: str, alpha_matting: bool = False, post_process_mask: bool = False) -> Image.Image:
     """
-    logger.info(f"Carregando modelo padrão '{model_key}' via rembg.")
-    return new_session(model_key, providers=settings.ONNX_PROVIDERS)
+    Remove o fundo de uma imagem já decodificada. `post_process_mask` e
+    `alpha_matting` refinam a máscara do modelo (ver `src/services/matting.py`).
 
-def remove_bg(image_bytes: bytes, model_key: str) -> bytes:
-    session = get_session(model_key)
+    Returns:
+        Image.Image: Imagem RGBA em memória. Quando o modelo retorna várias
+        máscaras, os recortes são empilhados verticalmente (como no rembg).
+    """
     try:
-        output = remove(image_bytes, session=session)
-        return output
+        masks = predict_masks(frame, model_key)
+        if alpha_matting or post_process_mask:
+            with metrics.stage("matting"):
+                masks = [refine_mask(frame, mask, alpha_matting, post_process_mask) for mask in masks]
+        return compose_cutout(frame, masks)
     except Exception as e:
-        logger.error(f"Erro durante a remoção de fundo com o modelo '{model_key}': {e}", exc_info=True)
+        logger.error("Erro durante a remoção de fundo com o modelo '%s': %s", model_key, e, exc_info=True)
         raise RuntimeError(f"Erro ao remover fundo: {e}")
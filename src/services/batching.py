@@ -0,0 +1,166 @@
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Tuple
+from PIL import Image
+from src.services.onnx_options import base_model_key
+from src.utils.frame import ImageFrame
+import logging
+import numpy as np
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+@dataclass(frozen=True)
+class BatchSpec:
+    """Pré e pós-processamento de um modelo rembg de saída única."""
+    mean: Tuple[float, float, float]
+    std: Tuple[float, float, float]
+    size: Tuple[int, int]
+    sigmoid: bool = False
+
+
+# Modelos cujo predict() do rembg é um normalize + run + min-max e que, portanto,
+# podem ser agrupados em um único run do ONNX. u2net_cloth_seg (várias classes)
+# e sam (prompts) ficam de fora.
+BATCH_SPECS = {
+    "u2net": BatchSpec(IMAGENET_MEAN, IMAGENET_STD, (320, 320)),
+    "u2netp": BatchSpec(IMAGENET_MEAN, IMAGENET_STD, (320, 320)),
+    "u2net_human_seg": BatchSpec(IMAGENET_MEAN, IMAGENET_STD, (320, 320)),
+    "silueta": BatchSpec(IMAGENET_MEAN, IMAGENET_STD, (320, 320)),
+    "isnet-general-use": BatchSpec((0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (1024, 1024)),
+    "isnet-anime": BatchSpec(IMAGENET_MEAN, (1.0, 1.0, 1.0), (1024, 1024)),
+    "bria-rmbg": BatchSpec(IMAGENET_MEAN, IMAGENET_STD, (1024, 1024)),
+    "birefnet-general": BatchSpec(IMAGENET_MEAN, IMAGENET_STD, (1024, 1024), sigmoid=True),
+    "birefnet-general-lite": BatchSpec(IMAGENET_MEAN, IMAGENET_STD, (1024, 1024), sigmoid=True),
+    "birefnet-portrait": BatchSpec(IMAGENET_MEAN, IMAGENET_STD, (1024, 1024), sigmoid=True),
+    "birefnet-dis": BatchSpec(IMAGENET_MEAN, IMAGENET_STD, (1024, 1024), sigmoid=True),
+    "birefnet-massive": BatchSpec(IMAGENET_MEAN, IMAGENET_STD, (1024, 1024), sigmoid=True),
+}
+
+
+def batch_spec(model_key: str) -> Optional[BatchSpec]:
+    """Spec do modelo; variantes quantizadas usam a do modelo base."""
+    return BATCH_SPECS.get(base_model_key(model_key))
+
+
+def normalize(frame: ImageFrame, spec: BatchSpec) -> np.ndarray:
+    """Equivalente vetorizado de `BaseSession.normalize` do rembg (CHW float32)."""
+    im = np.asarray(frame.rgb_image.resize(spec.size, Image.Resampling.LANCZOS), dtype=np.float32)
+    im /= max(float(im.max()), 1e-6)
+    im -= np.asarray(spec.mean, dtype=np.float32)
+    im /= np.asarray(spec.std, dtype=np.float32)
+    return im.transpose((2, 0, 1))
+
+
+def supports_dynamic_batch(session: Any) -> bool:
+    """True quando a primeira dimensão da entrada do modelo ONNX é simbólica."""
+    try:
+        batch_dim = session.inner_session.get_inputs()[0].shape[0]
+    except Exception:
+        return False
+    return not isinstance(batch_dim, int) or batch_dim < 1
+
+
+def predict_batch(session: Any, spec: BatchSpec, frames: List[ImageFrame]) -> List[List[Image.Image]]:
+    """Executa o modelo uma única vez para todas as imagens do lote."""
+    input_name = session.inner_session.get_inputs()[0].name
+    batch = np.stack([normalize(frame, spec) for frame in frames])
+    preds = session.inner_session.run(None, {input_name: batch})[0][:, 0, :, :]
+    if spec.sigmoid:
+        preds = 1 / (1 + np.exp(-preds))
+    results = []
+    for frame, pred in zip(frames, preds):
+        # Min-max por imagem, como o rembg faz no caso não agrupado
+        mi, ma = pred.min(), pred.max()
+        pred = (pred - mi) / max(ma - mi, 1e-6)
+        mask = Image.fromarray((pred.clip(0, 1) * 255).astype("uint8"), mode="L")
+        results.append([mask.resize(frame.size, Image.Resampling.LANCZOS)])
+    return results
+
+
+class MicroBatcher:
+    """
+    Agrupa pedidos concorrentes de um mesmo modelo em um único run do ONNX.
+
+    Uma thread dedicada espera o primeiro pedido e, a partir dele, acumula
+    outros por até `max_wait_ms` ou até `max_batch_size` itens. Modelos sem
+    `BatchSpec` ou com dimensão de lote fixa no ONNX são executados um a um
+    pela mesma thread.
+    """
+
+    def __init__(self, model_key: str, session_factory: Callable[[str], Any], max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.model_key = model_key
+        self.session_factory = session_factory
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.spec: Optional[BatchSpec] = batch_spec(model_key)
+        self.batches = 0
+        self.items = 0
+        self._queue: "queue.Queue[Optional[Tuple[ImageFrame, Future]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=f"batcher-{model_key}", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame: ImageFrame) -> "Future[List[Image.Image]]":
+        future: "Future[List[Image.Image]]" = Future()
+        self._queue.put((frame, future))
+        return future
+
+    def predict(self, frame: ImageFrame) -> List[Image.Image]:
+        """Versão bloqueante de `submit`, para uso dentro das threads do executor."""
+        return self.submit(frame).result()
+
+    def close(self) -> None:
+        self._queue.put(None)
+
+    def _collect(self, first: Tuple[ImageFrame, Future]) -> Tuple[List[Tuple[ImageFrame, Future]], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, closing = self._collect(first)
+            pending = [(frame, future) for frame, future in batch if future.set_running_or_notify_cancel()]
+            if pending:
+                self._run(pending)
+            if closing:
+                return
+
+    def _run(self, batch: List[Tuple[ImageFrame, Future]]) -> None:
+        frames = [frame for frame, _ in batch]
+        try:
+            session = self.session_factory(self.model_key)
+            if self.spec is not None and len(frames) > 1 and supports_dynamic_batch(session):
+                results = predict_batch(session, self.spec, frames)
+            else:
+                results = [session.predict(frame.rgb_image) for frame in frames]
+        except Exception as e:
+            logger.error("Erro no lote de %s imagem(ns) do modelo '%s': %s", len(frames), self.model_key, e, exc_info=True)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(frames)
+        logger.debug("Lote de %s imagem(ns) processado com o modelo '%s'.", len(frames), self.model_key)
+        for (_, future), masks in zip(batch, results):
+            future.set_result(masks)
@@ -0,0 +1,229 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+from src.core import metrics
+from src.core.config import settings
+import hashlib
+import logging
+import os
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def content_digest(data: bytes) -> str:
+    """Hash SHA-256 (hex) do conteúdo, usado como identidade da imagem de entrada."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_key(namespace: str, digest: str, **params: Any) -> str:
+    """
+    Monta a chave de cache a partir do hash da imagem, de um namespace
+    (endpoint/etapa) e dos parâmetros que influenciam o resultado.
+    """
+    parts = [namespace, digest] + [f"{name}={params[name]!r}" for name in sorted(params)]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache de resultados endereçado por conteúdo, com duas camadas:
+
+    - memória: LRU limitado por número de itens e por bytes;
+    - disco (opcional): um arquivo por chave, com remoção dos arquivos menos
+      recentemente usados quando o total ultrapassa `disk_max_bytes`.
+
+    Os valores são sempre `bytes`. Acertos no disco são promovidos para a memória.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_items: int = 256,
+        max_bytes: int = 256 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 0,
+        enabled: bool = True,
+    ):
+        self.name = name
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.disk_dir = Path(disk_dir) / name if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        # Total em disco, medido na primeira gravação ou consulta (não na importação)
+        self._disk_bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+    def _disk_usage(self) -> int:
+        if self._disk_bytes is None:
+            total = sum(p.stat().st_size for p in self.disk_dir.glob("*/*") if p.is_file())
+            with self._lock:
+                if self._disk_bytes is None:
+                    self._disk_bytes = total
+        return self._disk_bytes
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+        self._memory_set(key, value)
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if not self.enabled:
+            return
+        self._memory_set(key, value)
+        self._disk_set(key, value)
+
+    def _memory_set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = value
+            self._memory_bytes += len(value)
+            while self._memory and (len(self._memory) > self.max_items or self._memory_bytes > self.max_bytes):
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+                self.evictions += 1
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            value = path.read_bytes()
+            # Atualiza o mtime para a política de remoção LRU
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("Falha ao ler entrada do cache '%s' em disco: %s", self.name, e)
+            return None
+
+    def _disk_set(self, key: str, value: bytes) -> None:
+        if self.disk_dir is None or len(value) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        try:
+            self._disk_usage()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            existing = path.stat().st_size if path.exists() else 0
+            tmp_path = path.with_name(f".{key}.{uuid.uuid4().hex}.tmp")
+            tmp_path.write_bytes(value)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._disk_bytes += len(value) - existing
+                over_quota = self._disk_bytes > self.disk_max_bytes
+            if over_quota:
+                self._evict_disk()
+        except OSError as e:
+            logger.warning("Falha ao gravar entrada do cache '%s' em disco: %s", self.name, e)
+
+    def _evict_disk(self) -> None:
+        entries = []
+        for path in self.disk_dir.glob("*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        # Remove até 90% da cota para não disparar a limpeza a cada gravação
+        target = int(self.disk_max_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+                total -= size
+                self.evictions += 1
+            except FileNotFoundError:
+                continue
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.disk_dir is not None:
+            for path in self.disk_dir.glob("*/*"):
+                path.unlink(missing_ok=True)
+            with self._lock:
+                self._disk_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        disk_bytes = self._disk_usage() if self.disk_dir is not None else None
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": disk_bytes,
+            }
+
+
+# Caches criados a partir das configurações, expostos em /metrics
+_caches: Dict[str, ResultCache] = {}
+
+
+def cache_from_settings(name: str, **overrides: Any) -> ResultCache:
+    """Cache com os limites de `RESULT_CACHE_*`, exceto os informados em `overrides`."""
+    options: Dict[str, Any] = dict(
+        max_items=settings.RESULT_CACHE_MAX_ITEMS,
+        max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+        disk_dir=settings.RESULT_CACHE_DIR,
+        disk_max_bytes=settings.RESULT_CACHE_DISK_MAX_BYTES,
+        enabled=settings.RESULT_CACHE_ENABLED,
+    )
+    options.update(overrides)
+    cache = ResultCache(name, **options)
+    _caches[name] = cache
+    return cache
+
+
+def _cache_samples(field: str):
+    return lambda: [({"cache": name}, cache.stats()[field] or 0) for name, cache in list(_caches.items())]
+
+
+metrics.registry.counter("cache_hits_total", "Acertos do cache (memória ou disco).", ("cache",), callback=_cache_samples("hits"))
+metrics.registry.counter("cache_misses_total", "Falhas do cache.", ("cache",), callback=_cache_samples("misses"))
+metrics.registry.gauge("cache_memory_bytes", "Bytes ocupados pela camada em memória do cache.", ("cache",), callback=_cache_samples("memory_bytes"))
+
+
+# Resultados finais dos endpoints (imagens codificadas)
+result_cache = cache_from_settings("results")
@@ -0,0 +1,164 @@
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+from src.core.config import settings
+from src.services.cache import ResultCache, cache_from_settings, make_key
+from src.utils.io import sniff_image_type, MAGIC_BYTES_NEEDED
+import asyncio
+import httpx
+import logging
+import weakref
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadError(Exception):
+    """Falha ao baixar uma imagem; `status_code` é o código HTTP sugerido para o cliente."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _LoopState:
+    """Cliente HTTP e semáforos por host; objetos asyncio pertencem a um único event loop."""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+class ImageDownloader:
+    """
+    Baixa imagens de forma assíncrona com um pool de conexões compartilhado.
+
+    - limite de downloads simultâneos por host;
+    - download em streaming, abortado ao ultrapassar `max_bytes`;
+    - verificação do Content-Type e dos magic bytes logo no primeiro bloco;
+    - cache opcional por URL, revalidado com ETag (If-None-Match).
+    """
+
+    def __init__(
+        self,
+        timeout: float = 30.0,
+        max_bytes: int = 20 * 1024 * 1024,
+        max_connections: int = 100,
+        per_host_limit: int = 4,
+        cache: Optional[ResultCache] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_connections = max_connections
+        self.per_host_limit = max(1, per_host_limit)
+        self.cache = cache
+        self.transport = transport
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_settings(cls) -> "ImageDownloader":
+        return cls(
+            timeout=settings.DOWNLOAD_TIMEOUT,
+            max_bytes=settings.DOWNLOAD_MAX_BYTES,
+            max_connections=settings.DOWNLOAD_MAX_CONNECTIONS,
+            per_host_limit=settings.DOWNLOAD_PER_HOST_LIMIT,
+            cache=cache_from_settings("downloads") if settings.DOWNLOAD_CACHE_ENABLED else None,
+        )
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                transport=self.transport,
+            )
+            state = _LoopState(client)
+            self._states[loop] = state
+        return state
+
+    def _host_semaphore(self, state: _LoopState, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        semaphore = state.host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host_limit)
+            state.host_semaphores[host] = semaphore
+        return semaphore
+
+    def _cached(self, url: str) -> Tuple[Optional[str], Optional[bytes]]:
+        if self.cache is None:
+            return None, None
+        entry = self.cache.get(make_key("download", url))
+        if entry is None:
+            return None, None
+        etag, _, body = entry.partition(b"\0")
+        return etag.decode("latin-1"), body
+
+    def _store(self, url: str, etag: Optional[str], body: bytes) -> None:
+        if self.cache is not None and etag:
+            self.cache.set(make_key("download", url), etag.encode("latin-1") + b"\0" + body)
+
+    async def fetch(self, url: str) -> bytes:
+        """Baixa `url` e retorna os bytes da imagem, ou levanta `DownloadError`."""
+        state = self._state()
+        cached_etag, cached_body = self._cached(url)
+        headers = {"If-None-Match": cached_etag} if cached_etag else {}
+        try:
+            async with self._host_semaphore(state, url):
+                async with state.client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304 and cached_body is not None:
+                        logger.debug("Imagem não modificada (ETag), usando cache: %s", url)
+                        return cached_body
+                    response.raise_for_status()
+                    body = await self._read_image(response)
+                    self._store(url, response.headers.get("etag"), body)
+                    return body
+        except DownloadError:
+            raise
+        except httpx.HTTPStatusError as e:
+            raise DownloadError(f"Servidor respondeu {e.response.status_code}")
+        except httpx.HTTPError as e:
+            raise DownloadError(f"{type(e).__name__}: {e}")
+
+    async def _read_image(self, response: httpx.Response) -> bytes:
+        content_type = response.headers.get("content-type", "")
+        if content_type and not content_type.startswith(("image/", "application/octet-stream")):
+            raise DownloadError(f"URL deve apontar para uma imagem válida (Content-Type: {content_type})")
+        content_length = response.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            raise DownloadError(f"Imagem excede o limite de {self.max_bytes} bytes", status_code=413)
+
+        chunks = []
+        received = 0
+        sniffed = False
+        async for chunk in response.aiter_bytes():
+            chunks.append(chunk)
+            received += len(chunk)
+            if received > self.max_bytes:
+                raise DownloadError(f"Imagem excede o limite de {self.max_bytes} bytes", status_code=413)
+            if not sniffed and received >= MAGIC_BYTES_NEEDED:
+                self._check_magic(b"".join(chunks))
+                sniffed = True
+        body = b"".join(chunks)
+        if not sniffed:
+            self._check_magic(body)
+        return body
+
+    @staticmethod
+    def _check_magic(head: bytes) -> None:
+        if sniff_image_type(head[:MAGIC_BYTES_NEEDED]) is None:
+            raise DownloadError("URL deve apontar para uma imagem válida (formato não reconhecido)")
+
+    async def aclose(self) -> None:
+        """Fecha o cliente do event loop atual (chamado no shutdown da aplicação)."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        state = self._states.pop(loop, None)
+        if state is not None:
+            await state.client.aclose()
+
+
+downloader = ImageDownloader.from_settings()
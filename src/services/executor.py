@@ -0,0 +1,186 @@
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from src.core import metrics
+from src.core.config import settings
+from src.services.batching import BATCH_SPECS, batch_spec
+from src.services.onnx_options import quantized_variants
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _run_queued(pool_name: str, submitted: float, call: Callable[[], Any]) -> Any:
+    """Registra a espera na fila (métricas e Server-Timing) e executa a tarefa no worker."""
+    waited = time.perf_counter() - submitted
+    metrics.queue_wait.observe(waited, pool=pool_name)
+    metrics.record_stage("queue_wait", waited)
+    return call()
+
+
+def _run_in_process(submitted: float, call: Callable[[], Any]) -> Tuple[Any, float, List[Tuple[str, float]]]:
+    """
+    Executa a tarefa em um worker do pool de processos. As etapas medidas lá não
+    chegam ao contexto da requisição: são coletadas e devolvidas ao processo da
+    API junto com a espera na fila (relógio de parede, comparável entre processos).
+    """
+    waited = max(0.0, time.time() - submitted)
+    stages = metrics.start_request()
+    return call(), waited, stages
+
+
+class QueueFullError(RuntimeError):
+    """Levantada quando a fila de processamento atingiu o limite configurado."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Fila de processamento cheia.")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Executa trabalho bloqueante (inferência ONNX, MediaPipe, PIL/OpenCV) fora do
+    event loop do asyncio.
+
+    - Cada modelo tem seu próprio pool de threads, cujo tamanho é o limite de
+      concorrência daquele modelo; um modelo lento não ocupa os workers dos demais.
+    - Trabalho de CPU genérico vai para um pool compartilhado (threads ou processos).
+    - Todas as tarefas (em execução ou aguardando) contam para uma fila global
+      limitada; acima dela, `QueueFullError` é levantada imediatamente.
+    """
+
+    def __init__(
+        self,
+        cpu_workers: int,
+        cpu_executor: str = "thread",
+        queue_size: int = 32,
+        model_concurrency: int = 1,
+        model_overrides: Optional[Dict[str, int]] = None,
+        retry_after: int = 5,
+    ):
+        if cpu_executor not in ("thread", "process"):
+            raise ValueError(f"CPU_EXECUTOR inválido: '{cpu_executor}' (use 'thread' ou 'process')")
+        self.cpu_workers = max(1, cpu_workers)
+        self.cpu_executor = cpu_executor
+        self.queue_size = max(1, queue_size)
+        self.model_concurrency = max(1, model_concurrency)
+        self.model_overrides = dict(model_overrides or {})
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._model_pools: Dict[str, ThreadPoolExecutor] = {}
+        self._cpu_pool: Optional[Executor] = None
+
+    @classmethod
+    def from_settings(cls) -> "InferenceExecutor":
+        overrides = dict(settings.MODEL_CONCURRENCY_OVERRIDES)
+        if settings.MICRO_BATCH_ENABLED:
+            # As threads do modelo apenas aguardam o micro-batcher; é preciso pelo
+            # menos um lote cheio delas para que os pedidos possam ser agrupados
+            for model_key in list(BATCH_SPECS) + [name for name in quantized_variants() if batch_spec(name)]:
+                current = overrides.get(model_key, settings.MODEL_CONCURRENCY)
+                overrides[model_key] = max(current, settings.MICRO_BATCH_MAX_SIZE)
+        return cls(
+            cpu_workers=settings.CPU_WORKERS,
+            cpu_executor=settings.CPU_EXECUTOR,
+            queue_size=settings.INFERENCE_QUEUE_SIZE,
+            model_concurrency=settings.MODEL_CONCURRENCY,
+            model_overrides=overrides,
+            retry_after=settings.RETRY_AFTER_SECONDS,
+        )
+
+    @property
+    def pending(self) -> int:
+        """Número de tarefas em execução ou aguardando um worker."""
+        return self._pending
+
+    def concurrency_for(self, model_key: str) -> int:
+        return max(1, self.model_overrides.get(model_key, self.model_concurrency))
+
+    def _model_pool(self, model_key: str) -> ThreadPoolExecutor:
+        with self._lock:
+            pool = self._model_pools.get(model_key)
+            if pool is None:
+                pool = ThreadPoolExecutor(
+                    max_workers=self.concurrency_for(model_key),
+                    thread_name_prefix=f"model-{model_key}",
+                )
+                self._model_pools[model_key] = pool
+            return pool
+
+    def _cpu(self) -> Executor:
+        with self._lock:
+            if self._cpu_pool is None:
+                if self.cpu_executor == "process":
+                    self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers)
+                else:
+                    self._cpu_pool = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="cpu")
+            return self._cpu_pool
+
+    def _acquire_slot(self) -> None:
+        with self._lock:
+            if self._pending >= self.queue_size:
+                raise QueueFullError(self.retry_after)
+            self._pending += 1
+
+    def _release_slot(self, _future: Optional[Future] = None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def _submit(self, pool: Executor, pool_name: str, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+        self._acquire_slot()
+        call = functools.partial(fn, *args, **kwargs)
+        in_process = not isinstance(pool, ThreadPoolExecutor)
+        if in_process:
+            call = functools.partial(_run_in_process, time.time(), call)
+        else:
+            # Propaga contextvars (ex.: etapas medidas da requisição) para a thread worker
+            call = functools.partial(_run_queued, pool_name, time.perf_counter(), call)
+            call = functools.partial(contextvars.copy_context().run, call)
+        try:
+            future = pool.submit(call)
+        except BaseException:
+            self._release_slot()
+            raise
+        # O slot só é liberado quando o worker termina, mesmo que o cliente desista
+        future.add_done_callback(self._release_slot)
+        if not in_process:
+            return await asyncio.wrap_future(future)
+        result, waited, stages = await asyncio.wrap_future(future)
+        metrics.queue_wait.observe(waited, pool=pool_name)
+        metrics.record_stage("queue_wait", waited)
+        for name, seconds in stages:
+            metrics.record_stage(name, seconds)
+        return result
+
+    async def run_inference(self, model_key: str, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+        """Executa `fn` no pool dedicado ao modelo `model_key`."""
+        return await self._submit(self._model_pool(model_key), model_key, fn, *args, **kwargs)
+
+    async def run_cpu(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+        """Executa `fn` no pool de CPU compartilhado."""
+        return await self._submit(self._cpu(), "cpu", fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            pools = list(self._model_pools.values())
+            if self._cpu_pool is not None:
+                pools.append(self._cpu_pool)
+            self._model_pools = {}
+            self._cpu_pool = None
+        for pool in pools:
+            pool.shutdown(wait=wait, cancel_futures=True)
+        logger.info("Executor de inferência finalizado.")
+
+
+inference_executor = InferenceExecutor.from_settings()
+
+metrics.registry.gauge(
+    "executor_pending_tasks",
+    "Tarefas em execução ou aguardando um worker (limite: INFERENCE_QUEUE_SIZE).",
+    callback=lambda: [({}, inference_executor.pending)],
+)
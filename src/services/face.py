@@ -1,52 +1,107 @@
-import cv2
-import numpy as np
-import mediapipe as mp
-from typing import Optional, Tuple
+from PIL import ExifTags, Image
+from typing import List, Optional, Tuple
+from src.core import metrics
+from src.core.config import settings
+from src.utils.frame import ImageFrame
+import io
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
-# Inicializa o MediaPipe Face Detection com um modelo otimizado para curtas distâncias (< 2m)
-mp_face_detection = mp.solutions.face_detection
-face_detection = mp_face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
+# Chave usada no executor de inferência; o tamanho do pool define quantas detecções rodam em paralelo
+FACE_MODEL_KEY = "mediapipe-face"
 
-def detect_face_from_bytes(image_bytes: bytes) -> Optional[Tuple[int, int, int, int]]:
+# Uma instância do detector por thread: o grafo do MediaPipe não pode ser compartilhado
+# entre threads, e cada worker do pool de FACE_MODEL_KEY reaproveita a sua
+_detectors = threading.local()
+
+def get_detector():
+    """Retorna o detector da thread atual, criando-o na primeira chamada."""
+    detector = getattr(_detectors, "detector", None)
+    if detector is None:
+        # Importado só aqui: o MediaPipe (e o matplotlib que ele carrega) custa ~0,5 s na inicialização
+        from mediapipe.python.solutions import face_detection as mp_face_detection
+        # Modelo otimizado para curtas distâncias (< 2m)
+        detector = mp_face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
+        _detectors.detector = detector
+    return detector
+
+# Face detectada: coordenadas (x, y, w, h) na resolução do frame e confiança (0-1)
+FaceDetection = Tuple[Tuple[int, int, int, int], float]
+
+def detect_faces(frame: ImageFrame, max_faces: Optional[int] = None) -> List[FaceDetection]:
+    """
+    Detecta todas as faces de uma imagem já decodificada, da mais para a menos
+    confiável, em uma única passada do MediaPipe sobre a versão reduzida do frame.
+    Em caso de erro, registra o log e retorna uma lista vazia.
+    """
+    try:
+        with metrics.stage("face_detection"):
+            results = get_detector().process(frame.proxy(settings.FACE_DETECTION_MAX_SIDE).rgb)
+    except Exception as e:
+        logger.error("Erro durante a detecção de faces com MediaPipe: %s", e, exc_info=True)
+        return []
+
+    iw, ih = frame.size
+    faces = []
+    for detection in results.detections or []:
+        bbox = detection.location_data.relative_bounding_box
+        x, y, w, h = int(bbox.xmin * iw), int(bbox.ymin * ih), int(bbox.width * iw), int(bbox.height * ih)
+        faces.append(((max(0, x), max(0, y), w, h), float(detection.score[0]) if detection.score else 0.0))
+    faces.sort(key=lambda face: face[1], reverse=True)
+    return faces[:max_faces] if max_faces else faces
+
+def detect_face(frame: ImageFrame) -> Optional[Tuple[int, int, int, int]]:
     """
-    Detecta a face principal em uma imagem usando MediaPipe Face Detection.
+    Detecta a face principal em uma imagem já decodificada usando MediaPipe Face Detection.
+
+    É a face de maior score de `detect_faces` (a mesma de `detect_face_from_bytes`).
 
     Args:
-        image_bytes: A imagem em formato de bytes.
+        frame: A imagem decodificada.
 
     Returns:
         Uma tupla com as coordenadas (x, y, w, h) da face detectada,
         ou None se nenhuma face for encontrada.
     """
-    try:
-        # Decodificar os bytes da imagem para um array numpy
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            logger.error("Falha ao decodificar a imagem para detecção de face.")
-            return None
-
-        # MediaPipe espera imagens em RGB, mas o OpenCV carrega em BGR
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        results = face_detection.process(image_rgb)
-
-        if not results.detections:
-            return None
-
-        detection = results.detections[0]
-        
-        ih, iw, _ = image.shape
-        bbox = detection.location_data.relative_bounding_box
-        
-        x, y, w, h = int(bbox.xmin * iw), int(bbox.ymin * ih), int(bbox.width * iw), int(bbox.height * ih)
+    faces = detect_faces(frame, 1)
+    return faces[0][0] if faces else None
 
-        return (max(0, x), max(0, y), w, h)
+def detect_face_from_bytes(image_bytes: bytes) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Detecta a face principal em uma imagem em bytes.
+
+    Prefira `detect_face` quando a imagem já estiver decodificada em um `ImageFrame`.
+    Aqui a imagem é decodificada já reduzida (JPEG via `draft`), e as coordenadas
+    são devolvidas na resolução original.
+    """
+    faces = detect_faces_from_bytes(image_bytes, max_faces=1)
+    return faces[0][0] if faces else None
 
+def detect_faces_from_bytes(image_bytes: bytes, max_faces: Optional[int] = None) -> List[FaceDetection]:
+    """Como `detect_faces`, decodificando os bytes já reduzidos (ver `detect_face_from_bytes`)."""
+    try:
+        if settings.FACE_DETECTION_JPEG_DRAFT and settings.FACE_DETECTION_MAX_SIDE > 0:
+            frame = ImageFrame.reduced_from_bytes(image_bytes, settings.FACE_DETECTION_MAX_SIDE)
+            full_size = original_size(image_bytes)
+        else:
+            frame = ImageFrame.from_bytes(image_bytes)
+            full_size = frame.size
     except Exception as e:
-        logger.error(f"Erro durante a detecção de face com MediaPipe: {str(e)}", exc_info=True)
-        return None
+        logger.error("Falha ao decodificar a imagem para detecção de face: %s", e)
+        return []
+    faces = detect_faces(frame, max_faces)
+    if full_size == frame.size:
+        return faces
+    sx, sy = full_size[0] / frame.width, full_size[1] / frame.height
+    return [((int(x * sx), int(y * sy), int(w * sx), int(h * sy)), score) for (x, y, w, h), score in faces]
+
+def original_size(image_bytes: bytes) -> Tuple[int, int]:
+    """Tamanho da imagem após a orientação EXIF, lido do cabeçalho (sem decodificar os pixels)."""
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    # Orientações 5-8 giram a imagem em 90°
+    if image.getexif().get(ExifTags.Base.Orientation, 1) in (5, 6, 7, 8):
+        return height, width
+    return width, height
@@ -0,0 +1,97 @@
+"""
+Validação de imagens recebidas antes de qualquer decodificação completa.
+
+Os uploads chegam ao endpoint no `SpooledTemporaryFile` do Starlette (em disco
+acima de 1 MB); aqui o arquivo é verificado no lugar, sem ser carregado:
+
+- tamanho máximo (`UPLOAD_MAX_BYTES`);
+- magic bytes (o `Content-Type` enviado pelo cliente não é considerado);
+- só o cabeçalho da imagem é lido (Pillow abre de forma preguiçosa) para obter
+  formato e dimensões, e imagens acima de `UPLOAD_MAX_PIXELS` são recusadas,
+  o que barra "bombas de descompressão" (arquivo pequeno, bitmap enorme).
+
+Imagens baixadas por URL passam pela mesma checagem de cabeçalho.
+"""
+from dataclasses import dataclass
+from PIL import Image
+from typing import BinaryIO, Optional
+from src.core.config import settings
+from src.utils.io import sniff_image_type, MAGIC_BYTES_NEEDED
+import io
+import warnings
+
+# A decodificação em qualquer ponto do serviço segue o mesmo limite (o Pillow
+# avisa acima dele e recusa acima do dobro)
+Image.MAX_IMAGE_PIXELS = settings.UPLOAD_MAX_PIXELS or None
+
+
+class IntakeError(Exception):
+    """Imagem recusada na entrada; `status_code` é o código HTTP sugerido para o cliente."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    mime: str
+    format: str
+    width: int
+    height: int
+    size_bytes: int
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+
+def inspect_image(fp: BinaryIO, size_bytes: Optional[int] = None) -> ImageInfo:
+    """
+    Identifica a imagem pelos magic bytes e pelo cabeçalho, sem decodificar os
+    pixels, e aplica os limites de bytes e de pixels. Devolve `fp` na posição 0.
+    """
+    max_bytes = settings.UPLOAD_MAX_BYTES
+    if size_bytes is None:
+        size_bytes = fp.seek(0, io.SEEK_END)
+    fp.seek(0)
+    if max_bytes and size_bytes > max_bytes:
+        raise IntakeError(f"Imagem excede o limite de {max_bytes} bytes", status_code=413)
+    mime = sniff_image_type(fp.read(MAGIC_BYTES_NEEDED))
+    fp.seek(0)
+    if mime is None:
+        raise IntakeError("Arquivo deve ser uma imagem (formato não reconhecido).", status_code=415)
+    try:
+        with warnings.catch_warnings():
+            # O limite é aplicado abaixo, com mensagem própria
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(fp) as image:
+                width, height = image.size
+                image_format = image.format or ""
+    except Image.DecompressionBombError:
+        raise IntakeError(f"Imagem excede o limite de {settings.UPLOAD_MAX_PIXELS} pixels", status_code=413)
+    except (OSError, SyntaxError, ValueError) as e:
+        raise IntakeError(f"Não foi possível ler o cabeçalho da imagem: {e}")
+    finally:
+        fp.seek(0)
+    max_pixels = settings.UPLOAD_MAX_PIXELS
+    if max_pixels and width * height > max_pixels:
+        raise IntakeError(
+            f"Imagem de {width}x{height} pixels excede o limite de {max_pixels} pixels", status_code=413
+        )
+    return ImageInfo(mime=mime, format=image_format, width=width, height=height, size_bytes=size_bytes)
+
+
+def inspect_bytes(data: bytes) -> ImageInfo:
+    """`inspect_image` para uma imagem já em memória (ex.: baixada por URL)."""
+    return inspect_image(io.BytesIO(data), len(data))
+
+
+def request_body_limit(path: str) -> int:
+    """
+    Maior corpo aceito (pelo `Content-Length` e pelos bytes recebidos), checado
+    antes e durante o parse do multipart: uma imagem (ou o lote inteiro) mais
+    uma folga para os campos.
+    """
+    files = settings.BATCH_MAX_FILES if "/batch/" in path else 1
+    return settings.UPLOAD_MAX_BYTES * files + 1024 * 1024
@@ -0,0 +1,331 @@
+"""
+Fila persistente de jobs (SQLite) para processamentos longos via URL.
+
+A API apenas grava o pedido e responde com o id do job. Os workers rodam no
+próprio processo da API (`JOB_WORKER_MODE=inline`) ou em processos separados
+(`python -m src.worker`), todos sobre o mesmo arquivo: a reserva de um job
+acontece em uma transação `BEGIN IMMEDIATE`, então dois workers nunca pegam o
+mesmo pedido. Jobs presos em `running` por mais de `JOB_STALE_SECONDS` (worker
+encerrado no meio) voltam para a fila, até `JOB_MAX_ATTEMPTS` tentativas.
+"""
+from contextlib import closing
+from dataclasses import dataclass
+from ipaddress import ip_address
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+from src.core import metrics
+from src.core.config import settings
+from src.services.download import DownloadError
+from src.services.executor import QueueFullError
+from src.services.intake import IntakeError
+from src.services.output import negotiate_format
+from src.services.pipeline import process_url_image, store_result
+from src.services.storage import result_storage
+from src.utils.io import OUTPUT_FORMATS
+import asyncio
+import httpx
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    request TEXT NOT NULL,
+    webhook_url TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+@dataclass
+class Job:
+    id: str
+    status: str
+    request: Dict[str, Any]
+    webhook_url: Optional[str]
+    attempts: int
+    created_at: float
+    updated_at: float
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        return cls(
+            id=row["id"],
+            status=row["status"],
+            request=json.loads(row["request"]),
+            webhook_url=row["webhook_url"],
+            attempts=row["attempts"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+            result=json.loads(row["result"]) if row["result"] else None,
+            error=row["error"],
+        )
+
+    def result_url(self, request: Any = None) -> Optional[str]:
+        if not self.result:
+            return None
+        return result_storage.url(self.result["key"], request)
+
+
+class JobStore:
+    """Jobs em um arquivo SQLite compartilhado entre processos (uma conexão por operação)."""
+
+    def __init__(self, path: str, max_attempts: int = 3, stale_seconds: float = 900):
+        self.path = Path(path)
+        self.max_attempts = max(1, max_attempts)
+        self.stale_seconds = stale_seconds
+        # O banco é aberto e o esquema criado na primeira operação, não na importação
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _initialize(self) -> None:
+        with self._init_lock:
+            if self._initialized:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            with closing(conn):
+                # WAL: leituras (GET /jobs/{id}) não esperam pelas escritas dos workers
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+            self._initialized = True
+
+    @classmethod
+    def from_settings(cls) -> "JobStore":
+        return cls(settings.JOBS_DB_PATH, max_attempts=settings.JOB_MAX_ATTEMPTS, stale_seconds=settings.JOB_STALE_SECONDS)
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self._initialize()
+        # isolation_level=None: transações explícitas (BEGIN IMMEDIATE na reserva)
+        conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, request: Dict[str, Any], webhook_url: Optional[str] = None) -> Job:
+        now = time.time()
+        job = Job(id=uuid.uuid4().hex, status="queued", request=request, webhook_url=webhook_url, attempts=0, created_at=now, updated_at=now)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, request, webhook_url, attempts, created_at, updated_at) VALUES (?, ?, ?, ?, 0, ?, ?)",
+                (job.id, job.status, json.dumps(request), webhook_url, now, now),
+            )
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def claim(self) -> Optional[Job]:
+        """Reserva o job mais antigo da fila (status `running`), ou None se a fila estiver vazia."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs abandonados por um worker que morreu voltam para a fila (ou falham de vez)
+                conn.execute(
+                    "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,"
+                    " error = CASE WHEN attempts >= ? THEN 'Worker interrompido durante o processamento.' ELSE error END,"
+                    " updated_at = ? WHERE status = 'running' AND updated_at < ?",
+                    (self.max_attempts, self.max_attempts, now, now - self.stale_seconds),
+                )
+                row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?", (now, row["id"]))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        job = Job.from_row(row)
+        job.status, job.attempts, job.updated_at = "running", job.attempts + 1, now
+        return job
+
+    def _finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result else None, error, time.time(), job_id),
+            )
+
+    def complete(self, job_id: str, result: Dict[str, Any]) -> None:
+        self._finish(job_id, "succeeded", result, None)
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._finish(job_id, "failed", None, error)
+
+    def release(self, job_id: str) -> None:
+        """Devolve o job à fila sem contar a tentativa (ex.: executor sem vagas)."""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), updated_at = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update({status: count for status, count in rows})
+        return counts
+
+
+def is_local_webhook(url: str) -> bool:
+    """Webhooks só podem apontar para hosts locais (loopback) ou listados em `JOB_WEBHOOK_ALLOWED_HOSTS`."""
+    host = (urlsplit(url).hostname or "").lower()
+    if not host:
+        return False
+    if host in settings.JOB_WEBHOOK_ALLOWED_HOSTS:
+        return True
+    try:
+        return ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class JobWorker:
+    """
+    Consome a fila com `concurrency` tarefas asyncio no event loop atual.
+
+    Cada job reusa o pipeline de /process-url/; os limites de concorrência por
+    modelo continuam valendo, pois a inferência passa pelo `inference_executor`.
+    """
+
+    def __init__(self, store: JobStore, concurrency: int = 1, poll_interval: float = 1.0, webhook_timeout: float = 5.0):
+        self.store = store
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.webhook_timeout = webhook_timeout
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def run_once(self) -> bool:
+        """Processa um job, se houver; retorna False com a fila vazia."""
+        job = await asyncio.to_thread(self.store.claim)
+        if job is None:
+            return False
+        await self._process(job)
+        return True
+
+    async def _process(self, job: Job) -> None:
+        request = job.request
+        logger.info("Iniciando job %s (tentativa %s): %s | Tipo: %s", job.id, job.attempts, request['image_url'], request['processing_type'])
+        started = time.perf_counter()
+        try:
+            fmt = negotiate_format(request.get("format"), None, has_alpha=False)
+            data = await process_url_image(request["image_url"], request["processing_type"], request["model"], request.get("roi"), fmt)
+            key = await store_result(data, fmt)
+        except QueueFullError as e:
+            # Executor saturado: o job volta para a fila e este worker espera um pouco
+            logger.warning("Executor sem vagas; job %s devolvido à fila.", job.id)
+            await asyncio.to_thread(self.store.release, job.id)
+            await asyncio.sleep(e.retry_after)
+            return
+        except DownloadError as e:
+            logger.error("Erro ao baixar imagem do job %s: %s", job.id, e)
+            await self._finish(job, "failed", error=f"Erro ao baixar imagem: {str(e)}")
+            return
+        except IntakeError as e:
+            logger.warning("Imagem do job %s recusada: %s", job.id, e)
+            await self._finish(job, "failed", error=str(e))
+            return
+        except Exception as e:
+            logger.error("Erro no job %s: %s", job.id, e, exc_info=True)
+            await self._finish(job, "failed", error=f"Erro interno: {str(e)}")
+            return
+        job_duration.observe(time.perf_counter() - started, processing_type=request["processing_type"])
+        await self._finish(job, "succeeded", result={"key": key, "format": fmt, "media_type": OUTPUT_FORMATS[fmt]})
+        logger.info("Job %s concluído: %s", job.id, key)
+
+    async def _finish(self, job: Job, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        if status == "succeeded":
+            await asyncio.to_thread(self.store.complete, job.id, result)
+        else:
+            await asyncio.to_thread(self.store.fail, job.id, error)
+        jobs_finished.inc(status=status)
+        job.status, job.result, job.error = status, result, error
+        if job.webhook_url:
+            await self._notify(job)
+
+    async def _notify(self, job: Job) -> None:
+        if not is_local_webhook(job.webhook_url):
+            logger.warning("Webhook do job %s ignorado: host não permitido (%s).", job.id, job.webhook_url)
+            return
+        payload = {"id": job.id, "status": job.status, "result_url": job.result_url(), "error": job.error}
+        try:
+            async with httpx.AsyncClient(timeout=self.webhook_timeout) as client:
+                response = await client.post(job.webhook_url, json=payload)
+            logger.debug("Webhook do job %s respondeu %s.", job.id, response.status_code)
+        except httpx.HTTPError as e:
+            logger.warning("Falha ao chamar o webhook do job %s: %s", job.id, e)
+
+    def notify(self) -> None:
+        """Acorda os workers deste processo (chamado pela API ao enfileirar)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                if await self.run_once():
+                    continue
+            except Exception as e:
+                logger.error("Erro no worker de jobs: %s", e, exc_info=True)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """Inicia os workers no event loop atual."""
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._loop(), name=f"job-worker-{i}") for i in range(self.concurrency)]
+        logger.info("%s worker(s) de jobs iniciado(s) (%s).", self.concurrency, self.store.path)
+
+    async def stop(self) -> None:
+        """Interrompe os workers; jobs em andamento são retomados depois de `JOB_STALE_SECONDS`."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
+
+
+job_store = JobStore.from_settings()
+job_worker = JobWorker(
+    job_store,
+    concurrency=settings.JOB_WORKERS,
+    poll_interval=settings.JOB_POLL_INTERVAL,
+    webhook_timeout=settings.JOB_WEBHOOK_TIMEOUT,
+)
+
+jobs_finished = metrics.registry.counter("jobs_finished_total", "Jobs finalizados por status.", ("status",))
+job_duration = metrics.registry.histogram(
+    "job_duration_seconds", "Tempo de processamento de um job (sem a espera na fila).", ("processing_type",)
+)
+metrics.registry.gauge(
+    "jobs_by_status",
+    "Jobs na fila persistente por status.",
+    ("status",),
+    callback=lambda: [({"status": status}, count) for status, count in job_store.counts().items()],
+)
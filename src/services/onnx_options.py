@@ -0,0 +1,217 @@
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Type
+from src.core.config import settings
+import logging
+import os
+import threading
+import uuid
+
+if TYPE_CHECKING:
+    import onnxruntime as ort
+    from rembg.sessions.base import BaseSession
+
+logger = logging.getLogger(__name__)
+
+# Com a importação tardia, o rembg (pymatting/numba) é importado por uma thread do
+# executor; a camada TBB do numba iniciada fora da thread principal trava o
+# encerramento do processo, então o OpenMP (também thread-safe) vem primeiro.
+# NUMBA_THREADING_LAYER definido no ambiente continua tendo precedência.
+os.environ.setdefault("NUMBA_THREADING_LAYER_PRIORITY", "omp tbb workqueue")
+
+# rembg e onnxruntime são importados só ao criar a primeira sessão (o rembg sozinho
+# leva ~1 s para importar); aqui ficam os nomes dos enums do ONNX Runtime
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disabled": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+EXECUTION_MODES = {
+    "sequential": "ORT_SEQUENTIAL",
+    "parallel": "ORT_PARALLEL",
+}
+
+# Sufixos de variantes quantizadas: "u2net-int8", "isnet-general-use-fp16"
+PRECISIONS = ("int8", "fp16")
+
+# O SAM usa dois arquivos (encoder/decoder) e não pode ser trocado por um único .onnx
+_SINGLE_FILE_EXCLUDED = {"sam"}
+
+_files_lock = threading.Lock()
+
+
+def split_variant(model_key: str) -> Tuple[str, Optional[str]]:
+    """Separa "u2net-int8" em ("u2net", "int8"); modelos normais retornam (model_key, None)."""
+    base, _, suffix = model_key.rpartition("-")
+    if base and suffix in PRECISIONS:
+        return base, suffix
+    return model_key, None
+
+
+def base_model_key(model_key: str) -> str:
+    return split_variant(model_key)[0]
+
+
+def quantized_variants() -> List[str]:
+    """Variantes configuradas em `ONNX_QUANTIZED_VARIANTS` que apontam para um modelo conhecido."""
+    if not settings.ONNX_QUANTIZED_VARIANTS:
+        return []  # sem variantes, a lista de modelos sai sem importar o rembg
+    from rembg.sessions import sessions_class
+    known = {cls.name() for cls in sessions_class}
+    variants = []
+    for name in settings.ONNX_QUANTIZED_VARIANTS:
+        base, precision = split_variant(name)
+        if precision is None or base not in known or base in _SINGLE_FILE_EXCLUDED:
+            logger.warning("Variante quantizada inválida ignorada: '%s'.", name)
+            continue
+        variants.append(name)
+    return variants
+
+
+def model_options(model_key: str) -> Dict[str, Any]:
+    """
+    Opções efetivas do ONNX Runtime para o modelo: padrões globais, depois as do
+    modelo base e por fim as da própria variante em `ONNX_MODEL_OPTIONS`.
+    """
+    options: Dict[str, Any] = {
+        "intra_op_threads": settings.ONNX_INTRA_OP_THREADS,
+        "inter_op_threads": settings.ONNX_INTER_OP_THREADS,
+        "execution_mode": settings.ONNX_EXECUTION_MODE,
+        "graph_optimization": settings.ONNX_GRAPH_OPTIMIZATION,
+        "enable_mem_arena": settings.ONNX_ENABLE_MEM_ARENA,
+        "enable_mem_pattern": settings.ONNX_ENABLE_MEM_PATTERN,
+        "allow_spinning": settings.ONNX_ALLOW_SPINNING,
+        "cache_optimized_model": settings.ONNX_CACHE_OPTIMIZED_MODEL,
+    }
+    base = base_model_key(model_key)
+    options.update(settings.ONNX_MODEL_OPTIONS.get(base, {}))
+    if base != model_key:
+        options.update(settings.ONNX_MODEL_OPTIONS.get(model_key, {}))
+    return options
+
+
+def build_session_options(options: Dict[str, Any]) -> "ort.SessionOptions":
+    """Converte o dicionário de `model_options` em `ort.SessionOptions`."""
+    import onnxruntime as ort
+    level = options["graph_optimization"]
+    mode = options["execution_mode"]
+    if level not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Nível de otimização inválido: '{level}'. Use um de {list(GRAPH_OPTIMIZATION_LEVELS)}")
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"Modo de execução inválido: '{mode}'. Use um de {list(EXECUTION_MODES)}")
+    sess_opts = ort.SessionOptions()
+    # 0 mantém o padrão do ONNX Runtime (um thread por núcleo físico)
+    sess_opts.intra_op_num_threads = int(options["intra_op_threads"])
+    sess_opts.inter_op_num_threads = int(options["inter_op_threads"])
+    sess_opts.execution_mode = getattr(ort.ExecutionMode, EXECUTION_MODES[mode])
+    sess_opts.graph_optimization_level = getattr(ort.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[level])
+    sess_opts.enable_cpu_mem_arena = bool(options["enable_mem_arena"])
+    sess_opts.enable_mem_pattern = bool(options["enable_mem_pattern"])
+    if not options["allow_spinning"]:
+        # Sem espera ativa: threads ociosas liberam a CPU para as outras sessões e pools
+        sess_opts.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        sess_opts.add_session_config_entry("session.inter_op.allow_spinning", "0")
+    return sess_opts
+
+
+def _session_class(model_key: str) -> Type["BaseSession"]:
+    from rembg.sessions import sessions_class
+    for cls in sessions_class:
+        if cls.name() == model_key:
+            return cls
+    raise ValueError(f"No session class found for model '{model_key}'")
+
+
+def _with_model_path(cls: Type["BaseSession"], model_path: Path) -> Type["BaseSession"]:
+    """Subclasse da sessão do rembg que carrega `model_path` em vez do modelo original."""
+    return type(cls.__name__, (cls,), {"download_models": classmethod(lambda c, *args, **kwargs: str(model_path))})
+
+
+def _atomic_save(path: Path, write) -> None:
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        write(str(tmp_path))
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def quantize_model(source: str, target: Path, precision: str) -> None:
+    """Gera a variante quantizada de `source` (int8 dinâmico ou fp16) em `target`."""
+    if precision == "int8":
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        _atomic_save(target, lambda out: quantize_dynamic(source, out, weight_type=QuantType.QUInt8))
+    elif precision == "fp16":
+        try:
+            import onnx
+            from onnxconverter_common import float16
+        except ImportError as e:
+            raise RuntimeError("Variantes fp16 exigem os pacotes 'onnx' e 'onnxconverter-common'.") from e
+        model = float16.convert_float_to_float16(onnx.load(source), keep_io_types=True)
+        _atomic_save(target, lambda out: onnx.save(model, out))
+    else:
+        raise ValueError(f"Precisão não suportada: '{precision}'")
+
+
+def variant_model_path(model_key: str) -> Path:
+    """Arquivo .onnx da variante quantizada, gerado a partir do modelo base na primeira vez."""
+    base, precision = split_variant(model_key)
+    target = Path(settings.ONNX_MODEL_CACHE_DIR) / f"{model_key}.onnx"
+    with _files_lock:
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            source = str(_session_class(base).download_models())
+            logger.info("Gerando variante '%s' a partir de %s.", model_key, source)
+            quantize_model(source, target, precision)
+    return target
+
+
+def _optimized_model_path(model_key: str, options: Dict[str, Any], providers: List[str]) -> Path:
+    import onnxruntime as ort
+    # O grafo otimizado depende do nível, da versão do ONNX Runtime e do provider
+    name = f"{model_key}.{options['graph_optimization']}.ort{ort.__version__}.{providers[0]}.onnx"
+    return Path(settings.ONNX_MODEL_CACHE_DIR) / "optimized" / name
+
+
+def create_session(model_key: str, providers: Optional[List[str]] = None) -> "BaseSession":
+    """
+    Cria a sessão do rembg com as opções de `model_options`.
+
+    Variantes quantizadas e o modelo otimizado em cache são carregados por uma
+    subclasse da sessão original, que mantém o pré e pós-processamento do rembg.
+    """
+    import onnxruntime as ort
+    from rembg import new_session
+
+    providers = providers or settings.ONNX_PROVIDERS
+    base, precision = split_variant(model_key)
+    options = model_options(model_key)
+    sess_opts = build_session_options(options)
+    cls = _session_class(base)
+    model_path = variant_model_path(model_key) if precision else None
+
+    if not options["cache_optimized_model"] or base in _SINGLE_FILE_EXCLUDED:
+        if model_path is None:
+            return new_session(model_key, providers=providers, sess_opts=sess_opts)
+        return _with_model_path(cls, model_path)(base, sess_opts, providers=providers)
+
+    optimized = _optimized_model_path(model_key, options, providers)
+    if optimized.exists():
+        # Grafo já otimizado: pula a etapa de otimização no carregamento
+        sess_opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        return _with_model_path(cls, optimized)(base, sess_opts, providers=providers)
+
+    optimized.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = optimized.with_name(f".{optimized.name}.{uuid.uuid4().hex}.tmp")
+    sess_opts.optimized_model_filepath = str(tmp_path)
+    if model_path is None:
+        session = new_session(model_key, providers=providers, sess_opts=sess_opts)
+    else:
+        session = _with_model_path(cls, model_path)(base, sess_opts, providers=providers)
+    try:
+        os.replace(tmp_path, optimized)
+        logger.info("Modelo otimizado de '%s' salvo em %s.", model_key, optimized)
+    except OSError as e:
+        logger.warning("Falha ao salvar o modelo otimizado de '%s': %s", model_key, e)
+    return session
@@ -0,0 +1,132 @@
+from PIL import Image
+from typing import Any, Dict, List, Optional, Tuple
+from src.core import metrics
+from src.core.config import settings
+from src.utils.io import ALPHA_FORMATS, OUTPUT_FORMATS, available_output_formats, encode_image
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Sinônimos aceitos no parâmetro `format`
+_ALIASES = {"jpg": "jpeg"}
+
+encode_duration = metrics.registry.histogram(
+    "image_encode_duration_seconds", "Tempo de codificação da imagem de saída.", ("format",)
+)
+encoded_bytes = metrics.registry.histogram(
+    "image_encoded_bytes",
+    "Tamanho da imagem de saída codificada.",
+    ("format",),
+    buckets=(16384, 32768, 65536, 131072, 262144, 524288, 1048576, 2097152, 4194304, 8388608),
+)
+
+
+class OutputFormatError(ValueError):
+    """Formato de saída pedido não é suportado por este servidor."""
+
+
+def encoder_options(fmt: str) -> Dict[str, Any]:
+    """Parâmetros de `Image.save` configurados para o formato."""
+    if fmt == "png":
+        return {"compress_level": settings.PNG_COMPRESS_LEVEL}
+    if fmt == "webp":
+        if settings.WEBP_LOSSLESS:
+            return {"lossless": True, "quality": settings.WEBP_QUALITY, "method": settings.WEBP_METHOD}
+        # Alfa sem perdas: bordas do recorte não ganham artefatos
+        return {"quality": settings.WEBP_QUALITY, "method": settings.WEBP_METHOD, "alpha_quality": 100}
+    if fmt == "avif":
+        return {"quality": settings.AVIF_QUALITY, "speed": settings.AVIF_SPEED}
+    return {"quality": settings.JPEG_QUALITY, "optimize": False, "progressive": False}
+
+
+# Valores de OUTPUT_DEFAULT_FORMAT já avisados como indisponíveis (um aviso por valor)
+_unavailable_defaults = set()
+
+
+def default_format(has_alpha: bool) -> str:
+    """
+    `OUTPUT_DEFAULT_FORMAT` resolvido; se o formato não pode ser codificado por
+    este Pillow (ex.: `avif` sem o encoder), PNG, com um aviso no log.
+    """
+    fmt = settings.OUTPUT_DEFAULT_FORMAT.lower()
+    if fmt == "auto":
+        # JPEG para recortes opacos (fundo branco), PNG quando há transparência
+        return "png" if has_alpha else "jpeg"
+    fmt = _ALIASES.get(fmt, fmt)
+    if fmt not in available_output_formats():
+        if fmt not in _unavailable_defaults:
+            _unavailable_defaults.add(fmt)
+            logger.warning(
+                "OUTPUT_DEFAULT_FORMAT='%s' indisponível neste servidor (formatos: %s); usando PNG.",
+                settings.OUTPUT_DEFAULT_FORMAT, list(available_output_formats()),
+            )
+        return "png"
+    return fmt
+
+
+def _parse_accept(accept: str) -> List[Tuple[str, float, int]]:
+    entries = []
+    for position, part in enumerate(accept.split(",")):
+        media, *params = [piece.strip() for piece in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media:
+            entries.append((media.lower(), q, position))
+    return entries
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str], has_alpha: bool) -> str:
+    """
+    Escolhe o formato de saída.
+
+    1. `requested` (parâmetro `format`) tem prioridade; formato desconhecido levanta `OutputFormatError`.
+    2. Senão, o tipo mais preferido do cabeçalho Accept entre os disponíveis (JPEG
+       não é escolhido automaticamente para imagens com transparência). Curingas
+       (`*/*`, `image/*`) resolvem para o formato padrão.
+    3. Sem preferência utilizável, `OUTPUT_DEFAULT_FORMAT`.
+    """
+    available = available_output_formats()
+    if requested:
+        fmt = _ALIASES.get(requested.lower(), requested.lower())
+        if fmt not in available:
+            raise OutputFormatError(f"Formato '{requested}' não suportado. Formatos disponíveis: {list(available)}")
+        return fmt
+
+    default = default_format(has_alpha)
+    if not accept:
+        return default
+    by_mime = {mime: fmt for fmt, mime in OUTPUT_FORMATS.items() if fmt in available}
+    best: Optional[Tuple[float, int, int, str]] = None
+    for media, q, position in _parse_accept(accept):
+        if q <= 0:
+            continue
+        if media in ("*/*", "image/*"):
+            fmt, specific = default, 0
+        elif media in by_mime:
+            fmt, specific = by_mime[media], 1
+            if has_alpha and fmt not in ALPHA_FORMATS:
+                continue
+        else:
+            continue
+        # Maior q vence; em empate, tipo explícito antes de curinga e depois a ordem do cabeçalho
+        candidate = (q, specific, -position, fmt)
+        if best is None or candidate > best:
+            best = candidate
+    return best[3] if best is not None else default
+
+
+def encode_output(image: Image.Image, fmt: str) -> bytes:
+    """Codifica a imagem final no formato negociado, registrando tempo e tamanho."""
+    started = time.perf_counter()
+    with metrics.stage("encode"):
+        data = encode_image(image, fmt, encoder_options(fmt))
+    encode_duration.observe(time.perf_counter() - started, format=fmt)
+    encoded_bytes.observe(len(data), format=fmt)
+    return data
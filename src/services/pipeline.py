@@ -0,0 +1,346 @@
+"""
+Etapas de processamento compartilhadas pelos endpoints de imagem e pelos
+workers da fila de jobs: decodificação, remoção de fundo (opcionalmente só na
+região do recorte), recortes e codificação da saída.
+
+As funções assíncronas usam o `inference_executor` diretamente; com a fila
+cheia, `QueueFullError` chega a quem chamou (503 na API, nova tentativa no
+worker). Falhas de download chegam como `DownloadError`.
+"""
+from PIL import Image
+from typing import List, Literal, Optional, Tuple, Union
+from src.core import metrics
+from src.core.config import settings
+from src.services.assets import Asset, asset_id, asset_store
+from src.services.background import compose_cutout, remove_bg, stack_masks, unstack_masks
+from src.services.cache import result_cache, content_digest, make_key
+from src.services.download import downloader
+from src.services.executor import inference_executor
+from src.services.intake import inspect_bytes
+from src.services.face import detect_face, detect_face_from_bytes, detect_faces, detect_faces_from_bytes, original_size, FACE_MODEL_KEY, FaceDetection
+from src.services.output import encode_output
+from src.services.storage import result_storage
+from src.utils.frame import ImageFrame
+from src.utils.images import crop_to_round_centered_on_face, crop_round_portrait_composed, crop_to_square_centered_on_face, center_face_coords, paste_on_color
+from src.utils.images import square_crop_box, expand_box, offset_face_coords
+from src.utils.io import sniff_image_type, MAGIC_BYTES_NEEDED
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tipos de processamento de /process-url/ e dos jobs
+ProcessingType = Literal["crop", "remove_bg", "crop_remove_bg"]
+
+# Formas de /assets/{id}/recompose: as mesmas saídas de process-url e do endpoint legado
+RecomposeShape = Literal["round", "square", "portrait"]
+
+# Origem de um recorte: o frame original ou o recorte RGBA sem fundo
+ImageSource = Union[ImageFrame, Image.Image]
+
+# Lado dos recortes circular e quadrado (padrão de `output_size` em utils/images.py)
+CROP_OUTPUT_SIDE = 512
+
+# Fatores de redução suportados pelo `draft` do libjpeg, do maior para o menor
+JPEG_DRAFT_SCALES = (8, 4, 2)
+
+
+def decode_frame(image_bytes: bytes, digest: Optional[str] = None) -> ImageFrame:
+    with metrics.stage("decode"):
+        return ImageFrame.from_bytes(image_bytes, digest)
+
+
+def as_image(source: ImageSource) -> Image.Image:
+    # Sem converter o frame inteiro: os recortes convertem apenas a região recortada
+    return source.image if isinstance(source, ImageFrame) else source
+
+
+def crop_reduce_factor(crop_box: Tuple[int, int, int, int], output_side: int = CROP_OUTPUT_SIDE) -> int:
+    """Maior fator de `draft` em que a caixa do recorte ainda tem pelo menos `output_side` px."""
+    side = min(crop_box[2] - crop_box[0], crop_box[3] - crop_box[1])
+    return next((scale for scale in JPEG_DRAFT_SCALES if side // scale >= output_side), 1)
+
+
+def decode_for_crops(image_bytes: bytes, digest: Optional[str], faces: List[FaceDetection]) -> Tuple[ImageFrame, List[FaceDetection]]:
+    """
+    Decodifica a imagem na menor escala em que o recorte de cada face (ou o do
+    centro da imagem, sem faces) ainda cobre a saída e converte as coordenadas
+    para a escala decodificada.
+    """
+    with metrics.stage("decode"):
+        full_size = original_size(image_bytes)
+        boxes = [square_crop_box(coords) for coords, _ in faces] or [square_crop_box(center_face_coords(full_size))]
+        frame = ImageFrame.scaled_from_bytes(image_bytes, min(crop_reduce_factor(box) for box in boxes), digest)
+    if faces and frame.size != full_size:
+        sx, sy = frame.width / full_size[0], frame.height / full_size[1]
+        faces = [((int(x * sx), int(y * sy), int(w * sx), int(h * sy)), score) for (x, y, w, h), score in faces]
+        logger.debug("Imagem decodificada em %s (original %s) para o recorte.", frame.size, full_size)
+    return frame, faces
+
+
+def decode_for_crop(image_bytes: bytes, digest: Optional[str], face_coords) -> Tuple[ImageFrame, Optional[Tuple[int, int, int, int]]]:
+    """`decode_for_crops` para uma única face (ou nenhuma)."""
+    frame, faces = decode_for_crops(image_bytes, digest, [(face_coords, 1.0)] if face_coords else [])
+    return frame, faces[0][0] if faces else None
+
+
+async def detect_for_crop(image_bytes: bytes, digest: Optional[str]) -> Tuple[ImageFrame, Optional[Tuple[int, int, int, int]]]:
+    """
+    Decodifica a imagem e detecta a face para os recortes de tamanho fixo
+    (`CROP_OUTPUT_SIDE`). Retorna o frame e as coordenadas da face nele (None sem face).
+
+    Com `CROP_JPEG_DRAFT`, JPEGs nunca são decodificados na resolução original:
+    a face é detectada em uma decodificação reduzida e a imagem é decodificada
+    de novo na menor escala do libjpeg em que a caixa do recorte ainda cobre a saída.
+    """
+    if not _reduced_decode(image_bytes):
+        frame = await inference_executor.run_cpu(decode_frame, image_bytes, digest)
+        return frame, await inference_executor.run_inference(FACE_MODEL_KEY, detect_face, frame)
+    face_coords = await inference_executor.run_inference(FACE_MODEL_KEY, detect_face_from_bytes, image_bytes)
+    return await inference_executor.run_cpu(decode_for_crop, image_bytes, digest, face_coords)
+
+
+def _reduced_decode(image_bytes: bytes) -> bool:
+    jpeg = sniff_image_type(image_bytes[:MAGIC_BYTES_NEEDED]) == "image/jpeg"
+    return jpeg and settings.CROP_JPEG_DRAFT and settings.FACE_DETECTION_MAX_SIDE > 0
+
+
+async def detect_faces_for_crop(image_bytes: bytes, digest: Optional[str], max_faces: Optional[int] = None) -> Tuple[ImageFrame, List[FaceDetection]]:
+    """Como `detect_for_crop`, com todas as faces detectadas (até `max_faces`) em uma única detecção."""
+    if not _reduced_decode(image_bytes):
+        frame = await inference_executor.run_cpu(decode_frame, image_bytes, digest)
+        return frame, await inference_executor.run_inference(FACE_MODEL_KEY, detect_faces, frame, max_faces)
+    faces = await inference_executor.run_inference(FACE_MODEL_KEY, detect_faces_from_bytes, image_bytes, max_faces)
+    return await inference_executor.run_cpu(decode_for_crops, image_bytes, digest, faces)
+
+
+def use_roi(roi: Optional[bool]) -> bool:
+    return settings.ROI_SEGMENTATION_ENABLED if roi is None else roi
+
+
+def roi_region(frame_size: Tuple[int, int], crop_boxes: List, roi: bool) -> Optional[Tuple[int, int, int, int]]:
+    """Região segmentada com `roi` (união das caixas mais a margem); None para a imagem inteira."""
+    if not roi:
+        return None
+    union = (
+        min(box[0] for box in crop_boxes),
+        min(box[1] for box in crop_boxes),
+        max(box[2] for box in crop_boxes),
+        max(box[3] for box in crop_boxes),
+    )
+    region = expand_box(union, frame_size, settings.ROI_MARGIN_RATIO)
+    return None if region == (0, 0, frame_size[0], frame_size[1]) else region
+
+
+async def remove_bg_for_crop(frame: ImageFrame, model: str, face_coords, crop_box, roi: bool) -> Tuple[Image.Image, Tuple[int, int, int, int]]:
+    """
+    Remove o fundo para um recorte ao redor da face.
+
+    Com `roi`, apenas a caixa do recorte (mais `ROI_MARGIN_RATIO` de contexto)
+    passa pelo modelo: a região é segmentada na resolução de entrada do modelo e a
+    máscara volta ao tamanho da região. Retorna o recorte sem fundo e as
+    coordenadas da face no sistema de coordenadas dele.
+    """
+    cutout, (face_coords,) = await remove_bg_for_crops(frame, model, [face_coords], [crop_box], roi)
+    return cutout, face_coords
+
+
+async def remove_bg_for_crops(frame: ImageFrame, model: str, faces_coords: List, crop_boxes: List, roi: bool) -> Tuple[Image.Image, List]:
+    """
+    Como `remove_bg_for_crop`, para vários recortes da mesma imagem com uma única
+    inferência: com `roi`, a região segmentada é a união das caixas.
+    """
+    region = roi_region(frame.size, crop_boxes, roi)
+    if region is None:
+        return await inference_executor.run_inference(model, remove_bg, frame, model_key=model), list(faces_coords)
+    logger.debug("Segmentando apenas a região %s de %s.", region, frame.size)
+    region_frame = await inference_executor.run_cpu(frame.crop, region)
+    cutout = await inference_executor.run_inference(model, remove_bg, region_frame, model_key=model)
+    return cutout, [offset_face_coords(coords, region) for coords in faces_coords]
+
+
+# Recortes e codificação rodam juntos no pool de CPU. Círculo e quadrado saem
+# opacos (fundo branco); o retrato composto mantém a transparência.
+def crop_round_output(source: ImageSource, face_coords, fmt: str) -> bytes:
+    with metrics.stage("crop"):
+        result = crop_to_round_centered_on_face(as_image(source), face_coords)
+    return encode_output(result, fmt)
+
+
+def crop_square_output(source: ImageSource, face_coords, fmt: str) -> bytes:
+    with metrics.stage("crop"):
+        result = crop_to_square_centered_on_face(as_image(source), face_coords)
+    return encode_output(result, fmt)
+
+
+def face_crops_output(source: ImageSource, faces_coords: List, shape: str, fmt: str) -> List[bytes]:
+    """Um recorte (`round` ou `square`) por face, todos a partir da mesma imagem decodificada."""
+    crop = crop_to_round_centered_on_face if shape == "round" else crop_to_square_centered_on_face
+    image = as_image(source)
+    outputs = []
+    for face_coords in faces_coords:
+        with metrics.stage("crop"):
+            result = crop(image, face_coords)
+        outputs.append(encode_output(result, fmt))
+    return outputs
+
+
+def portrait_output(source: ImageSource, face_coords, radius_scale: float, vertical_bias: float, fmt: str) -> bytes:
+    with metrics.stage("crop"):
+        result = crop_round_portrait_composed(as_image(source), face_coords, radius_scale=radius_scale, vertical_bias=vertical_bias)
+    return encode_output(result, fmt)
+
+
+def decode_scale(image_bytes: bytes, frame: ImageFrame) -> int:
+    """Fator de `draft` (1, 2, 4 ou 8) com que `frame` foi decodificado a partir de `image_bytes`."""
+    width, height = original_size(image_bytes)
+    return next((scale for scale in JPEG_DRAFT_SCALES if (-(-width // scale), -(-height // scale)) == frame.size), 1)
+
+
+def build_asset(image_bytes: bytes, frame: ImageFrame, source: ImageSource, face_coords, region, model: Optional[str]) -> Asset:
+    """
+    Intermediários de um recorte para `/assets/{id}/recompose`: os bytes originais,
+    a escala de decodificação, a região segmentada e a máscara (o alfa do recorte
+    sem fundo, em PNG 8 bits), com a face no sistema de coordenadas da máscara.
+    """
+    mask = None
+    if model is not None:
+        with metrics.stage("asset"):
+            mask = stack_masks([as_image(source).getchannel("A")])
+    return Asset(
+        image_bytes=image_bytes,
+        face_coords=tuple(face_coords),
+        reduce=decode_scale(image_bytes, frame),
+        region=region,
+        mask=mask,
+        model=model,
+    )
+
+
+def recompose_output(
+    asset: Asset,
+    shape: str,
+    fmt: str,
+    radius_scale: Optional[float] = None,
+    vertical_bias: Optional[float] = None,
+    size: Optional[int] = None,
+    background: Optional[Tuple[int, int, int]] = None,
+) -> bytes:
+    """
+    Novo recorte a partir dos intermediários do asset: decodifica a imagem na
+    mesma escala, reaplica a máscara e só então a geometria (`utils/images.py`).
+    `background` preenche o fundo removido; parâmetros omitidos usam os padrões da forma.
+    """
+    with metrics.stage("decode"):
+        frame = ImageFrame.scaled_from_bytes(asset.image_bytes, asset.reduce)
+        if asset.region is not None:
+            frame = frame.crop(asset.region)
+    image = compose_cutout(frame, unstack_masks(asset.mask, frame.size)) if asset.mask else frame.image
+    with metrics.stage("crop"):
+        if background is not None and image.mode == "RGBA":
+            image = paste_on_color(image, background)
+        geometry = {name: value for name, value in (("radius_scale", radius_scale), ("vertical_bias", vertical_bias)) if value is not None}
+        if shape == "portrait":
+            result = crop_round_portrait_composed(image, asset.face_coords, **geometry)
+            if size:
+                scale = size / max(result.size)
+                result = result.resize((max(1, round(result.width * scale)), max(1, round(result.height * scale))), Image.Resampling.LANCZOS)
+        else:
+            if size:
+                geometry["output_size"] = (size, size)
+            crop = crop_to_round_centered_on_face if shape == "round" else crop_to_square_centered_on_face
+            result = crop(image, asset.face_coords, **geometry)
+    return encode_output(result, fmt)
+
+
+async def fetch_image(image_url: str) -> bytes:
+    """Download assíncrono: valida Content-Type, magic bytes e tamanho máximo."""
+    with metrics.stage("download"):
+        image_bytes = await downloader.fetch(image_url)
+    logger.debug("Imagem baixada com sucesso. Tamanho: %s bytes", len(image_bytes))
+    return image_bytes
+
+
+async def process_url_image(image_url: str, processing_type: str, model: str, roi: Optional[bool], fmt: str) -> bytes:
+    """
+    Baixa a imagem e aplica `processing_type`:
+
+    - `crop`: recorte circular centrado na face;
+    - `remove_bg`: remove o fundo e centraliza em um quadrado;
+    - `crop_remove_bg`: remove o fundo e recorta em círculo.
+
+    Sem face detectada, usa o centro da imagem. O resultado é cacheado.
+    """
+    return await process_image_bytes(await fetch_image(image_url), processing_type, model, roi, fmt)
+
+
+async def process_image_bytes(image_bytes: bytes, processing_type: str, model: str, roi: Optional[bool], fmt: str, digest: Optional[str] = None) -> bytes:
+    """Mesmo processamento de `process_url_image` para uma imagem já em memória."""
+    processed_bytes, _ = await process_image_asset(image_bytes, processing_type, model, roi, fmt, digest, keep_asset=False)
+    return processed_bytes
+
+
+async def process_image_asset(
+    image_bytes: bytes,
+    processing_type: str,
+    model: str,
+    roi: Optional[bool],
+    fmt: str,
+    digest: Optional[str] = None,
+    keep_asset: bool = True,
+) -> Tuple[bytes, Optional[str]]:
+    """
+    `process_image_bytes` que também guarda (com `keep_asset` e `ASSET_CACHE_ENABLED`)
+    a imagem, a máscara e a face para `/assets/{id}/recompose`. Retorna o resultado
+    e o id do asset (None se não houver um disponível).
+    """
+    # Formato e dimensões pelo cabeçalho antes de decodificar (IntakeError se recusada)
+    inspect_bytes(image_bytes)
+    if digest is None:
+        digest = await inference_executor.run_cpu(content_digest, image_bytes)
+    cache_model = model if processing_type != "crop" else None
+    region_only = use_roi(roi) and cache_model is not None
+    keep_asset = keep_asset and asset_store.enabled
+    key = asset_id("process-url", digest, model_key=cache_model, roi=region_only) if keep_asset else None
+    cache_key = make_key("process-url", digest, processing_type=processing_type, model_key=cache_model, roi=region_only, fmt=fmt)
+    processed_bytes = result_cache.get(cache_key)
+    if processed_bytes is not None and (key is None or asset_store.get(key) is not None):
+        logger.debug("Resultado do processamento via URL encontrado no cache.")
+        return processed_bytes, key
+
+    frame, face_coords = await detect_for_crop(image_bytes, digest)
+    if not face_coords:
+        logger.warning("Nenhuma face encontrada, usando fallback para o centro da imagem.")
+        face_coords = center_face_coords(frame.size)
+
+    region = None
+    if processing_type in ["remove_bg", "crop_remove_bg"]:
+        logger.debug("Removendo fundo com modelo: %s", model)
+        crop_box = square_crop_box(face_coords)
+        region = roi_region(frame.size, [crop_box], region_only)
+        source, face_coords = await remove_bg_for_crop(frame, model, face_coords, crop_box, region_only)
+    else:
+        source = frame
+    if key is not None:
+        # Só a montagem roda no pool: com CPU_EXECUTOR=process o store do worker não é o da API
+        asset_store.save(key, await inference_executor.run_cpu(build_asset, image_bytes, frame, source, face_coords, region, cache_model))
+
+    if processing_type == "remove_bg":
+        logger.debug("Centralizando e redimensionando imagem sem fundo...")
+        processed_bytes = await inference_executor.run_cpu(crop_square_output, source, face_coords, fmt)
+    else:
+        logger.debug("Iniciando recorte circular...")
+        processed_bytes = await inference_executor.run_cpu(crop_round_output, source, face_coords, fmt)
+    result_cache.set(cache_key, processed_bytes)
+    return processed_bytes, key
+
+
+async def store_result(data: bytes, fmt: str) -> str:
+    """
+    Publica o resultado no `result_storage` configurado e retorna a chave, usada
+    depois em `result_storage.url(chave)`. Aguardar a gravação garante que a URL
+    devolvida ao cliente já existe.
+    """
+    with metrics.stage("storage_write"):
+        key = await result_storage.save(data, fmt)
+    logger.info("Imagem processada publicada (%s): %s", result_storage.backend, key)
+    return key
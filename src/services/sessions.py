@@ -0,0 +1,190 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from PIL import Image
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _resident_bytes() -> Optional[int]:
+    """Memória residente (RSS) do processo, lida de /proc; None fora do Linux."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _model_file_bytes(session: Any) -> int:
+    path = getattr(getattr(session, "inner_session", None), "_model_path", None)
+    try:
+        return os.path.getsize(path) if path else 0
+    except OSError:
+        return 0
+
+
+@dataclass
+class LoadedSession:
+    name: str
+    session: Any
+    size_bytes: int
+    load_seconds: float
+    loaded_at: float = field(default_factory=time.time)
+    last_used_at: float = field(default_factory=time.time)
+    uses: int = 0
+    pinned: bool = False
+    warmed: bool = False
+
+
+class SessionManager:
+    """
+    Mantém as sessões rembg carregadas dentro de um orçamento de memória.
+
+    O tamanho de cada sessão é estimado pelo aumento do RSS durante o carregamento
+    (com o tamanho do arquivo .onnx como piso). Ao ultrapassar o orçamento, as
+    sessões menos recentemente usadas são descartadas, exceto as pré-carregadas
+    (fixadas). Carregamentos são serializados para que a medição seja confiável
+    e para que dois pedidos simultâneos não carreguem o mesmo modelo duas vezes.
+    """
+
+    def __init__(self, factory: Callable[[str], Any], memory_budget_bytes: int, preload_models: Iterable[str] = ()):
+        self.factory = factory
+        self.memory_budget_bytes = memory_budget_bytes
+        self.preload_models = list(preload_models)
+        self.errors: Dict[str, str] = {}
+        self._sessions: "OrderedDict[str, LoadedSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._ready = threading.Event()
+        if not self.preload_models:
+            self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        """True quando o pré-carregamento (e warm-up) terminou."""
+        return self._ready.is_set()
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.size_bytes for entry in self._sessions.values())
+
+    def _touch(self, model_key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._sessions.get(model_key)
+            if entry is None:
+                return None
+            self._sessions.move_to_end(model_key)
+            entry.last_used_at = time.time()
+            entry.uses += 1
+            return entry.session
+
+    def get(self, model_key: str) -> Any:
+        """Retorna a sessão do modelo, carregando-a se necessário."""
+        session = self._touch(model_key)
+        if session is not None:
+            return session
+        with self._load_lock:
+            session = self._touch(model_key)
+            if session is not None:
+                return session
+            self._load(model_key)
+        return self._touch(model_key)
+
+    def _load(self, model_key: str, pinned: bool = False) -> LoadedSession:
+        logger.info("Carregando modelo '%s' via rembg.", model_key)
+        rss_before = _resident_bytes()
+        started = time.perf_counter()
+        session = self.factory(model_key)
+        load_seconds = time.perf_counter() - started
+        rss_after = _resident_bytes()
+        rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else 0
+        size = max(rss_delta, _model_file_bytes(session))
+        entry = LoadedSession(model_key, session, size_bytes=size, load_seconds=load_seconds, pinned=pinned)
+        with self._lock:
+            self._sessions[model_key] = entry
+        self.errors.pop(model_key, None)
+        logger.info("Modelo '%s' carregado em %.1fs (~%.0f MB).", model_key, load_seconds, size / 2**20)
+        self._enforce_budget(keep=model_key)
+        return entry
+
+    def _enforce_budget(self, keep: str) -> None:
+        with self._lock:
+            total = sum(entry.size_bytes for entry in self._sessions.values())
+            for name in list(self._sessions):
+                if total <= self.memory_budget_bytes:
+                    break
+                entry = self._sessions[name]
+                if name == keep or entry.pinned:
+                    continue
+                del self._sessions[name]
+                total -= entry.size_bytes
+                logger.info("Sessão '%s' descartada para respeitar o orçamento de memória.", name)
+            if total > self.memory_budget_bytes:
+                logger.warning(
+                    "Sessões carregadas (~%.0f MB) excedem o orçamento de %.0f MB.",
+                    total / 2**20, self.memory_budget_bytes / 2**20,
+                )
+
+    def evict(self, model_key: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(model_key, None) is not None
+
+    def warm_up(self, model_key: str) -> None:
+        """Executa uma inferência descartável para alocar buffers e inicializar kernels."""
+        session = self.get(model_key)
+        started = time.perf_counter()
+        # Gradiente (e não uma cor sólida) para não zerar o min-max do pós-processamento do rembg
+        session.predict(Image.linear_gradient("L").resize((64, 64)).convert("RGB"))
+        with self._lock:
+            entry = self._sessions.get(model_key)
+            if entry is not None:
+                entry.warmed = True
+        logger.info("Warm-up do modelo '%s' concluído em %.1fs.", model_key, time.perf_counter() - started)
+
+    def preload(self, warmup: bool = True) -> None:
+        """Carrega (e aquece) os modelos configurados; marca a aplicação como pronta ao final."""
+        try:
+            for model_key in self.preload_models:
+                try:
+                    with self._load_lock:
+                        if model_key in self._sessions:
+                            self._sessions[model_key].pinned = True
+                        else:
+                            self._load(model_key, pinned=True)
+                    if warmup:
+                        self.warm_up(model_key)
+                except Exception as e:
+                    self.errors[model_key] = str(e)
+                    logger.error("Falha ao pré-carregar o modelo '%s': %s", model_key, e, exc_info=True)
+        finally:
+            self._ready.set()
+
+    def start_preload(self, warmup: bool = True) -> Optional[threading.Thread]:
+        """Dispara o pré-carregamento em segundo plano (a API responde /health com 503 até o fim)."""
+        if not self.preload_models:
+            return None
+        self._ready.clear()
+        thread = threading.Thread(target=self.preload, kwargs={"warmup": warmup}, name="model-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def loaded(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "name": entry.name,
+                    "size_bytes": entry.size_bytes,
+                    "load_seconds": round(entry.load_seconds, 3),
+                    "loaded_at": entry.loaded_at,
+                    "last_used_at": entry.last_used_at,
+                    "uses": entry.uses,
+                    "pinned": entry.pinned,
+                    "warmed": entry.warmed,
+                }
+                for entry in self._sessions.values()
+            ]
@@ -0,0 +1,392 @@
+"""
+Diretórios de arquivos gerados pela API — resultados de /process-url/ e dos
+jobs (`temp_images`) e imagens de depuração (`debug_images`) — com prazo de
+validade (TTL) e cota de tamanho.
+
+- `ManagedDirectory.sweep()` remove os arquivos mais velhos que o TTL e, se o
+  total ainda passar da cota, os mais antigos primeiro;
+- `StorageSweeper` repete a varredura em uma thread a cada `STORAGE_SWEEP_INTERVAL`;
+- as gravações rodam na thread de `background_writer`, fora do event loop e do
+  pool de CPU. Imagens de depuração são descartáveis: com a fila de gravação
+  cheia, elas simplesmente não são salvas;
+- os resultados publicados por URL passam por um `ResultStorage`: o diretório
+  local (servido pela própria API ou por `RESULT_BASE_URL`) ou um bucket S3
+  compatível (AWS, MinIO), compartilhado entre réplicas. A chave é o hash do
+  conteúdo, então saídas idênticas são gravadas uma única vez.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from src.core import metrics
+from src.core.config import settings
+from src.utils.io import FILE_EXTENSIONS, OUTPUT_FORMATS
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Arquivos mantidos no repositório/diretório mesmo fora do prazo
+_KEEP = {".gitkeep"}
+
+
+class ManagedDirectory:
+    """Diretório com TTL (`ttl_seconds`, 0 = sem prazo) e cota (`max_bytes`, 0 = sem cota)."""
+
+    def __init__(self, name: str, path: str, ttl_seconds: float = 0, max_bytes: int = 0):
+        self.name = name
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Estimativa do total em disco, recalculada a cada varredura
+        self._bytes = 0
+        self._files = 0
+        # Criado na primeira gravação (ou no início da aplicação), não na importação
+        self._created = False
+
+    def path_for(self, filename: str) -> str:
+        return os.path.join(self.path, filename)
+
+    def ensure(self) -> None:
+        if not self._created:
+            os.makedirs(self.path, exist_ok=True)
+            self._created = True
+
+    def write(self, filename: str, data: bytes) -> str:
+        """Grava `data` de forma atômica (arquivo temporário + rename) e retorna o caminho."""
+        self.ensure()
+        file_path = self.path_for(filename)
+        tmp_path = self.path_for(f".{filename}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        with self._lock:
+            self._bytes += len(data)
+            self._files += 1
+            over_quota = self.max_bytes > 0 and self._bytes > self.max_bytes
+        if over_quota:
+            self.sweep()
+        return file_path
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        if not os.path.isdir(self.path):
+            return entries
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name in _KEEP or not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _remove(self, path: str, reason: str) -> bool:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.warning("Falha ao remover %s: %s", path, e)
+            return False
+        evicted_files.inc(directory=self.name, reason=reason)
+        return True
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Remove arquivos vencidos e, acima da cota, os mais antigos. Retorna quantos foram removidos."""
+        now = time.time() if now is None else now
+        removed = 0
+        kept = []
+        for mtime, size, path in self._entries():
+            if self.ttl_seconds > 0 and now - mtime > self.ttl_seconds:
+                removed += self._remove(path, "ttl")
+            else:
+                kept.append((mtime, size, path))
+        total = sum(size for _, size, _ in kept)
+        if self.max_bytes > 0 and total > self.max_bytes:
+            kept.sort()
+            while kept and total > self.max_bytes:
+                _, size, path = kept.pop(0)
+                if self._remove(path, "quota"):
+                    removed += 1
+                    total -= size
+        with self._lock:
+            self._bytes, self._files = total, len(kept)
+        if removed:
+            logger.info("Limpeza de %s: %s arquivo(s) removido(s), %s bytes em uso.", self.path, removed, total)
+        return removed
+
+    def usage(self) -> Dict[str, int]:
+        with self._lock:
+            return {"files": self._files, "bytes": self._bytes}
+
+
+class StorageSweeper:
+    """Thread que varre os diretórios periodicamente (a primeira varredura é imediata)."""
+
+    def __init__(self, directories: List[ManagedDirectory], interval: float = 300):
+        self.directories = directories
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sweep(self) -> int:
+        removed = 0
+        for directory in self.directories:
+            try:
+                removed += directory.sweep()
+            except Exception as e:
+                logger.error("Erro na limpeza de %s: %s", directory.path, e, exc_info=True)
+        return removed
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.sweep()
+            self._stop.wait(self.interval)
+
+    def start(self) -> Optional[threading.Thread]:
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="storage-sweeper", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+class BackgroundWriter:
+    """Uma thread dedicada a gravações em disco, com fila limitada para as descartáveis."""
+
+    def __init__(self, max_pending: int = 64):
+        self.max_pending = max(1, max_pending)
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-writer")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Falha em gravação em segundo plano: %s", future.exception())
+
+    def _submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        with self._lock:
+            self._pending += 1
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Optional[Future]:
+        """Agenda uma gravação descartável; retorna None (sem gravar) com a fila cheia."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return None
+        return self._submit(fn, *args)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Executa a gravação na thread de escrita e aguarda o resultado."""
+        return await asyncio.wrap_future(self._submit(fn, *args))
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+
+def result_key(data: bytes, fmt: str) -> str:
+    """Nome do resultado derivado do conteúdo: saídas idênticas compartilham o mesmo objeto."""
+    return f"{hashlib.sha256(data).hexdigest()}.{FILE_EXTENSIONS[fmt]}"
+
+
+class ResultStorage:
+    """Destino dos resultados devolvidos por URL (/process-url/ e jobs)."""
+
+    backend = ""
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        raise NotImplementedError
+
+    def url(self, key: str, request: Any = None) -> str:
+        """URL do resultado; `request` (da API) permite montar URLs absolutas para o backend local."""
+        raise NotImplementedError
+
+    def _store(self, key: str, data: bytes, fmt: str) -> None:
+        if self.exists(key):
+            result_writes.inc(backend=self.backend, dedup="hit")
+            return
+        self.put(key, data, OUTPUT_FORMATS[fmt])
+        result_writes.inc(backend=self.backend, dedup="miss")
+
+    async def save(self, data: bytes, fmt: str) -> str:
+        """Grava o resultado na thread de escrita (se ainda não existir) e retorna a chave."""
+        key = result_key(data, fmt)
+        await background_writer.run(self._store, key, data, fmt)
+        return key
+
+
+class LocalResultStorage(ResultStorage):
+    """Resultados em um `ManagedDirectory`, servidos em /static/temp_images ou em `base_url`."""
+
+    backend = "local"
+
+    def __init__(self, directory: ManagedDirectory, base_url: Optional[str] = None):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/") + "/" if base_url else None
+
+    def exists(self, key: str) -> bool:
+        try:
+            # Reaproveitar renova o prazo do arquivo
+            os.utime(self.directory.path_for(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        self.directory.write(key, data)
+
+    def url(self, key: str, request: Any = None) -> str:
+        if self.base_url:
+            return self.base_url + key
+        if request is not None:
+            return str(request.url_for("temp_images", path=key))
+        return f"/static/temp_images/{key}"
+
+
+class S3ResultStorage(ResultStorage):
+    """
+    Resultados em um bucket S3 compatível (AWS, MinIO etc.; `endpoint_url` aponta
+    para serviços fora da AWS). O upload usa o `TransferConfig` do boto3, que
+    envia em partes acima de `multipart_threshold`. As URLs são pré-assinadas,
+    ou fixas quando `public_base_url` é informado (bucket público/CDN).
+    """
+
+    backend = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        presign_expires: int = 3600,
+        public_base_url: Optional[str] = None,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        multipart_chunksize: int = 8 * 1024 * 1024,
+    ):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise RuntimeError("RESULT_STORAGE_BACKEND=s3 exige o pacote 'boto3'.") from e
+        if not bucket:
+            raise ValueError("RESULT_STORAGE_BACKEND=s3 exige S3_BUCKET.")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presign_expires = presign_expires
+        self.public_base_url = public_base_url.rstrip("/") + "/" if public_base_url else None
+        self._client_error = ClientError
+        self._transfer_config = TransferConfig(multipart_threshold=multipart_threshold, multipart_chunksize=multipart_chunksize)
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            # SigV4 nas URLs pré-assinadas (exigido pelo MinIO e por regiões novas da AWS)
+            config=Config(signature_version="s3v4"),
+        )
+
+    def _object_key(self, key: str) -> str:
+        return self.prefix + key
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        self.client.upload_fileobj(
+            io.BytesIO(data),
+            self.bucket,
+            self._object_key(key),
+            # Conteúdo endereçado pelo hash: o objeto nunca muda
+            ExtraArgs={"ContentType": content_type, "CacheControl": "public, max-age=31536000, immutable"},
+            Config=self._transfer_config,
+        )
+
+    def url(self, key: str, request: Any = None) -> str:
+        if self.public_base_url:
+            return self.public_base_url + self._object_key(key)
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._object_key(key)}, ExpiresIn=self.presign_expires
+        )
+
+
+def result_storage_from_settings() -> ResultStorage:
+    backend = settings.RESULT_STORAGE_BACKEND
+    if backend == "local":
+        return LocalResultStorage(temp_storage, base_url=settings.RESULT_BASE_URL)
+    if backend == "s3":
+        return S3ResultStorage(
+            settings.S3_BUCKET,
+            prefix=settings.S3_PREFIX,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region=settings.S3_REGION,
+            access_key_id=settings.S3_ACCESS_KEY_ID,
+            secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            presign_expires=settings.S3_PRESIGNED_URL_EXPIRES,
+            public_base_url=settings.S3_PUBLIC_BASE_URL,
+            multipart_threshold=settings.S3_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+            multipart_chunksize=settings.S3_MULTIPART_CHUNK_MB * 1024 * 1024,
+        )
+    raise ValueError(f"RESULT_STORAGE_BACKEND inválido: '{backend}' (use 'local' ou 's3')")
+
+
+temp_storage = ManagedDirectory(
+    "temp_images", "temp_images", ttl_seconds=settings.TEMP_IMAGES_TTL_SECONDS, max_bytes=settings.TEMP_IMAGES_MAX_BYTES
+)
+debug_storage = ManagedDirectory(
+    "debug_images", "debug_images", ttl_seconds=settings.DEBUG_IMAGES_TTL_SECONDS, max_bytes=settings.DEBUG_IMAGES_MAX_BYTES
+)
+storage_sweeper = StorageSweeper([temp_storage, debug_storage], interval=settings.STORAGE_SWEEP_INTERVAL)
+background_writer = BackgroundWriter(max_pending=settings.STORAGE_WRITE_QUEUE)
+result_storage = result_storage_from_settings()
+
+evicted_files = metrics.registry.counter(
+    "storage_evicted_files_total", "Arquivos removidos pela limpeza (reason=ttl|quota).", ("directory", "reason")
+)
+metrics.registry.gauge(
+    "storage_bytes",
+    "Bytes em uso por diretório gerenciado (estimativa da última varredura + gravações).",
+    ("directory",),
+    callback=lambda: [({"directory": d.name}, d.usage()["bytes"]) for d in (temp_storage, debug_storage)],
+)
+result_writes = metrics.registry.counter(
+    "result_storage_writes_total", "Resultados publicados (dedup=hit quando o mesmo conteúdo já existia).", ("backend", "dedup")
+)
+metrics.registry.gauge(
+    "storage_write_queue", "Gravações em disco aguardando a thread de escrita.", callback=lambda: [({}, background_writer.pending)]
+)
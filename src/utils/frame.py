@@ -0,0 +1,161 @@
+from PIL import Image, ImageOps
+from typing import Dict, Optional, Tuple
+import numpy as np
+import hashlib
+import io
+
+
+class ImageFrame:
+    """
+    Imagem decodificada uma única vez e compartilhada entre detecção de face,
+    remoção de fundo e recorte.
+
+    A orientação EXIF é aplicada na decodificação, de forma que todas as etapas
+    trabalham no mesmo sistema de coordenadas. As visões RGB, BGR e RGBA são
+    derivadas sob demanda e reaproveitadas.
+    """
+
+    def __init__(self, image: Image.Image, source: Optional[bytes] = None, digest: Optional[str] = None):
+        self._image = image
+        self.source = source
+        self._digest = digest
+        self._rgb_image: Optional[Image.Image] = None
+        self._rgba_image: Optional[Image.Image] = None
+        self._rgb: Optional[np.ndarray] = None
+        self._bgr: Optional[np.ndarray] = None
+        self._proxies: Dict[int, "ImageFrame"] = {}
+
+    @classmethod
+    def from_bytes(cls, data: bytes, digest: Optional[str] = None) -> "ImageFrame":
+        """
+        Decodifica os bytes de uma imagem (corrigindo a orientação EXIF).
+        `digest` pode ser informado quando o hash dos bytes já foi calculado.
+        """
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+        return cls(image, source=data, digest=digest)
+
+    @classmethod
+    def reduced_from_bytes(cls, data: bytes, max_side: int) -> "ImageFrame":
+        """
+        Decodifica uma versão reduzida (maior lado próximo de `max_side`).
+
+        Para JPEG usa a decodificação em escala reduzida do libjpeg (`draft`),
+        que custa uma fração da decodificação completa; outros formatos são
+        decodificados por inteiro e reduzidos em seguida.
+        """
+        image = Image.open(io.BytesIO(data))
+        if image.format == "JPEG":
+            image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+        frame = cls(image)
+        return frame.proxy(max_side) if max(frame.size) > max_side else frame
+
+    @classmethod
+    def scaled_from_bytes(cls, data: bytes, reduce: int, digest: Optional[str] = None) -> "ImageFrame":
+        """
+        Decodifica um JPEG já reduzido por `reduce` (1, 2, 4 ou 8) com `draft`;
+        outros formatos são decodificados por inteiro. Quando há redução, o digest
+        deriva do original e da escala, para que caches (ex.: de máscaras) não
+        misturem resoluções.
+        """
+        image = Image.open(io.BytesIO(data))
+        full_size = image.size
+        if reduce > 1 and image.format == "JPEG":
+            image.draft("RGB", (-(-image.width // reduce), -(-image.height // reduce)))
+        reduced = image.size != full_size
+        image = ImageOps.exif_transpose(image)
+        image.load()
+        frame = cls(image, source=None if reduced else data, digest=None if reduced else digest)
+        if reduced:
+            base = digest or hashlib.sha256(data).hexdigest()
+            frame._digest = hashlib.sha256(f"{base}:reduce={reduce}".encode()).hexdigest()
+        return frame
+
+    @classmethod
+    def from_image(cls, image: Image.Image) -> "ImageFrame":
+        return cls(image)
+
+    def __getstate__(self):
+        # Visões derivadas são recriadas sob demanda no processo de destino
+        return {"_image": self._image, "source": self.source, "_digest": self._digest}
+
+    def __setstate__(self, state):
+        self.__init__(state["_image"], source=state["source"], digest=state["_digest"])
+
+    @property
+    def digest(self) -> Optional[str]:
+        """SHA-256 dos bytes de origem, ou None para frames criados em memória."""
+        if self._digest is None and self.source is not None:
+            self._digest = hashlib.sha256(self.source).hexdigest()
+        return self._digest
+
+    @property
+    def image(self) -> Image.Image:
+        """A imagem decodificada, no modo original."""
+        return self._image
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self._image.size
+
+    @property
+    def width(self) -> int:
+        return self._image.width
+
+    @property
+    def height(self) -> int:
+        return self._image.height
+
+    @property
+    def rgb_image(self) -> Image.Image:
+        if self._rgb_image is None:
+            self._rgb_image = self._image if self._image.mode == "RGB" else self._image.convert("RGB")
+        return self._rgb_image
+
+    @property
+    def rgba_image(self) -> Image.Image:
+        if self._rgba_image is None:
+            self._rgba_image = self._image if self._image.mode == "RGBA" else self._image.convert("RGBA")
+        return self._rgba_image
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """Array HxWx3 uint8 em RGB (somente leitura)."""
+        if self._rgb is None:
+            self._rgb = np.asarray(self.rgb_image)
+        return self._rgb
+
+    @property
+    def bgr(self) -> np.ndarray:
+        """Array HxWx3 uint8 em BGR, contíguo, para uso com OpenCV."""
+        if self._bgr is None:
+            self._bgr = np.ascontiguousarray(self.rgb[:, :, ::-1])
+        return self._bgr
+
+    def proxy(self, max_side: int) -> "ImageFrame":
+        """
+        Versão reduzida (maior lado <= `max_side`) para etapas que não precisam
+        da resolução completa, como a detecção de face. Reaproveitada entre chamadas.
+        """
+        if max_side <= 0 or max(self.size) <= max_side:
+            return self
+        proxy = self._proxies.get(max_side)
+        if proxy is None:
+            image = self.rgb_image.copy()
+            # reducing_gap reduz primeiro por fator inteiro (barato) e só então reamostra
+            image.thumbnail((max_side, max_side), Image.Resampling.BILINEAR, reducing_gap=2.0)
+            proxy = ImageFrame(image)
+            self._proxies[max_side] = proxy
+        return proxy
+
+    def crop(self, box: Tuple[int, int, int, int]) -> "ImageFrame":
+        """
+        Retorna um novo frame com a região (left, upper, right, lower).
+        O digest do recorte deriva do original e da caixa, para que caches
+        (ex.: de máscaras) continuem funcionando sobre regiões.
+        """
+        digest = hashlib.sha256(f"{self.digest}:{tuple(box)}".encode()).hexdigest() if self.digest else None
+        return ImageFrame(self._image.crop(box), digest=digest)
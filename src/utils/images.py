@@ -1,7 +1,120 @@
-from PIL import Image, ImageDraw
+from PIL import Image, ImageChops, ImageDraw
+from functools import lru_cache
 from typing import Tuple
 import numpy as np
 
+def center_face_coords(image_size: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """
+    Coordenadas de uma face fictícia centrada na imagem, usadas como fallback
+    quando nenhuma face é detectada (lado = 1/3 da menor dimensão).
+    """
+    w, h = image_size
+    face_size = min(w, h) // 3
+    face_x = (w - face_size) // 2
+    face_y = (h - face_size) // 2
+    return (face_x, face_y, face_size, face_size)
+
+def square_crop_box(face_coords: Tuple[int, int, int, int], vertical_bias: float = 0.35, radius_scale: float = 1.5) -> Tuple[int, int, int, int]:
+    """Caixa (left, upper, right, lower) recortada por `crop_to_square_centered_on_face`; pode exceder a imagem."""
+    x, y, w, h = face_coords
+
+    # Centro da face com viés vertical para melhor enquadramento
+    face_center_x = x + w // 2
+    face_center_y = y + int(h * vertical_bias)
+
+    # "Raio" do quadrado de recorte (metade do lado)
+    crop_radius = int(max(w, h) * radius_scale * 0.5)
+
+    return (face_center_x - crop_radius, face_center_y - crop_radius, face_center_x + crop_radius, face_center_y + crop_radius)
+
+def portrait_crop_box(face_coords: Tuple[int, int, int, int], image_size: Tuple[int, int], radius_scale: float = 1.8, vertical_bias: float = 0.25, extra_margin_ratio: float = 0.30) -> Tuple[int, int, int, int]:
+    """Caixa recortada por `crop_round_portrait_composed`, limitada à imagem."""
+    x, y, w, h = face_coords
+    cx, cy = x + w // 2, y + int(h * vertical_bias)
+    radius = int(max(w, h) * radius_scale)
+    margin = int(radius * extra_margin_ratio)
+    return (
+        max(cx - radius - margin, 0),
+        max(cy - radius - margin, 0),
+        min(cx + radius + margin, image_size[0]),
+        min(cy + radius + margin, image_size[1]),
+    )
+
+def expand_box(box: Tuple[int, int, int, int], image_size: Tuple[int, int], margin_ratio: float) -> Tuple[int, int, int, int]:
+    """Aumenta a caixa em `margin_ratio` do seu maior lado em cada direção, limitando-a à imagem."""
+    left, upper, right, lower = box
+    margin = int(max(right - left, lower - upper) * margin_ratio)
+    return (
+        max(left - margin, 0),
+        max(upper - margin, 0),
+        min(right + margin, image_size[0]),
+        min(lower + margin, image_size[1]),
+    )
+
+def offset_face_coords(face_coords: Tuple[int, int, int, int], box: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+    """Converte coordenadas da face para o sistema de coordenadas de uma região recortada."""
+    x, y, w, h = face_coords
+    return (x - box[0], y - box[1], w, h)
+
+@lru_cache(maxsize=32)
+def circle_mask(size: Tuple[int, int]) -> Image.Image:
+    """
+    Máscara "L" de uma elipse inscrita em `size`, com borda anti-serrilhada
+    (transição de ~1 px). Cacheada por tamanho: não modifique a imagem retornada.
+    """
+    w, h = size
+    rx, ry = w / 2, h / 2
+    x = (np.arange(w, dtype=np.float32) + 0.5 - rx) / rx
+    y = (np.arange(h, dtype=np.float32) + 0.5 - ry) / ry
+    # Distância normalizada ao centro (1 = borda), convertida em pixels até a borda
+    dist = np.sqrt(x[np.newaxis, :] ** 2 + y[:, np.newaxis] ** 2)
+    coverage = np.clip((1.0 - dist) * min(rx, ry) + 0.5, 0.0, 1.0)
+    return Image.fromarray(np.rint(coverage * 255).astype(np.uint8), "L")
+
+def paste_on_color(image: Image.Image, color: Tuple[int, int, int], mask: Image.Image = None) -> Image.Image:
+    """
+    Compõe `image` sobre um fundo de cor sólida em uma única colagem. Sem `mask`,
+    usa o alfa da própria imagem RGBA (sem `split()` nem conversões intermediárias).
+    """
+    canvas = Image.new("RGB", image.size, color)
+    canvas.paste(image, (0, 0), mask if mask is not None else image)
+    return canvas
+
+def paste_on_white(image: Image.Image, mask: Image.Image = None) -> Image.Image:
+    return paste_on_color(image, (255, 255, 255), mask)
+
+# Reduções maiores que este fator começam por uma redução inteira (média de blocos,
+# bem mais barata) e só o restante passa pelo LANCZOS
+RESIZE_REDUCING_GAP = 2.0
+
+def has_alpha(pil_image: Image.Image) -> bool:
+    return pil_image.mode in ("RGBA", "LA", "PA") or "transparency" in pil_image.info
+
+def crop_region(pil_image: Image.Image, box: Tuple[int, int, int, int]) -> Image.Image:
+    """
+    Recorta `box` de uma imagem em qualquer modo, convertendo para RGB/RGBA apenas
+    a região recortada. Áreas da caixa fora da imagem ficam transparentes, como
+    no recorte de uma imagem RGBA.
+    """
+    left, upper, right, lower = box
+    width, height = pil_image.size
+    if left >= 0 and upper >= 0 and right <= width and lower <= height:
+        cropped = pil_image.crop(box)
+        if cropped.mode not in ("RGB", "RGBA"):
+            cropped = cropped.convert("RGBA" if has_alpha(cropped) else "RGB")
+        return cropped
+    canvas = Image.new("RGBA", (right - left, lower - upper), (0, 0, 0, 0))
+    inside = (max(left, 0), max(upper, 0), min(right, width), min(lower, height))
+    if inside[0] < inside[2] and inside[1] < inside[3]:
+        canvas.paste(pil_image.crop(inside).convert("RGBA"), (inside[0] - left, inside[1] - upper))
+    return canvas
+
+def _crop_resized(pil_image: Image.Image, box: Tuple[int, int, int, int], output_size: Tuple[int, int]) -> Image.Image:
+    cropped = crop_region(pil_image, box)
+    if cropped.size != output_size:
+        cropped = cropped.resize(output_size, Image.Resampling.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+    return cropped
+
 def crop_to_round_centered_on_face(pil_image: Image.Image, face_coords: Tuple[int, int, int, int], radius_scale: float = 1.5, vertical_bias: float = 0.35, output_size: Tuple[int, int] = (512, 512)) -> Image.Image:
     """
     Recorta uma área quadrada ao redor da face, redimensiona para o tamanho de saída,
@@ -17,37 +130,28 @@ def crop_to_round_centered_on_face(pil_image: Image.Image, face_coords: Tuple[in
     Returns:
         Image.Image: Imagem quadrada com recorte circular e fundo branco.
     """
-    # 1. Recorta um quadrado centrado na face
-    cropped_square = crop_to_square_centered_on_face(
-        pil_image, face_coords, vertical_bias=vertical_bias, radius_scale=radius_scale, output_size=output_size
-    )
+    # 1. Recorta um quadrado centrado na face, já no tamanho de saída
+    box = square_crop_box(face_coords, vertical_bias=vertical_bias, radius_scale=radius_scale)
+    cropped = _crop_resized(pil_image, box, output_size)
 
-    # 2. Criar máscara circular para a imagem já redimensionada
-    mask = Image.new("L", output_size, 0)
-    draw = ImageDraw.Draw(mask)
-    draw.ellipse((0, 0, output_size[0], output_size[1]), fill=255)
+    # 2. Máscara circular (cacheada por tamanho), combinada com a transparência do recorte
+    mask = circle_mask(output_size)
+    if cropped.mode == "RGBA":
+        mask = ImageChops.multiply(cropped.getchannel("A"), mask)
+    elif cropped.mode != "RGB":
+        cropped = cropped.convert("RGB")
 
-    # 3. Criar fundo branco e colar a imagem recortada usando a máscara
-    final_image = Image.new("RGB", output_size, (255, 255, 255))
-    final_image.paste(cropped_square, (0, 0), mask)
-
-    return final_image
+    # 3. Compõe sobre fundo branco em uma colagem
+    return paste_on_white(cropped, mask)
 
 def crop_round_portrait_composed(pil_image: Image.Image, face_coords: Tuple[int, int, int, int], radius_scale: float = 1.8, vertical_bias: float = 0.25, extra_margin_ratio: float = 0.30) -> Image.Image:
-    x, y, w, h = face_coords
-    cx, cy = x + w // 2, y + int(h * vertical_bias)
-    radius = int(max(w, h) * radius_scale)
-    margin = int(radius * extra_margin_ratio)
-    left = max(cx - radius - margin, 0)
-    upper = max(cy - radius - margin, 0)
-    right = min(cx + radius + margin, pil_image.width)
-    lower = min(cy + radius + margin, pil_image.height)
-    cropped = pil_image.crop((left, upper, right, lower))
-    mask = Image.new("L", cropped.size, 0)
-    draw = ImageDraw.Draw(mask)
-    draw.ellipse((0, 0, cropped.size[0], cropped.size[1]), fill=255)
-    result = cropped.copy()
-    result.putalpha(mask)
+    box = portrait_crop_box(face_coords, pil_image.size, radius_scale, vertical_bias, extra_margin_ratio)
+    # crop() já devolve uma imagem nova: o alfa é substituído nela, sem cópia extra;
+    # só a região recortada é convertida para RGBA
+    result = pil_image.crop(box)
+    if result.mode != "RGBA":
+        result = result.convert("RGBA")
+    result.putalpha(circle_mask(result.size))
     return result
 
 def draw_face_on_image(pil_image: Image.Image, face_coords: Tuple[int, int, int, int]) -> Image.Image:
@@ -81,36 +185,17 @@ def crop_to_square_centered_on_face(pil_image: Image.Image, face_coords: Tuple[i
     Returns:
         Image.Image: Imagem quadrada com a face centralizada.
     """
-    x, y, w, h = face_coords
-
-    # 1. Calcular o centro da face com viés vertical para melhor enquadramento
-    face_center_x = x + w // 2
-    face_center_y = y + int(h * vertical_bias)
-
-    # 2. Calcular o "raio" do quadrado de recorte (metade do lado)
-    face_size = max(w, h)
-    crop_radius = int(face_size * radius_scale * 0.5)
-
-    # 3. Definir os limites do quadrado de recorte
-    left = face_center_x - crop_radius
-    upper = face_center_y - crop_radius
-    right = face_center_x + crop_radius
-    lower = face_center_y + crop_radius
-
-    # 4. Recortar a imagem original
-    cropped_image = pil_image.crop((left, upper, right, lower))
+    # 1-3. Quadrado centrado na face (com viés vertical)
+    left, upper, right, lower = square_crop_box(face_coords, vertical_bias=vertical_bias, radius_scale=radius_scale)
 
-    # 5. Redimensionar o quadrado recortado para o tamanho de saída final
-    if cropped_image.size != output_size:
-        cropped_image = cropped_image.resize(output_size, Image.Resampling.LANCZOS)
+    # 4-5. Recortar a imagem original e redimensionar para o tamanho de saída final
+    cropped_image = _crop_resized(pil_image, (left, upper, right, lower), output_size)
 
     # 6. Garantir que a imagem esteja em RGB (para consistência)
+    if cropped_image.mode == "RGBA":
+        # Compor sobre fundo branco para remover a transparência
+        return paste_on_white(cropped_image)
     if cropped_image.mode != "RGB":
-        # Se for RGBA, colar em um fundo branco para remover a transparência
-        if cropped_image.mode == "RGBA":
-            rgb_image = Image.new("RGB", cropped_image.size, (255, 255, 255))
-            rgb_image.paste(cropped_image, mask=cropped_image.split()[3]) # 3 é o canal alfa
-            return rgb_image
         return cropped_image.convert("RGB")
 
     return cropped_image
@@ -1,8 +1,123 @@
-from PIL import Image
+from PIL import Image, features
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 import io
+import json
+import zipfile
 
-def bytes_to_png_rgba(pil_image: Image.Image) -> bytes:
+# Assinaturas (magic bytes) dos formatos de imagem aceitos
+_MAGIC_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+]
+
+# Quantos bytes iniciais são necessários para identificar o formato
+MAGIC_BYTES_NEEDED = 16
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    Identifica o tipo de imagem pelos primeiros bytes do conteúdo.
+
+    Returns:
+        O MIME type detectado ou None se o conteúdo não parecer uma imagem suportada.
+    """
+    for signature, mime in _MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "image/avif"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    return None
+
+def bytes_to_png_rgba(pil_image: Image.Image, compress_level: int = 6) -> bytes:
     """Convert PIL Image to PNG bytes"""
     output = io.BytesIO()
-    pil_image.save(output, format="PNG")
+    pil_image.save(output, format="PNG", compress_level=compress_level)
+    return output.getvalue()
+
+# Formatos de saída suportados e seus MIME types
+OUTPUT_FORMATS = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "avif": "image/avif",
+    "jpeg": "image/jpeg",
+}
+
+# Formatos que preservam o canal alfa
+ALPHA_FORMATS = ("png", "webp", "avif")
+
+FILE_EXTENSIONS = {"png": "png", "webp": "webp", "avif": "avif", "jpeg": "jpg"}
+
+@lru_cache(maxsize=1)
+def available_output_formats() -> Tuple[str, ...]:
+    """Formatos que o Pillow instalado consegue codificar (AVIF depende do build ou do plugin)."""
+    available = ["png", "jpeg"]
+    if features.check("webp"):
+        available.append("webp")
+    if not features.check("avif"):
+        try:
+            import pillow_avif  # noqa: F401  (registra o encoder AVIF em Pillow < 11.3)
+        except ImportError:
+            pass
+    Image.init()
+    if "AVIF" in Image.SAVE:
+        available.append("avif")
+    return tuple(fmt for fmt in OUTPUT_FORMATS if fmt in available)
+
+def has_transparency(pil_image: Image.Image) -> bool:
+    """True quando a imagem tem algum pixel não totalmente opaco."""
+    if pil_image.mode in ("RGBA", "LA", "PA"):
+        return pil_image.getchannel("A").getextrema()[0] < 255
+    return pil_image.mode == "P" and "transparency" in pil_image.info
+
+def flatten(pil_image: Image.Image, background: Tuple[int, int, int] = (255, 255, 255)) -> Image.Image:
+    """Compõe a imagem sobre um fundo sólido, removendo a transparência."""
+    if not has_transparency(pil_image):
+        return pil_image if pil_image.mode in ("RGB", "L") else pil_image.convert("RGB")
+    rgba = pil_image.convert("RGBA")
+    flat = Image.new("RGB", rgba.size, background)
+    flat.paste(rgba, mask=rgba.getchannel("A"))
+    return flat
+
+def encode_image(pil_image: Image.Image, fmt: str = "png", options: Optional[Dict[str, Any]] = None) -> bytes:
+    """
+    Codifica a imagem no formato pedido.
+
+    `options` são repassadas ao `Image.save` (ex.: compress_level, quality,
+    lossless, method, speed). JPEG não tem alfa: a imagem é composta sobre branco.
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Formato de saída desconhecido: '{fmt}'")
+    options = dict(options or {})
+    if fmt == "png":
+        return bytes_to_png_rgba(pil_image, **options)
+    if fmt == "jpeg":
+        pil_image = flatten(pil_image)
+    elif pil_image.mode not in ("RGB", "RGBA"):
+        pil_image = pil_image.convert("RGBA" if has_transparency(pil_image) else "RGB")
+    output = io.BytesIO()
+    pil_image.save(output, format=fmt.upper(), **options)
+    return output.getvalue()
+
+def build_zip(results: List[Dict[str, Any]]) -> bytes:
+    """
+    ZIP sem compressão (as imagens já são comprimidas) com o `content` de cada
+    item gravado em `item["output"]` e um `manifest.json` com os demais campos.
+    """
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as archive:
+        for item in results:
+            if item.get("content") is not None:
+                archive.writestr(item["output"], item.pop("content"))
+            else:
+                item.pop("content", None)
+        archive.writestr("manifest.json", json.dumps(results, ensure_ascii=False, indent=2))
     return output.getvalue()
@@ -0,0 +1,54 @@
+"""
+Worker da fila de jobs em um processo separado da API:
+
+    python -m src.worker --concurrency 2
+
+Usa o mesmo `JOBS_DB_PATH` e o mesmo diretório `temp_images` da API; rode a
+API com `JOB_WORKER_MODE=external` para que apenas estes processos consumam a
+fila. Vários workers podem rodar ao mesmo tempo.
+"""
+from src.core.config import settings
+from src.core.logging import setup_logging
+from src.services.background import session_manager
+from src.services.download import downloader
+from src.services.executor import inference_executor
+from src.services.jobs import job_worker
+from src.services.storage import storage_sweeper
+import argparse
+import asyncio
+import logging
+import signal
+
+logger = logging.getLogger(__name__)
+
+
+async def run(concurrency: int) -> None:
+    job_worker.concurrency = max(1, concurrency)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    job_worker.start()
+    storage_sweeper.start()
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Encerrando worker de jobs...")
+        await job_worker.stop()
+        storage_sweeper.stop()
+        await downloader.aclose()
+        inference_executor.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Worker da fila de jobs de processamento de imagens")
+    parser.add_argument("--concurrency", type=int, default=settings.JOB_WORKERS, help="jobs processados em paralelo")
+    args = parser.parse_args()
+    setup_logging()
+    # Carrega e aquece os modelos de PRELOAD_MODELS antes de reservar o primeiro job
+    session_manager.preload(warmup=settings.MODEL_WARMUP)
+    asyncio.run(run(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
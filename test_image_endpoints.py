@@ -1,6 +1,23 @@
 import pytest
 from fastapi.testclient import TestClient
 from src.main import app
+from src.services.executor import inference_executor
+from src.services.download import downloader
+from src.services.sessions import SessionManager
+from src.services.jobs import job_worker
+from src.services.pipeline import crop_reduce_factor, decode_for_crop, face_crops_output
+from src.utils.io import build_zip
+from src.bulk import iter_items, load_checkpoint
+from src.services.storage import ManagedDirectory, LocalResultStorage, S3ResultStorage
+from src.services.onnx_options import build_session_options, model_options, split_variant
+from src.core.config import settings
+from src.utils.frame import ImageFrame
+from src.utils.images import circle_mask, crop_region, crop_to_round_centered_on_face, expand_box, offset_face_coords, square_crop_box
+import onnxruntime as ort
+import httpx
+import asyncio
+import os
+import time
 from PIL import Image
 import io
 
@@ -19,4 +36,492 @@ def test_crop_round():
     img.save(buf, format="PNG")
     buf.seek(0)
     response = client.post("/api/v1/crop-round/", files={"file": ("test.png", buf, "image/png")})
-    assert response.status_code in [200, 404, 400]  # Aceita face não encontrada
\ No newline at end of file
+    assert response.status_code in [200, 404, 400]  # Aceita face não encontrada
+
+def test_crop_round_queue_full_returns_503(monkeypatch):
+    monkeypatch.setattr(inference_executor, "_pending", inference_executor.queue_size)
+    img = Image.new("RGB", (64, 64), color="white")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    buf.seek(0)
+    response = client.post("/api/v1/crop-round/", files={"file": ("test.png", buf, "image/png")})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(inference_executor.retry_after)
+    # Endpoints baratos continuam respondendo
+    assert client.get("/health").status_code == 200
+
+def test_crop_round_result_cache_hit():
+    img = Image.new("RGB", (96, 96), color="blue")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    payload = buf.getvalue()
+    first = client.post("/api/v1/crop-round/", files={"file": ("a.png", payload, "image/png")})
+    second = client.post("/api/v1/crop-round/", files={"file": ("b.png", payload, "image/png")})
+    assert first.status_code == second.status_code == 200
+    assert second.headers["x-cache"] == "HIT"
+    assert second.content == first.content
+    stats = client.get("/api/v1/cache/stats").json()
+    assert stats["results"]["hits"] >= 1
+
+def test_batch_remove_bg_validation():
+    response = client.post("/api/v1/batch/remove-bg/modelo-inexistente", data={"urls": ["http://example.com/a.png"]})
+    assert response.status_code == 400
+    response = client.post("/api/v1/batch/remove-bg/u2netp")
+    assert response.status_code == 400
+
+def test_process_url_downloads_with_etag_revalidation(monkeypatch):
+    img = Image.new("RGB", (80, 80), color="green")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    png = buf.getvalue()
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers.get("if-none-match"))
+        if request.url.path == "/page.html":
+            return httpx.Response(200, content=b"<html></html>", headers={"content-type": "text/html"})
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=png, headers={"content-type": "image/png", "etag": '"v1"'})
+
+    monkeypatch.setattr(downloader, "transport", httpx.MockTransport(handler))
+    body = {"image_url": "http://images.test/photo.png", "processing_type": "crop"}
+    first = client.post("/api/v1/process-url/", json=body)
+    second = client.post("/api/v1/process-url/", json=body)
+    assert first.status_code == second.status_code == 200
+    assert seen == [None, '"v1"']
+
+    body["image_url"] = "http://images.test/page.html"
+    assert client.post("/api/v1/process-url/", json=body).status_code == 400
+
+def test_session_manager_evicts_and_health_waits_for_warmup(monkeypatch):
+    class FakeSession:
+        def __init__(self):
+            self.weights = bytearray(8 * 1024 * 1024)  # conta no RSS medido durante o carregamento
+
+        def predict(self, img):
+            return [Image.new("L", img.size)]
+
+    manager = SessionManager(lambda name: FakeSession(), memory_budget_bytes=0, preload_models=["u2netp"])
+    monkeypatch.setattr("src.main.session_manager", manager)
+    assert client.get("/health").status_code == 503
+    manager.preload()
+    assert client.get("/health").json() == {"status": "ok"}
+    manager.get("u2net")
+    manager.get("silueta")
+    loaded = {item["name"]: item for item in manager.loaded()}
+    # Acima do orçamento: o pré-carregado fica fixado e só o mais recente sobrevive
+    assert set(loaded) == {"u2netp", "silueta"}
+    assert loaded["u2netp"]["pinned"] and loaded["u2netp"]["warmed"]
+
+def test_onnx_options_per_model_and_variants(monkeypatch):
+    monkeypatch.setattr(settings, "ONNX_MODEL_OPTIONS", {"u2net": {"intra_op_threads": 2, "graph_optimization": "basic"}})
+    assert split_variant("isnet-general-use-int8") == ("isnet-general-use", "int8")
+    assert split_variant("birefnet-general-lite") == ("birefnet-general-lite", None)
+    # A variante herda as opções do modelo base
+    sess_opts = build_session_options(model_options("u2net-int8"))
+    assert sess_opts.intra_op_num_threads == 2
+    assert sess_opts.graph_optimization_level == ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+
+def test_roi_region_contains_crop_and_keys_masks_by_region():
+    buf = io.BytesIO()
+    Image.new("RGB", (1000, 800), color="gray").save(buf, format="PNG")
+    frame = ImageFrame.from_bytes(buf.getvalue())
+    face = (400, 300, 100, 120)
+    crop_box = square_crop_box(face)
+    region = expand_box(crop_box, frame.size, 0.15)
+    assert region[0] <= crop_box[0] and region[1] <= crop_box[1] and region[2] >= crop_box[2] and region[3] >= crop_box[3]
+    assert offset_face_coords(face, region)[:2] == (face[0] - region[0], face[1] - region[1])
+    roi = frame.crop(region)
+    assert roi.size == (region[2] - region[0], region[3] - region[1])
+    assert roi.digest and roi.digest != frame.digest and roi.digest == frame.crop(region).digest
+
+def test_detection_proxy_and_reduced_jpeg_decode():
+    buf = io.BytesIO()
+    Image.new("RGB", (3000, 2000), color="white").save(buf, format="JPEG")
+    frame = ImageFrame.from_bytes(buf.getvalue())
+    proxy = frame.proxy(640)
+    assert proxy.size == (640, 427) and frame.proxy(640) is proxy
+    assert frame.proxy(0) is frame
+    reduced = ImageFrame.reduced_from_bytes(buf.getvalue(), 640)
+    assert max(reduced.size) == 640
+
+def test_metrics_and_server_timing():
+    img = Image.new("RGB", (64, 64), color="white")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    response = client.post("/api/v1/crop-round/", files={"file": ("m.png", buf.getvalue(), "image/png")})
+    assert "decode;dur=" in response.headers["server-timing"]
+    assert float(response.headers["x-processing-time"]) >= 0
+    body = client.get("/metrics").text
+    assert 'http_requests_total{method="POST",endpoint="/api/v1/crop-round/",status="200"}' in body
+    assert "image_stage_duration_seconds_bucket" in body and "executor_pending_tasks" in body
+
+@pytest.mark.parametrize("cpu_executor", ["thread", "process"])
+def test_cpu_pool_stages_reach_server_timing(cpu_executor):
+    from src.core import metrics
+    from src.services.executor import InferenceExecutor
+    from src.services.pipeline import decode_frame
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64), color="white").save(buf, format="PNG")
+    executor = InferenceExecutor(cpu_workers=1, cpu_executor=cpu_executor)
+
+    async def scenario():
+        stages = metrics.start_request()
+        frame = await executor.run_cpu(decode_frame, buf.getvalue())
+        return stages, frame
+
+    try:
+        stages, frame = asyncio.run(scenario())
+    finally:
+        executor.shutdown(wait=True)
+    # Etapas medidas no worker (thread ou processo) entram no Server-Timing da requisição
+    assert frame.size == (64, 64)
+    assert {"queue_wait", "decode"} <= {name for name, _ in stages}
+    assert "decode;dur=" in metrics.server_timing(stages, 0.1)
+
+def test_output_format_negotiation():
+    img = Image.new("RGB", (64, 64), color="white")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    files = {"file": ("f.png", buf.getvalue(), "image/png")}
+    response = client.post("/api/v1/crop-round/?format=webp", files=files)
+    assert response.status_code == 200 and response.headers["content-type"] == "image/webp"
+    assert Image.open(io.BytesIO(response.content)).format == "WEBP"
+    response = client.post("/api/v1/crop-round/", files=files, headers={"Accept": "image/webp;q=0.8, image/jpeg"})
+    assert response.headers["content-type"] == "image/jpeg" and response.headers["vary"] == "Accept"
+    response = client.post("/api/v1/crop-round/?format=bmp", files=files)
+    assert response.status_code == 400
+
+def test_unavailable_default_format_falls_back_to_png(monkeypatch):
+    from src.services.output import negotiate_format
+    monkeypatch.setattr("src.services.output.available_output_formats", lambda: ("png", "jpeg"))
+    monkeypatch.setattr(settings, "OUTPUT_DEFAULT_FORMAT", "avif")
+    assert negotiate_format(None, None, has_alpha=True) == "png"
+    assert negotiate_format(None, "image/*", has_alpha=False) == "png"
+    monkeypatch.setattr(settings, "OUTPUT_DEFAULT_FORMAT", "JPG")
+    assert negotiate_format(None, None, has_alpha=False) == "jpeg"
+
+def test_jobs_queue_processes_url_and_rejects_remote_webhook(monkeypatch):
+    buf = io.BytesIO()
+    Image.new("RGB", (80, 80), color="blue").save(buf, format="PNG")
+    png = buf.getvalue()
+    monkeypatch.setattr(downloader, "transport", httpx.MockTransport(
+        lambda request: httpx.Response(200, content=png, headers={"content-type": "image/png"})
+    ))
+    body = {"image_url": "http://images.test/job.png", "processing_type": "crop", "format": "webp"}
+    assert client.post("/api/v1/jobs", json={**body, "webhook_url": "http://example.com/hook"}).status_code == 400
+    created = client.post("/api/v1/jobs", json=body)
+    assert created.status_code == 202 and created.json()["status"] == "queued"
+
+    async def drain():
+        while await job_worker.run_once():
+            pass
+
+    asyncio.run(drain())
+    job = client.get(created.headers["location"]).json()
+    assert job["status"] == "succeeded" and job["result_url"].endswith(".webp")
+    assert client.get("/api/v1/jobs/unknown").status_code == 404
+
+def test_managed_directory_ttl_and_quota(tmp_path):
+    storage = ManagedDirectory("test", str(tmp_path), ttl_seconds=60, max_bytes=250)
+    old = storage.write("old.png", b"x" * 100)
+    os.utime(old, (time.time() - 120, time.time() - 120))
+    for name in ("a.png", "b.png", "c.png"):
+        storage.write(name, b"x" * 100)
+    # c.png passou da cota: old.png sai pelo TTL e a.png (o mais antigo restante) pela cota
+    assert sorted(os.listdir(tmp_path)) == ["b.png", "c.png"]
+    assert storage.usage() == {"files": 2, "bytes": 200}
+
+def test_result_storage_dedupes_local_and_s3(tmp_path):
+    local = LocalResultStorage(ManagedDirectory("results", str(tmp_path)), base_url="https://cdn.test/results")
+    key = asyncio.run(local.save(b"png-bytes", "png"))
+    assert asyncio.run(local.save(b"png-bytes", "png")) == key and os.listdir(tmp_path) == [key]
+    assert local.url(key) == f"https://cdn.test/results/{key}"
+
+    moto = pytest.importorskip("moto")
+    with moto.mock_aws():
+        s3 = S3ResultStorage("results-bucket", prefix="out/", region="us-east-1", multipart_threshold=5 * 1024 * 1024)
+        s3.client.create_bucket(Bucket="results-bucket")
+        data = os.urandom(6 * 1024 * 1024)  # acima do limite: upload em partes
+        key = asyncio.run(s3.save(data, "webp"))
+        assert s3.exists(key) and asyncio.run(s3.save(data, "webp")) == key
+        obj = s3.client.get_object(Bucket="results-bucket", Key=f"out/{key}")
+        assert obj["ContentType"] == "image/webp" and obj["Body"].read() == data
+        assert "X-Amz-Signature" in s3.url(key)
+
+def test_circle_mask_cached_and_round_crop_transparency():
+    mask = circle_mask((64, 64))
+    assert circle_mask((64, 64)) is mask
+    assert mask.getpixel((32, 32)) == 255 and mask.getpixel((0, 0)) == 0 and 0 < mask.getpixel((0, 32)) < 255
+    # Pixels transparentes do recorte continuam brancos dentro do círculo
+    rgba = Image.new("RGBA", (200, 200), (255, 0, 0, 255))
+    rgba.paste((255, 0, 0, 0), (0, 0, 200, 100))
+    out = crop_to_round_centered_on_face(rgba, (50, 50, 100, 100), output_size=(64, 64))
+    assert out.mode == "RGB" and out.getpixel((0, 0)) == (255, 255, 255)
+    assert out.getpixel((32, 10)) == (255, 255, 255) and out.getpixel((32, 60)) == (255, 0, 0)
+
+def test_reduced_decode_for_crop_and_region_conversion():
+    buffer = io.BytesIO()
+    Image.new("RGB", (4000, 3000), (0, 128, 0)).save(buffer, "JPEG")
+    data = buffer.getvalue()
+    assert crop_reduce_factor((0, 0, 600, 600)) == 1 and crop_reduce_factor((0, 0, 2100, 2100)) == 4
+    # Face de 1600 px: caixa de 2400 px cobre 512 px decodificando a 1/4
+    frame, coords = decode_for_crop(data, "abc", (1200, 800, 1600, 1600))
+    assert frame.size == (1000, 750) and coords == (300, 200, 400, 400)
+    assert frame.digest not in (None, "abc")
+    # Só a região é convertida; o que fica fora da imagem vira transparente
+    region = crop_region(Image.new("L", (100, 100), 200), (-50, 0, 50, 100))
+    assert region.mode == "RGBA" and region.getpixel((0, 0))[3] == 0 and region.getpixel((99, 0)) == (200, 200, 200, 255)
+
+def test_face_crops_from_single_frame_zipped_with_manifest():
+    import json, zipfile
+    frame = ImageFrame.from_image(Image.new("RGB", (1200, 600), (10, 20, 30)))
+    outputs = face_crops_output(frame, [(100, 100, 200, 200), (800, 150, 250, 250)], "square", "png")
+    assert [Image.open(io.BytesIO(data)).size for data in outputs] == [(512, 512), (512, 512)]
+    archive = build_zip([{"index": i, "output": f"face_{i:02d}.png", "content": data} for i, data in enumerate(outputs)])
+    with zipfile.ZipFile(io.BytesIO(archive)) as z:
+        assert z.namelist() == ["face_00.png", "face_01.png", "manifest.json"]
+        assert json.loads(z.read("manifest.json"))[1] == {"index": 1, "output": "face_01.png"}
+
+def test_bulk_inputs_and_checkpoint_resume(tmp_path):
+    import json
+    (tmp_path / "in" / "sub").mkdir(parents=True)
+    for name in ("in/a.jpg", "in/sub/b.png", "in/notes.txt"):
+        (tmp_path / name).write_bytes(b"x")
+    defaults = {"processing_type": "crop", "model": "u2net", "format": None, "roi": None}
+    items = list(iter_items(str(tmp_path / "in"), defaults))
+    assert [os.path.relpath(item["source"], tmp_path) for item in items] == ["in/a.jpg", os.path.join("in", "sub", "b.png")]
+    assert [item["source"] for item in iter_items(str(tmp_path / "in" / "**" / "*.png"), defaults)] == [str(tmp_path / "in" / "sub" / "b.png")]
+    manifest = tmp_path / "m.jsonl"
+    manifest.write_text(json.dumps({"image_url": "https://x.test/a.jpg", "model": "isnet-general-use"}) + "\n")
+    assert next(iter_items(str(manifest), defaults))["model"] == "isnet-general-use"
+
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    checkpoint.write_text(
+        json.dumps({"source": "a", "status": "ok", "key": "k1"}) + "\n"
+        + json.dumps({"source": "b", "status": "ok", "key": "k2"}) + "\n"
+        + json.dumps({"source": "b", "status": "error"}) + "\n"
+        + '{"source": "c", "sta'  # linha truncada por uma interrupção
+    )
+    assert load_checkpoint(str(checkpoint)) == {"a": "k1"}
+
+def test_stand_in_model_and_benchmark_comparison(monkeypatch):
+    from benchmarks.results import compare_results, percentile
+    from benchmarks.stand_in import use_stand_in_model
+    from src.services.background import remove_bg, session_manager
+
+    monkeypatch.setattr(session_manager, "factory", session_manager.factory)
+    model_key = use_stand_in_model()
+    try:
+        cutout = remove_bg(ImageFrame.from_image(Image.new("RGB", (200, 150), (90, 120, 200))), model_key)
+        assert cutout.mode == "RGBA" and cutout.size == (200, 150)
+    finally:
+        session_manager.evict(model_key)
+
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    before = {"results": {"640x480": {"decode": {"p50_ms": 10.0}, "crop": {"p50_ms": 4.0}}}}
+    after = {"results": {"640x480": {"decode": {"p50_ms": 12.0}, "crop": {"p50_ms": 4.1}, "new": {"p50_ms": 1.0}}}}
+    rows = {row["case"]: row["regression"] for row in compare_results(before, after, threshold=0.1)}
+    assert rows == {"decode": True, "crop": False}
+
+def test_lazy_startup_and_liveness_readiness(monkeypatch):
+    import subprocess
+    import sys
+    from benchmarks.bench_import import parse_importtime
+    code = "import sys, src.main; print([m for m in ('rembg', 'mediapipe', 'onnxruntime') if m in sys.modules])"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+
+    # Sem o lifespan (TestClient fora de `with`): vivo, mas ainda não pronto
+    assert client.get("/health/live").json() == {"status": "ok"}
+    assert client.get("/health/ready").json() == {"status": "starting"}
+    monkeypatch.setattr(app.state, "started", True)
+    assert client.get("/health/ready").status_code == 200
+    monkeypatch.setattr(settings, "READINESS_REQUIRES_MODELS", True)
+    monkeypatch.setattr("src.main.session_manager", SessionManager(lambda name: None, memory_budget_bytes=0, preload_models=["u2netp"]))
+    assert client.get("/health/ready").status_code == 503
+
+    stderr = "import time: self [us] | cumulative | imported package\nimport time:       500 |        500 |   fastapi.params\nimport time:      1000 |       2500 | src.main\n"
+    assert parse_importtime(stderr, "src.main") == (2.5, {"fastapi": 0.5, "src": 1.0})
+
+def test_queue_logging_json_request_id_and_sampling(tmp_path, monkeypatch):
+    import contextvars
+    import json
+    import logging
+    from src.core.logging import bind_request, setup_logging, stop_logging
+    assert client.get("/health", headers={"X-Request-ID": "req-123"}).headers["x-request-id"] == "req-123"
+
+    monkeypatch.setattr(settings, "LOG_FORMAT", "json")
+    monkeypatch.setattr(settings, "LOG_INFO_SAMPLE_RATE", 0.0)
+    setup_logging(str(tmp_path))
+    try:
+        logger = logging.getLogger("tests.logging")
+        values = ["a.jpg"]
+
+        def request():
+            bind_request("abc")
+            logger.info("Descartado pela amostragem: %s", "x")
+            logger.warning("Arquivo %s", values)
+            values.append("mudou depois")  # a mensagem já foi interpolada ao enfileirar
+
+        contextvars.copy_context().run(request)
+        stop_logging()  # esvazia a fila antes da leitura
+        lines = [json.loads(line) for line in (tmp_path / "app.log").read_text(encoding="utf-8").splitlines()]
+        assert [line.get("request_id") for line in lines if line["logger"] == "tests.logging"] == ["abc"]
+        assert lines[-1]["message"] == "Arquivo ['a.jpg']" and lines[-1]["level"] == "WARNING"
+    finally:
+        monkeypatch.undo()
+        setup_logging()
+
+def test_upload_intake_sniffs_and_limits_before_decoding(monkeypatch):
+    from src.services.intake import inspect_bytes
+    buf = io.BytesIO()
+    Image.new("RGB", (300, 200), color="red").save(buf, format="PNG")
+    payload = buf.getvalue()
+    # Só o cabeçalho é lido: os primeiros bytes bastam para formato e dimensões
+    info = inspect_bytes(payload[:64])
+    assert (info.mime, info.width, info.height) == ("image/png", 300, 200)
+
+    # O Content-Type do cliente não importa, e sim os magic bytes
+    assert client.post("/api/v1/crop-round/", files={"file": ("a.bin", payload, "application/octet-stream")}).status_code == 200
+    assert client.post("/api/v1/crop-round/", files={"file": ("a.png", b"nao sou imagem", "image/png")}).status_code == 415
+    monkeypatch.setattr(settings, "UPLOAD_MAX_PIXELS", 100 * 100)
+    response = client.post("/api/v1/detect-faces/", files={"file": ("a.png", payload, "image/png")})
+    assert response.status_code == 413 and "300x200" in response.json()["detail"]
+    # Imagens baixadas no lote passam pela mesma checagem, reportada por item
+    import json, zipfile
+    monkeypatch.setattr(downloader, "transport", httpx.MockTransport(lambda request: httpx.Response(200, content=payload, headers={"content-type": "image/png"})))
+    monkeypatch.setattr("src.api.v1.endpoints.batch.run_inference", None)  # não deve chegar à inferência
+    response = client.post("/api/v1/batch/remove-bg/u2netp", data={"urls": ["http://images.test/bomba.png"]})
+    manifest = json.loads(zipfile.ZipFile(io.BytesIO(response.content)).read("manifest.json"))
+    assert response.status_code == 200 and manifest[0]["status"] == "error" and "300x200" in manifest[0]["error"]
+    monkeypatch.setattr(settings, "UPLOAD_MAX_BYTES", 10)
+    assert client.post("/api/v1/remove-bg/u2netp", files={"file": ("a.png", payload, "image/png")}).status_code == 413
+    # Content-Length acima do limite: recusado pelo middleware, antes do parse do multipart
+    response = client.post("/api/v1/crop-round/", content=b"x" * (2 * 1024 * 1024), headers={"Content-Type": "multipart/form-data; boundary=x"})
+    assert response.status_code == 413
+
+def test_chunked_upload_rejected_while_streaming(monkeypatch):
+    # Sem Content-Length: o corpo é contado à medida que chega e a leitura para no limite
+    monkeypatch.setattr(settings, "UPLOAD_MAX_BYTES", 100_000)
+    chunk, total_chunks = b"x" * 65536, 200
+    head = b"--x\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.png\"\r\nContent-Type: image/png\r\n\r\n"
+    chunks = iter([head] + [chunk] * total_chunks)
+    consumed, sent = [], []
+
+    async def receive():
+        body = next(chunks, None)
+        if body is None:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        consumed.append(len(body))
+        return {"type": "http.request", "body": body, "more_body": True}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": "/api/v1/crop-round/", "raw_path": b"/api/v1/crop-round/", "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"testserver"), (b"content-type", b"multipart/form-data; boundary=x"), (b"transfer-encoding", b"chunked")],
+        "client": ("testclient", 50000), "server": ("testserver", 80),
+    }
+    asyncio.run(app(scope, receive, send))
+    assert sent[0]["type"] == "http.response.start" and sent[0]["status"] == 413
+    # Menos de 2 MB lidos de um corpo de ~13 MB
+    assert sum(consumed) < settings.UPLOAD_MAX_BYTES + 1024 * 1024 + 2 * len(chunk) < total_chunks * len(chunk)
+
+def test_admission_charges_model_cost_per_client_and_global_budget(monkeypatch):
+    from src.services.admission import AdmissionController, AdmissionError, model_cost
+    assert model_cost("sam") == 20 * model_cost("u2netp") and model_cost("u2netp-int8") == model_cost("u2netp")
+    controller = AdmissionController(client_rate=0.01, client_burst=5, global_budget=4, queue_timeout=0.2)
+    monkeypatch.setattr("src.api.limits.admission_controller", controller)
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64), color="white").save(buf, format="PNG")
+    payload = buf.getvalue()
+
+    def crop(client_name):
+        return client.post("/api/v1/crop-round/", files={"file": ("a.png", payload, "image/png")}, headers={"X-Client-ID": client_name})
+
+    # Detecção de face custa 1: cinco chamadas esgotam o saldo do cliente, os demais seguem
+    assert all(crop("a").status_code == 200 for _ in range(5))
+    response = crop("a")
+    assert response.status_code == 429 and int(response.headers["retry-after"]) >= 1
+    assert crop("b").status_code == 200
+    usage = client.get("/api/v1/admission/usage", headers={"X-Client-ID": "a"}).json()
+    assert usage["in_flight"] == 0 and usage["client"]["tokens"] < 1
+    # `model` na query de /crop-round/ é ignorado pelo endpoint: cobra só a detecção de face
+    response = client.post("/api/v1/crop-round/", params={"model": "sam"}, files={"file": ("a.png", payload, "image/png")}, headers={"X-Client-ID": "e"})
+    assert response.status_code == 200
+    usage = client.get("/api/v1/admission/usage", headers={"X-Client-ID": "e"}).json()
+    assert 3.9 < usage["client"]["tokens"] < 4.1  # custo 1 (e não 20) no saldo de 5
+
+    async def scenario():
+        # Modelo pesado ocupa todo o orçamento global (e deixa o cliente em débito)
+        heavy = await controller.acquire("c", "sam")
+        assert controller.in_flight == 4 and controller.usage("c")["client"]["tokens"] < 0
+        with pytest.raises(AdmissionError) as excinfo:
+            await controller.acquire("d", "u2netp")
+        assert excinfo.value.status_code == 503
+        assert controller.usage("d")["client"]["tokens"] == 5  # recusa pelo orçamento devolve a cota
+        waiting = asyncio.ensure_future(controller.acquire("d", "u2netp"))
+        await asyncio.sleep(0.05)
+        assert controller.waiting == 1
+        controller.release(heavy)
+        light = await waiting
+        assert controller.in_flight == 1
+        controller.release(light)
+
+    asyncio.run(scenario())
+
+def test_assets_recompose_without_inference(monkeypatch):
+    from src.services.assets import Asset
+    from src.services.pipeline import build_asset, recompose_output
+    buf = io.BytesIO()
+    Image.new("RGB", (240, 240), color="green").save(buf, format="PNG")
+    png = buf.getvalue()
+    monkeypatch.setattr(downloader, "transport", httpx.MockTransport(lambda request: httpx.Response(200, content=png, headers={"content-type": "image/png"})))
+    response = client.post("/api/v1/process-url/", json={"image_url": "http://images.test/asset.png", "processing_type": "crop"})
+    asset_id = response.json()["asset_id"]
+    assert response.status_code == 200 and asset_id
+    recomposed = client.get(f"/api/v1/assets/{asset_id}/recompose", params={"shape": "square", "size": 128})
+    assert recomposed.status_code == 200 and Image.open(io.BytesIO(recomposed.content)).size == (128, 128)
+    assert client.get("/api/v1/assets/inexistente/recompose").status_code == 404
+
+    # Máscara guardada como alfa do recorte: o fundo removido recebe a cor pedida
+    frame = ImageFrame.from_bytes(png)
+    cutout = frame.rgba_image.copy()
+    cutout.putalpha(0)
+    cutout.paste((0, 128, 0, 255), (60, 60, 180, 180))
+    asset = Asset.unpack(build_asset(png, frame, cutout, (90, 90, 60, 60), None, "u2netp").pack())
+    assert asset.face_coords == (90, 90, 60, 60) and asset.mask and asset.reduce == 1
+    result = Image.open(io.BytesIO(recompose_output(asset, "square", "png", radius_scale=3.0, background=(255, 0, 0))))
+    assert result.getpixel((5, 5))[:3] == (255, 0, 0) and result.getpixel((256, 256))[:3] == (0, 128, 0)
+
+def test_alpha_matting_and_post_process_refine_mask(monkeypatch):
+    import numpy as np
+    from benchmarks.bench_matting import alpha_error, synthetic_scene
+    from src.services.matting import clean_mask, refine_mask
+    image, truth, coarse = synthetic_scene(512)
+    frame = ImageFrame(image)
+    mask = Image.fromarray(coarse, "L")
+    assert refine_mask(frame, mask) is mask
+
+    # Pós-processamento: ponto solto removido, alfa suave do sujeito preservado
+    speck = coarse.copy()
+    speck[5:9, 5:9] = 200
+    cleaned = clean_mask(speck)
+    assert cleaned[5:9, 5:9].max() == 0 and np.array_equal(cleaned[100:], coarse[100:])
+
+    # Alpha matting recupera borda e fios perdidos na máscara de baixa resolução
+    refined = np.asarray(refine_mask(frame, mask, alpha_matting=True, post_process_mask=True))
+    assert alpha_error(refined, truth)["sad"] < alpha_error(coarse, truth)["sad"] / 2
+
+    # O endpoint repassa os parâmetros para o refinamento da máscara do modelo
+    monkeypatch.setattr("src.services.background.predict_masks", lambda frame, model_key: [mask])
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    response = client.post("/api/v1/remove-bg/u2netp", params={"alpha_matting": "true"}, files={"file": ("a.png", buf.getvalue(), "image/png")})
+    assert response.status_code == 200
+    assert np.array_equal(np.asarray(Image.open(io.BytesIO(response.content)).getchannel("A")), refined)